@@ -0,0 +1,145 @@
+"""
+Vectorised analytics over the daily rollups
+
+Everything starts from `load_daily_frame`. It reads one document per day
+from `daily_rollups` through a projection-only cursor and returns a dense,
+zero-filled daily DataFrame of int64 minor-unit columns. A year of data is
+therefore at most 366 rows, however many transactions it summarises. Period
+comparisons, rolling statistics and the cash-flow projection are NumPy/pandas
+column operations over that frame. Python only touches individual values when
+formatting the response.
+"""
+
+from datetime import date
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+ROLLUP_PROJECTION = {"_id": 1, "income_minor": 1, "expense_minor": 1, "count": 1}
+COLUMNS = ["income", "expenses", "count"]
+
+# Period codes for pandas' to_period; weeks start on Monday like the charts
+PERIOD_FREQUENCIES = {"week": "W-SUN", "month": "M", "quarter": "Q", "year": "Y"}
+
+
+async def load_daily_frame(collection, query: dict, start_day: Optional[date] = None, end_day: Optional[date] = None):
+    """Daily income/expenses/count in minor units, indexed by day with gaps filled with zeros"""
+    docs = await collection.find(query, ROLLUP_PROJECTION).sort("_id", 1).to_list(None)
+    days = np.array([doc["_id"].date() for doc in docs], dtype="datetime64[D]")
+    frame = pd.DataFrame(
+        {
+            "income": np.fromiter((doc.get("income_minor", 0) for doc in docs), dtype=np.int64, count=len(docs)),
+            "expenses": np.fromiter((doc.get("expense_minor", 0) for doc in docs), dtype=np.int64, count=len(docs)),
+            "count": np.fromiter((doc.get("count", 0) for doc in docs), dtype=np.int64, count=len(docs)),
+        },
+        index=pd.DatetimeIndex(days.astype("datetime64[ns]")),
+        columns=COLUMNS,
+    )
+
+    first = start_day or (days[0] if len(days) else None)
+    last = end_day or (days[-1] if len(days) else None)
+    if first is None or last is None:
+        return frame
+    return frame.reindex(pd.date_range(first, last, freq="D"), fill_value=0)
+
+
+def format_money(minor_units) -> list:
+    """Minor-unit values (possibly fractional averages) as two-decimal strings"""
+    return np.char.mod("%.2f", np.asarray(minor_units, dtype=np.float64) / 100).tolist()
+
+
+def format_ratio(values) -> list:
+    values = np.round(np.asarray(values, dtype=np.float64), 2)
+    return [None if np.isnan(value) else float(value) for value in values]
+
+
+def format_labels(index) -> list:
+    return np.datetime_as_string(index.values, unit="D").tolist()
+
+
+def percent_change(values: np.ndarray) -> np.ndarray:
+    """Change against the previous element in percent; NaN for the first element or a zero base"""
+    values = values.astype(np.float64)
+    if values.size == 0:
+        # Empty ledgers have no periods at all
+        return values
+    previous = np.concatenate(([np.nan], values[:-1]))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        change = (values - previous) / np.abs(previous) * 100
+    change[previous == 0] = np.nan
+    return change
+
+
+def period_comparison(frame: pd.DataFrame, period: str) -> dict:
+    """Totals per calendar period with the change from the period before"""
+    periods = frame.index.to_period(PERIOD_FREQUENCIES[period])
+    grouped = frame.groupby(periods)
+    totals = grouped.sum()
+    income = totals["income"].to_numpy()
+    expenses = totals["expenses"].to_numpy()
+    net = income - expenses
+
+    return {
+        "period": period,
+        "labels": format_labels(totals.index.start_time),
+        # Edge periods can be partial; days says how much of each was covered
+        "days": grouped.size().to_numpy().tolist(),
+        "income": format_money(income),
+        "expenses": format_money(expenses),
+        "net": format_money(net),
+        "count": totals["count"].to_numpy().tolist(),
+        "income_change_pct": format_ratio(percent_change(income)),
+        "expenses_change_pct": format_ratio(percent_change(expenses)),
+        "net_change_pct": format_ratio(percent_change(net)),
+    }
+
+
+def rolling_statistics(frame: pd.DataFrame, window: int, start_day: Optional[date] = None) -> dict:
+    """Trailing `window`-day averages and sums; the frame should start window - 1 days before start_day"""
+    values = frame[["income", "expenses"]].assign(net=frame["income"] - frame["expenses"])
+    rolling = values.rolling(window, min_periods=1)
+    averages, sums = rolling.mean(), rolling.sum()
+    if start_day is not None:
+        visible = values.index >= pd.Timestamp(start_day)
+        values, averages, sums = values[visible], averages[visible], sums[visible]
+
+    result = {"window": window, "labels": format_labels(values.index)}
+    for column in ("income", "expenses", "net"):
+        result[column] = format_money(values[column].to_numpy())
+        result[f"{column}_average"] = format_money(averages[column].to_numpy())
+        result[f"{column}_sum"] = format_money(sums[column].to_numpy())
+    return result
+
+
+def cash_flow_projection(frame: pd.DataFrame, opening_balance_minor: int, days: int) -> dict:
+    """Extend the linear trend of daily income and expenses `days` past the end of the frame"""
+    history = frame[["income", "expenses"]].to_numpy(dtype=np.float64)
+    closing_balance = opening_balance_minor + int(history[:, 0].sum() - history[:, 1].sum())
+    if len(history) >= 2:
+        # One least-squares fit for both columns: row 0 is the slope, row 1 the intercept
+        slope, intercept = np.polyfit(np.arange(len(history)), history, 1)
+    elif len(history) == 1:
+        slope, intercept = np.zeros(2), history[0]
+    else:
+        slope, intercept = np.zeros(2), np.zeros(2)
+
+    future = np.arange(len(history), len(history) + days, dtype=np.float64)[:, None]
+    # Income and expenses cannot go negative, however steep the trend
+    projected = np.clip(intercept + slope * future, 0, None)
+    net = projected[:, 0] - projected[:, 1]
+    last_day = frame.index[-1] if len(frame.index) else pd.Timestamp(date.today())
+
+    return {
+        "history_days": len(history),
+        "labels": format_labels(pd.date_range(last_day + pd.Timedelta(days=1), periods=days, freq="D")),
+        "opening_balance": format_money([closing_balance])[0],
+        "income": format_money(projected[:, 0]),
+        "expenses": format_money(projected[:, 1]),
+        "net": format_money(net),
+        "balance": format_money(closing_balance + np.cumsum(net)),
+        "trend": {
+            "income_per_day": format_money([slope[0]])[0],
+            "expenses_per_day": format_money([slope[1]])[0],
+        },
+    }
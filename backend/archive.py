@@ -0,0 +1,313 @@
+"""
+Parquet archive of cold transactions
+
+Closed years can be moved out of a ledger's transactions collection into
+zstd-compressed Parquet files on local disk, one file per month:
+
+    <root>/<ledger>/year=2019/month=03/part-0.parquet
+
+The directories are hive-style, so DuckDB, Spark or pyarrow.dataset can
+read the tree as it is. Each file is sorted newest first, like the API, and
+is read memory-mapped. A read only opens the months that overlap the
+query's date range, and pushes the rest of the filter down to the row-group
+statistics. PartitionWriter builds a file from the month's rows in that
+order, one row group at a time, so a month is never held in memory whole.
+
+Filters are the MongoDB query documents the app already builds for the
+collection. `filter_expression` translates the subset it uses (equality,
+ranges, $in, $and, $or, $text) into a pyarrow expression. $text is matched
+as case-insensitive whole words, without MongoDB's stemming.
+"""
+
+import os
+import re
+from datetime import date, datetime, timedelta, timezone
+from functools import reduce
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("type", pa.string()),
+    ("amount_minor", pa.int64()),
+    ("description", pa.string()),
+    ("category", pa.string()),
+    ("date", pa.date32()),
+    ("created_at", pa.timestamp("ms", tz="UTC")),
+])
+SORT_KEYS = [("date", "descending"), ("created_at", "descending"), ("id", "descending")]
+ROW_GROUP_SIZE = 50000
+PARTITION_FILE = "part-0.parquet"
+
+COMPARISONS = {
+    "$gt": lambda field, value: field > value,
+    "$gte": lambda field, value: field >= value,
+    "$lt": lambda field, value: field < value,
+    "$lte": lambda field, value: field <= value,
+    "$ne": lambda field, value: field != value,
+}
+
+
+def arrow_scalar(name: str, value):
+    # Enums go in by value; BSON dates compare against the date32 column as days
+    value = getattr(value, "value", value)
+    field_type = SCHEMA.field(name).type
+    if isinstance(value, datetime) and field_type == pa.date32():
+        value = value.date()
+    return pa.scalar(value, field_type)
+
+
+def all_of(expressions):
+    expressions = [expression for expression in expressions if expression is not None]
+    return reduce(lambda left, right: left & right, expressions) if expressions else None
+
+
+def any_of(expressions):
+    return reduce(lambda left, right: left | right, expressions) if expressions else pc.scalar(False)
+
+
+def text_expression(search: str):
+    words = re.findall(r"\w+", search)
+    return any_of([
+        pc.match_substring_regex(pc.field(name), pattern=rf"\b{re.escape(word)}\b", ignore_case=True)
+        for word in words
+        for name in ("description", "category")
+    ])
+
+
+def filter_expression(query: dict):
+    """The pyarrow equivalent of a MongoDB filter, or None for an empty one"""
+    terms = []
+    for key, value in query.items():
+        if key == "$and":
+            terms.append(all_of(filter_expression(condition) for condition in value))
+        elif key == "$or":
+            # An empty branch matches everything
+            branches = [filter_expression(condition) for condition in value]
+            terms.append(any_of([pc.scalar(True) if branch is None else branch for branch in branches]))
+        elif key == "$text":
+            terms.append(text_expression(value["$search"]))
+        elif key.startswith("$"):
+            raise ValueError(f"Archive queries do not support {key}")
+        elif isinstance(value, dict):
+            for operator, operand in value.items():
+                if operator == "$in":
+                    values = pa.array([arrow_scalar(key, item).as_py() for item in operand], SCHEMA.field(key).type)
+                    terms.append(pc.field(key).isin(values))
+                elif operator in COMPARISONS:
+                    terms.append(COMPARISONS[operator](pc.field(key), arrow_scalar(key, operand)))
+                else:
+                    raise ValueError(f"Archive queries do not support {operator}")
+        elif value is None:
+            terms.append(pc.field(key).is_null())
+        else:
+            terms.append(pc.field(key) == arrow_scalar(key, value))
+    return all_of(terms)
+
+
+def date_bounds(query: dict) -> Tuple[Optional[date], Optional[date]]:
+    """Inclusive date range a query is limited to, from its `date` conditions and any $and"""
+    lower, upper = None, None
+    conditions = [query]
+    while conditions:
+        condition = conditions.pop()
+        conditions.extend(condition.get("$and", []))
+        value = condition.get("date")
+        if isinstance(value, datetime):
+            value = {"$gte": value, "$lte": value}
+        if not isinstance(value, dict):
+            continue
+        for operator, operand in value.items():
+            if not isinstance(operand, datetime):
+                continue
+            if operator in ("$gt", "$gte"):
+                lower = max(lower, operand.date()) if lower else operand.date()
+            elif operator in ("$lt", "$lte"):
+                upper = min(upper, operand.date()) if upper else operand.date()
+    return lower, upper
+
+
+def month_end(month: date) -> date:
+    following = date(month.year + 1, 1, 1) if month.month == 12 else date(month.year, month.month + 1, 1)
+    return following - timedelta(days=1)
+
+
+def sort_key(row: dict):
+    return row["date"], row["created_at"], row["id"]
+
+
+def iter_rows(path: Path) -> Iterator[dict]:
+    for batch in pq.ParquetFile(path, memory_map=True).iter_batches(batch_size=ROW_GROUP_SIZE):
+        yield from batch.to_pylist()
+
+
+def to_documents(table, ledger: str) -> List[dict]:
+    """Rows shaped like the collection's documents: BSON-style UTC datetimes for `date`"""
+    rows = table.to_pylist()
+    for row in rows:
+        day = row["date"]
+        row["date"] = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+        row["created_at"] = row["created_at"].astimezone(timezone.utc)
+        row["ledger"] = ledger
+    return rows
+
+
+class TransactionArchive:
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def partition_path(self, ledger: str, month: date) -> Path:
+        return self.root / ledger / f"year={month.year}" / f"month={month.month:02d}" / PARTITION_FILE
+
+    def months(self, ledger: str) -> List[date]:
+        """Archived months, newest first"""
+        ledger_dir = self.root / ledger
+        if not ledger_dir.is_dir():
+            return []
+        months = []
+        for year_dir in ledger_dir.glob("year=*"):
+            for month_dir in year_dir.glob("month=*"):
+                if (month_dir / PARTITION_FILE).is_file():
+                    months.append(date(int(year_dir.name[5:]), int(month_dir.name[6:]), 1))
+        return sorted(months, reverse=True)
+
+    def partitions(self, ledger: str, query: Optional[dict] = None) -> List[Path]:
+        """Files of the months overlapping the query's date range, newest first"""
+        lower, upper = date_bounds(query or {})
+        return [
+            self.partition_path(ledger, month)
+            for month in self.months(ledger)
+            if (upper is None or month <= upper) and (lower is None or month_end(month) >= lower)
+        ]
+
+    def read_partition(self, path: Path, query: Optional[dict] = None, columns=None):
+        return pq.read_table(path, columns=columns, filters=filter_expression(query or {}), memory_map=True)
+
+    def find(self, ledger: str, query: dict, limit: int) -> List[dict]:
+        """Up to `limit` matching documents, newest first"""
+        rows = []
+        for path in self.partitions(ledger, query):
+            table = self.read_partition(path, query)
+            rows.extend(to_documents(table.slice(0, limit - len(rows)), ledger))
+            if len(rows) >= limit:
+                break
+        return rows
+
+    def iter_documents(self, ledger: str, query: dict, rows_per_batch: int) -> Iterator[List[dict]]:
+        for path in self.partitions(ledger, query):
+            for batch in self.read_partition(path, query).to_batches(max_chunksize=rows_per_batch):
+                yield to_documents(batch, ledger)
+
+    def totals(self, ledger: str, query: dict) -> Tuple[int, int, int]:
+        """(income, expenses, count) in minor units over the matching rows"""
+        income = expenses = count = 0
+        for path in self.partitions(ledger, query):
+            table = self.read_partition(path, query, columns=["type", "amount_minor"])
+            for row in table.group_by("type").aggregate([("amount_minor", "sum"), ("amount_minor", "count")]).to_pylist():
+                if row["type"] == "income":
+                    income += row["amount_minor_sum"]
+                else:
+                    expenses += row["amount_minor_sum"]
+                count += row["amount_minor_count"]
+        return income, expenses, count
+
+    def daily_totals(self, ledger: str, query: Optional[dict] = None) -> List[dict]:
+        """Daily rollup documents for the matching rows, oldest day first"""
+        days = {}
+        for path in self.partitions(ledger, query):
+            table = self.read_partition(path, query, columns=["date", "type", "amount_minor"])
+            grouped = table.group_by(["date", "type"]).aggregate([("amount_minor", "sum"), ("amount_minor", "count")])
+            for row in grouped.to_pylist():
+                day = days.setdefault(row["date"], {"income_minor": 0, "expense_minor": 0, "count": 0})
+                day["income_minor" if row["type"] == "income" else "expense_minor"] += row["amount_minor_sum"]
+                day["count"] += row["amount_minor_count"]
+        return [
+            {"_id": datetime(day.year, day.month, day.day, tzinfo=timezone.utc), **totals}
+            for day, totals in sorted(days.items())
+        ]
+
+    def category_totals(self, ledger: str, query: dict, uncategorized: str) -> List[dict]:
+        """Totals per (type, category); missing and empty categories count as `uncategorized`"""
+        totals = {}
+        for path in self.partitions(ledger, query):
+            table = self.read_partition(path, query, columns=["type", "category", "amount_minor"])
+            category = table["category"]
+            missing = pc.or_kleene(pc.is_null(category), pc.equal(category, ""))
+            table = table.set_column(1, "category", pc.if_else(missing, uncategorized, category))
+            grouped = table.group_by(["type", "category"]).aggregate([("amount_minor", "sum"), ("amount_minor", "count")])
+            for row in grouped.to_pylist():
+                total = totals.setdefault((row["type"], row["category"]), [0, 0])
+                total[0] += row["amount_minor_sum"]
+                total[1] += row["amount_minor_count"]
+        return [
+            {"type": tx_type, "category": category, "total_minor": total, "count": count}
+            for (tx_type, category), (total, count) in totals.items()
+        ]
+
+    def open_month(self, ledger: str, month: date) -> "PartitionWriter":
+        return PartitionWriter(self.partition_path(ledger, month))
+
+
+class PartitionWriter:
+    """Writes one month's partition from batches of documents in SORT_KEYS order
+
+    The file is staged next to the partition and replaces it on close. Rows of
+    an existing partition, left by an interrupted run, are merged in order, so
+    re-archiving a month neither duplicates nor drops rows.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.staging = path.with_name(PARTITION_FILE + ".tmp")
+        self.existing_ids = set()
+        self.existing = iter(())
+        if path.exists():
+            self.existing_ids = set(pq.read_table(path, columns=["id"], memory_map=True)["id"].to_pylist())
+            self.existing = iter_rows(path)
+        self.next_existing = next(self.existing, None)
+        self.rows: List[dict] = []
+        self.written = 0
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.writer = pq.ParquetWriter(self.staging, SCHEMA, compression="zstd")
+
+    def write(self, documents: List[dict]):
+        for document in documents:
+            record = {**document, "date": document["date"].date()}
+            if record["id"] in self.existing_ids:
+                continue
+            while self.next_existing is not None and sort_key(self.next_existing) > sort_key(record):
+                self.append(self.next_existing)
+                self.next_existing = next(self.existing, None)
+            self.append(record)
+
+    def append(self, row: dict):
+        self.rows.append(row)
+        if len(self.rows) >= ROW_GROUP_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.writer.write_table(pa.Table.from_pylist(self.rows, schema=SCHEMA))
+            self.written += len(self.rows)
+            self.rows = []
+
+    def close(self) -> int:
+        """Finish the partition; returns its row count"""
+        while self.next_existing is not None:
+            self.append(self.next_existing)
+            self.next_existing = next(self.existing, None)
+        self.flush()
+        self.writer.close()
+        # Callers delete the hot copies next, so check the file really holds them
+        if pq.ParquetFile(self.staging).metadata.num_rows != self.written:
+            raise RuntimeError(f"Archive partition {self.path} is missing transactions after writing")
+        os.replace(self.staging, self.path)
+        return self.written
+
+    def abort(self):
+        self.writer.close()
+        self.staging.unlink(missing_ok=True)
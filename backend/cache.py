@@ -0,0 +1,120 @@
+"""
+Response cache for the read endpoints
+
+Entries are keyed on a scope (the ledger), the endpoint, the normalised date
+range and any extra parameters, plus the version of the data that range
+covers (see `versioned_key`). Writes invalidate by bumping versions instead of
+searching for affected keys: a lookup after a write in the range misses, and
+superseded entries expire with the TTL or LRU. Storage is pluggable: MemoryCacheBackend is a
+per-process LRU with a TTL, RedisCacheBackend shares entries between
+workers when the optional `redis` package is installed.
+"""
+
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any, Optional, Tuple
+
+KEY_SEPARATOR = "|"
+OPEN_BOUND = "*"
+
+
+@dataclass
+class CacheEntry:
+    body: Any
+    etag: str
+
+
+class CacheBackend:
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        raise NotImplementedError
+
+    async def set(self, key: str, entry: CacheEntry, ttl: float) -> None:
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    async def get(self, key):
+        item = self.entries.get(key)
+        if item is None:
+            return None
+        entry, expires_at = item
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    async def set(self, key, entry, ttl):
+        self.entries[key] = (entry, time.monotonic() + ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+class RedisCacheBackend(CacheBackend):
+    def __init__(self, url: str, namespace: str = "balance-sheet:cache:"):
+        import redis.asyncio as redis
+
+        self.redis = redis.from_url(url)
+        self.namespace = namespace
+
+    async def get(self, key):
+        raw = await self.redis.get(self.namespace + key)
+        if raw is None:
+            return None
+        payload = json.loads(raw)
+        return CacheEntry(body=payload["body"], etag=payload["etag"])
+
+    async def set(self, key, entry, ttl):
+        payload = json.dumps({"body": entry.body, "etag": entry.etag})
+        await self.redis.set(self.namespace + key, payload, px=int(ttl * 1000))
+
+
+def normalize_date(value) -> str:
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if value is None or not value.strip():
+        return OPEN_BOUND
+    try:
+        return date.fromisoformat(value.strip()).isoformat()
+    except ValueError:
+        return value.strip()
+
+
+class ResponseCache:
+    def __init__(self, backend: CacheBackend, ttl: float = 300):
+        self.backend = backend
+        self.ttl = ttl
+
+    def key(self, scope: str, endpoint: str, start_date: Optional[str] = None, end_date: Optional[str] = None, *extra) -> str:
+        parts = [scope, endpoint, normalize_date(start_date), normalize_date(end_date)]
+        parts.extend(OPEN_BOUND if value is None else str(value) for value in extra)
+        return KEY_SEPARATOR.join(parts)
+
+    @staticmethod
+    def date_range(key: str) -> Tuple[Optional[str], Optional[str]]:
+        """The normalised (start, end) dates a key covers; None for an open bound"""
+        _, _, start, end = key.split(KEY_SEPARATOR)[:4]
+        return (None if start == OPEN_BOUND else start), (None if end == OPEN_BOUND else end)
+
+    @staticmethod
+    def versioned_key(key: str, version: int) -> str:
+        """`key` for the body computed at `version` of the data its range covers"""
+        return f"{key}{KEY_SEPARATOR}v{version}"
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        return await self.backend.get(key)
+
+    async def set(self, key: str, body: Any, etag: str) -> CacheEntry:
+        entry = CacheEntry(body=body, etag=etag)
+        await self.backend.set(key, entry, self.ttl)
+        return entry
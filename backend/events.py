@@ -0,0 +1,172 @@
+"""
+Live transaction events for dashboards
+
+EventBroker fans change batches out to subscribed clients, one bounded queue
+each, grouped by ledger. Changes to a ledger that arrive within a short
+window are coalesced and rendered once per batch (by the `render` callable
+the app supplies). A client that falls behind gets a single resync message
+instead of a backlog.
+
+When MongoDB runs as a replica set, ChangeStreamRelay feeds the broker from a
+database-wide change stream filtered to the ledgers' transactions
+collections, so every worker sees writes made by any worker. On a standalone
+server the stream cannot be opened, and the write handlers publish to the
+in-process broker directly.
+"""
+
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+RESYNC_MESSAGE = {"resync": True, "inserted": [], "deleted": [], "days": []}
+
+
+class PendingBatch:
+    def __init__(self):
+        self.inserted: List[dict] = []
+        self.deleted: List[dict] = []
+        self.resync = False
+        self.flush_task: Optional[asyncio.Task] = None
+
+
+class EventBroker:
+    def __init__(
+        self,
+        # Builds the client message from a ledger's inserted and deleted documents of one batch
+        render: Callable[[str, List[dict], List[dict], bool], Awaitable[dict]],
+        coalesce_seconds: float = 0.25,
+        queue_size: int = 100,
+    ):
+        self.render = render
+        self.coalesce_seconds = coalesce_seconds
+        self.queue_size = queue_size
+        self.subscribers: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+        # Set while a change stream relay is feeding the broker
+        self.relay_active = False
+        self.pending: Dict[str, PendingBatch] = defaultdict(PendingBatch)
+
+    def subscriber_count(self) -> int:
+        return sum(len(queues) for queues in self.subscribers.values())
+
+    def subscribe(self, ledger: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers[ledger].add(queue)
+        return queue
+
+    def unsubscribe(self, ledger: str, queue: asyncio.Queue):
+        self.subscribers[ledger].discard(queue)
+        if not self.subscribers[ledger]:
+            del self.subscribers[ledger]
+
+    def publish_local(self, ledger: str, inserted: Iterable[dict] = (), deleted: Iterable[dict] = (), resync: bool = False):
+        """Publish from a write handler, unless the change stream relay already reports the write"""
+        if not self.relay_active:
+            self.publish(ledger, inserted, deleted, resync)
+
+    def publish(self, ledger: str, inserted: Iterable[dict] = (), deleted: Iterable[dict] = (), resync: bool = False):
+        if not self.subscribers.get(ledger):
+            return
+        batch = self.pending[ledger]
+        batch.inserted.extend(inserted)
+        batch.deleted.extend(deleted)
+        batch.resync = batch.resync or resync
+        if batch.flush_task is None or batch.flush_task.done():
+            batch.flush_task = asyncio.create_task(self.flush_later(ledger))
+
+    async def flush_later(self, ledger: str):
+        await asyncio.sleep(self.coalesce_seconds)
+        batch = self.pending.pop(ledger)
+        if not (batch.inserted or batch.deleted or batch.resync):
+            return
+        try:
+            message = await self.render(ledger, batch.inserted, batch.deleted, batch.resync)
+        except PyMongoError as e:
+            logger.warning("Could not render live update, asking clients to resync: %s", e)
+            message = RESYNC_MESSAGE
+        self.broadcast(ledger, message)
+
+    def broadcast(self, ledger: str, message: dict):
+        for queue in list(self.subscribers.get(ledger, ())):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Replace the backlog with one resync so the client refetches once
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RESYNC_MESSAGE)
+
+
+class ChangeStreamRelay:
+    def __init__(
+        self,
+        database,
+        broker: EventBroker,
+        # Maps a collection name to its ledger, or None for collections that aren't watched
+        ledger_for_collection: Callable[[str], Optional[str]],
+        collection_pattern: str = "^transactions",
+    ):
+        self.database = database
+        self.broker = broker
+        self.ledger_for_collection = ledger_for_collection
+        self.collection_pattern = collection_pattern
+        self.task: Optional[asyncio.Task] = None
+
+    async def start(self) -> bool:
+        """Open the change stream; returns False when the deployment does not support one"""
+        stream = self.database.watch(
+            [{"$match": {"ns.coll": {"$regex": self.collection_pattern}}}],
+            full_document_before_change="whenAvailable",
+        )
+        try:
+            # Change streams open lazily, so force the aggregate now
+            first = await stream.try_next()
+        except OperationFailure as e:
+            logger.info("Change streams unavailable (%s); publishing live updates in-process", e)
+            await stream.close()
+            return False
+        self.broker.relay_active = True
+        self.task = asyncio.create_task(self.relay(stream, first))
+        return True
+
+    async def relay(self, stream, first):
+        try:
+            if first is not None:
+                self.handle(first)
+            async for change in stream:
+                self.handle(change)
+        except PyMongoError as e:
+            logger.warning("Change stream relay stopped (%s); publishing live updates in-process", e)
+        finally:
+            self.broker.relay_active = False
+            await stream.close()
+
+    def handle(self, change: dict):
+        ledger = self.ledger_for_collection(change.get("ns", {}).get("coll", ""))
+        if ledger is None:
+            return
+        operation = change["operationType"]
+        if operation == "insert":
+            self.broker.publish(ledger, inserted=[change["fullDocument"]])
+        elif operation == "delete" and change.get("fullDocumentBeforeChange"):
+            before = change["fullDocumentBeforeChange"]
+            if before.get("archived"):
+                # Moved to the Parquet archive rather than gone, so clients refetch
+                self.broker.publish(ledger, resync=True)
+            else:
+                self.broker.publish(ledger, deleted=[before])
+        else:
+            # Updates, drops, and deletes without a pre-image cannot be patched in place
+            self.broker.publish(ledger, resync=True)
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
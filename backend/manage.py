@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Maintenance commands for the Balance Sheet backend
+
+Usage (from the backend directory):
+    python manage.py rebuild-rollups
+    python manage.py check-rollups
+    python manage.py migrate-amounts
+    python manage.py migrate-dates
+    python manage.py migrate-snapshots
+    python manage.py close-periods 2024-12
+    python manage.py archive-year 2019
+
+Every command works on the default ledger unless given --ledger NAME.
+"""
+
+import asyncio
+import json
+from datetime import date
+
+import typer
+
+import server
+
+cli = typer.Typer(help="Balance Sheet maintenance commands")
+
+LedgerOption = typer.Option(server.DEFAULT_LEDGER, "--ledger", help="Ledger to operate on")
+
+
+def run(coro):
+    """Run a coroutine against a fresh server Mongo client, closing it afterwards"""
+    async def runner():
+        server.connect()
+        try:
+            return await coro
+        finally:
+            server.client.close()
+    return asyncio.run(runner())
+
+
+@cli.command("rebuild-rollups")
+def rebuild_rollups(ledger: str = LedgerOption):
+    """Recompute daily_rollups from the raw transactions collection"""
+    days = run(server.rebuild_daily_rollups(ledger))
+    typer.echo(f"Rebuilt daily rollups for {days} days in ledger {ledger}")
+
+
+@cli.command("check-rollups")
+def check_rollups(ledger: str = LedgerOption):
+    """Compare daily_rollups against the raw transactions collection"""
+    mismatches = run(server.check_daily_rollups(ledger))
+    if not mismatches:
+        typer.echo("Daily rollups are consistent with transactions")
+        return
+    for mismatch in mismatches:
+        typer.echo(json.dumps(mismatch))
+    typer.echo(f"{len(mismatches)} day(s) out of sync; run rebuild-rollups to repair", err=True)
+    raise typer.Exit(code=1)
+
+
+@cli.command("migrate-amounts")
+def migrate_amounts(ledger: str = LedgerOption):
+    """Convert legacy float amounts to integer minor units and rebuild rollups"""
+    migrated = run(server.migrate_amounts_to_minor_units(ledger))
+    typer.echo(f"Converted {migrated} transaction(s) to minor units")
+
+
+@cli.command("migrate-dates")
+def migrate_dates(ledger: str = LedgerOption):
+    """Convert legacy ISO-string dates to BSON dates and rebuild rollups"""
+    migrated = run(server.migrate_dates_to_bson(ledger))
+    typer.echo(f"Converted dates on {migrated} transaction(s)")
+
+
+@cli.command("migrate-snapshots")
+def migrate_snapshots(ledger: str = LedgerOption):
+    """Add running totals to period snapshots closed before they were stored"""
+    migrated = run(server.migrate_snapshot_totals(ledger))
+    typer.echo(f"Added running totals to {migrated} period snapshot(s)")
+
+
+@cli.command("close-periods")
+def close_periods(through: str = typer.Argument(..., help="Last month to close, as YYYY-MM"), ledger: str = LedgerOption):
+    """Freeze every open month up to THROUGH into period snapshots"""
+    snapshots = run(server.close_periods(ledger, date.fromisoformat(f"{through}-01")))
+    for snapshot in snapshots:
+        typer.echo(f"Closed {snapshot['period']}: {snapshot['count']} transaction(s)")
+    typer.echo(f"Closed {len(snapshots)} period(s) in ledger {ledger}")
+
+
+@cli.command("archive-year")
+def archive_year(year: int = typer.Argument(..., help="Closed year to move to the Parquet archive"), ledger: str = LedgerOption):
+    """Move a closed year's transactions out of MongoDB into the Parquet archive"""
+    archived = run(server.archive_year(ledger, year))
+    typer.echo(f"Archived {archived} transaction(s) from {year} in ledger {ledger} to {server.ARCHIVE_DIR}")
+
+
+if __name__ == "__main__":
+    cli()
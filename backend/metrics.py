@@ -0,0 +1,305 @@
+"""
+Request metrics, span hooks and on-demand profiling
+
+MetricsMiddleware wraps every /api request in a RequestStats context.
+MongoCommandMetrics (a pymongo command listener) adds database time and
+returned document counts to it, and handlers mark serialisation or
+validation work with `span(...)`. Motor copies contextvars into its executor
+threads, so the listener sees the request that issued each command.
+MongoPoolMetrics (a connection pool listener) tracks open, checked-out and
+waiting connections per server, plus how long each checkout waited.
+Everything is exported in Prometheus format through `render_metrics`.
+
+With PROFILING_ENABLED set, a request carrying `?profile=1` runs under
+pyinstrument (or cProfile when pyinstrument is not installed). It returns a
+text report instead of its normal body. The report includes docs examined
+versus returned for each captured query, taken from executionStats explains.
+"""
+
+import cProfile
+import io
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+from urllib.parse import parse_qs
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from pymongo import monitoring
+from starlette.routing import Match
+
+REQUEST_SECONDS = Histogram(
+    "balance_sheet_request_seconds", "Request latency", ["method", "route", "status"]
+)
+RESPONSE_BYTES = Histogram(
+    "balance_sheet_response_bytes", "Response body size", ["route"],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, float("inf")),
+)
+DB_SECONDS = Histogram(
+    "balance_sheet_request_db_seconds", "Time spent in MongoDB commands per request", ["route"]
+)
+DB_COMMAND_SECONDS = Histogram(
+    "balance_sheet_db_command_seconds", "MongoDB command latency", ["command"]
+)
+DOCUMENTS_RETURNED = Counter(
+    "balance_sheet_documents_returned_total", "Documents returned by MongoDB cursors", ["route"]
+)
+SPAN_SECONDS = Histogram(
+    "balance_sheet_span_seconds", "Time spent in instrumented handler spans", ["route", "span"]
+)
+POOL_CHECKOUT_WAIT_SECONDS = Histogram(
+    "balance_sheet_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection", ["address"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, float("inf")),
+)
+POOL_CHECKOUT_FAILURES = Counter(
+    "balance_sheet_pool_checkout_failures_total", "Failed connection checkouts", ["address", "reason"]
+)
+POOL_CONNECTIONS = Gauge(
+    "balance_sheet_pool_connections", "Pooled connections by state", ["address", "state"]
+)
+COALESCED_INSERT_BATCH = Histogram(
+    "balance_sheet_coalesced_insert_batch_size", "Transactions written per coalesced insert_many",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, float("inf")),
+)
+
+# Commands whose plans are worth explaining in a profile report
+EXPLAINABLE_COMMANDS = ("find", "aggregate", "count", "distinct")
+
+
+@dataclass
+class RequestStats:
+    capture_commands: bool = False
+    db_seconds: float = 0.0
+    documents_returned: int = 0
+    spans: Dict[str, float] = field(default_factory=dict)
+    commands: List[dict] = field(default_factory=list)
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+@contextmanager
+def span(name: str):
+    """Time a block of handler work and attribute it to the current request"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats = current_request.get()
+        if stats is not None:
+            stats.spans[name] = stats.spans.get(name, 0.0) + time.perf_counter() - started
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    def started(self, event):
+        stats = current_request.get()
+        if stats is not None and stats.capture_commands and event.command_name in EXPLAINABLE_COMMANDS:
+            command = {key: value for key, value in event.command.items() if key not in ("lsid", "$db", "$clusterTime")}
+            stats.commands.append(command)
+
+    def succeeded(self, event):
+        seconds = event.duration_micros / 1e6
+        DB_COMMAND_SECONDS.labels(event.command_name).observe(seconds)
+        stats = current_request.get()
+        if stats is None:
+            return
+        stats.db_seconds += seconds
+        cursor = event.reply.get("cursor") if isinstance(event.reply, dict) else None
+        if cursor:
+            stats.documents_returned += len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+
+    def failed(self, event):
+        stats = current_request.get()
+        if stats is not None:
+            stats.db_seconds += event.duration_micros / 1e6
+
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """Per-server pool occupancy; checkout waits are timed per thread since pymongo checks out synchronously"""
+
+    def __init__(self):
+        self.pools: Dict[str, Dict[str, int]] = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def adjust(self, address, **changes):
+        label = "%s:%s" % address
+        with self.lock:
+            pool = self.pools.setdefault(label, {"open": 0, "in_use": 0, "waiting": 0})
+            for state, change in changes.items():
+                pool[state] += change
+                POOL_CONNECTIONS.labels(label, state).set(pool[state])
+        return label
+
+    def snapshot(self, max_pool_size: int) -> Dict[str, dict]:
+        with self.lock:
+            return {
+                label: {**pool, "saturation": round(pool["in_use"] / max_pool_size, 3) if max_pool_size else 0.0}
+                for label, pool in self.pools.items()
+            }
+
+    def pool_created(self, event):
+        self.adjust(event.address)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        with self.lock:
+            self.pools.pop("%s:%s" % event.address, None)
+
+    def connection_created(self, event):
+        self.adjust(event.address, open=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self.adjust(event.address, open=-1)
+
+    def connection_check_out_started(self, event):
+        self.local.started = time.perf_counter()
+        self.adjust(event.address, waiting=1)
+
+    def connection_checked_out(self, event):
+        label = self.adjust(event.address, waiting=-1, in_use=1)
+        POOL_CHECKOUT_WAIT_SECONDS.labels(label).observe(time.perf_counter() - getattr(self.local, "started", time.perf_counter()))
+
+    def connection_check_out_failed(self, event):
+        label = self.adjust(event.address, waiting=-1)
+        POOL_CHECKOUT_FAILURES.labels(label, str(event.reason)).inc()
+
+    def connection_checked_in(self, event):
+        self.adjust(event.address, in_use=-1)
+
+
+def render_metrics():
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware so streamed responses are measured to the last byte"""
+
+    def __init__(
+        self,
+        app,
+        prefix: str = "/api",
+        profiling_enabled: bool = False,
+        # Returns the executionStats section of an explain for a captured command
+        explain: Optional[Callable[[dict], Awaitable[dict]]] = None,
+    ):
+        self.app = app
+        self.prefix = prefix
+        self.profiling_enabled = profiling_enabled
+        self.explain = explain
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefix):
+            await self.app(scope, receive, send)
+            return
+
+        profiling = self.profiling_enabled and (
+            parse_qs(scope.get("query_string", b"").decode("latin-1")).get("profile", [None])[-1] == "1"
+        )
+        stats = RequestStats(capture_commands=profiling)
+        token = current_request.set(stats)
+        status = 500
+        body_bytes = 0
+        started = time.perf_counter()
+
+        async def measured_send(message):
+            nonlocal status, body_bytes
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                body_bytes += len(message.get("body", b""))
+            if not profiling:
+                await send(message)
+
+        try:
+            if profiling:
+                report = await self.profile(scope, receive, measured_send)
+            else:
+                await self.app(scope, receive, measured_send)
+        finally:
+            current_request.reset(token)
+            elapsed = time.perf_counter() - started
+            route = self.route_template(scope)
+            REQUEST_SECONDS.labels(scope["method"], route, str(status)).observe(elapsed)
+            RESPONSE_BYTES.labels(route).observe(body_bytes)
+            DB_SECONDS.labels(route).observe(stats.db_seconds)
+            DOCUMENTS_RETURNED.labels(route).inc(stats.documents_returned)
+            for name, seconds in stats.spans.items():
+                SPAN_SECONDS.labels(route, name).observe(seconds)
+
+        if profiling:
+            header = await self.describe(stats, status, body_bytes, elapsed)
+            body = (header + report).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"text/plain; charset=utf-8"), (b"content-length", str(len(body)).encode())],
+            })
+            await send({"type": "http.response.body", "body": body})
+
+    def route_template(self, scope):
+        # Label by route template, not raw path, to keep label cardinality bounded
+        for route in scope["app"].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return "unmatched"
+
+    async def profile(self, scope, receive, send):
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            Profiler = None
+
+        if Profiler is not None:
+            profiler = Profiler(async_mode="enabled")
+            profiler.start()
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                profiler.stop()
+            return profiler.output_text(unicode=True, color=False)
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.disable()
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(40)
+        return output.getvalue()
+
+    async def describe(self, stats, status, body_bytes, elapsed):
+        lines = [
+            f"status: {status}",
+            f"total: {elapsed * 1000:.2f} ms",
+            f"db: {stats.db_seconds * 1000:.2f} ms",
+            f"response bytes: {body_bytes}",
+            f"documents returned: {stats.documents_returned}",
+        ]
+        lines.extend(f"span {name}: {seconds * 1000:.2f} ms" for name, seconds in stats.spans.items())
+        for command in stats.commands:
+            name = next(iter(command))
+            if self.explain is None:
+                continue
+            try:
+                execution = await self.explain(command)
+                lines.append(
+                    f"{name} {command[name]}: examined {execution.get('totalDocsExamined', '?')} docs, "
+                    f"{execution.get('totalKeysExamined', '?')} keys, returned {execution.get('nReturned', '?')}"
+                )
+            except Exception as e:
+                lines.append(f"{name} {command[name]}: explain failed ({e})")
+        return "\n".join(lines) + "\n\n"
@@ -0,0 +1,164 @@
+"""
+Prefix suggestions for categories and descriptions
+
+PrefixIndex is a character trie of case-folded terms with a use count. Each
+node caches the best few completions under it. A write only invalidates the
+caches along its own path, and a node is recomputed lazily from its
+children's caches on the next lookup, so suggestions stay cheap however many
+terms share a prefix.
+
+SearchIndex holds one trie per field. It is loaded from the transactions
+collection at startup, then kept current by the write handlers.
+Descriptions are capped to bound memory: the load keeps the most frequent
+ones, and writes only add new descriptions while the index is under the cap. Writes that can't
+name the terms they removed, such as batch deletes, schedule a reload.
+"""
+
+import asyncio
+import heapq
+import logging
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Longer terms are indexed by this many leading characters
+MAX_KEY_LENGTH = 64
+
+
+class TrieNode:
+    __slots__ = ("children", "term", "count", "best")
+
+    def __init__(self):
+        self.children: Dict[str, "TrieNode"] = {}
+        self.term: Optional[str] = None
+        self.count = 0
+        # Cached top completions as (count, term) pairs; None when stale
+        self.best: Optional[List[Tuple[int, str]]] = None
+
+
+class PrefixIndex:
+    def __init__(self, suggestions: int = 10):
+        self.suggestions = suggestions
+        self.root = TrieNode()
+        self.terms = 0
+
+    def __len__(self):
+        return self.terms
+
+    def path(self, key: str, create: bool = False) -> List[TrieNode]:
+        nodes = [self.root]
+        for char in key:
+            child = nodes[-1].children.get(char)
+            if child is None:
+                if not create:
+                    return []
+                child = nodes[-1].children[char] = TrieNode()
+            nodes.append(child)
+        return nodes
+
+    def add(self, term: str, count: int = 1, max_terms: Optional[int] = None):
+        """Count a use of `term`; with max_terms, a full index only counts terms it already holds"""
+        term = term.strip()
+        if not term:
+            return
+        key = term.casefold()[:MAX_KEY_LENGTH]
+        if max_terms is not None and self.terms >= max_terms:
+            known = self.path(key)
+            if not known or known[-1].term is None:
+                return
+        nodes = self.path(key, create=True)
+        leaf = nodes[-1]
+        if leaf.term is None:
+            self.terms += 1
+        # The most recently written spelling is the one suggested
+        leaf.term = term
+        leaf.count += count
+        for node in nodes:
+            node.best = None
+
+    def remove(self, term: str, count: int = 1):
+        key = term.strip().casefold()[:MAX_KEY_LENGTH]
+        nodes = self.path(key)
+        if not key or not nodes or nodes[-1].term is None:
+            return
+        leaf = nodes[-1]
+        leaf.count -= count
+        if leaf.count <= 0:
+            leaf.term, leaf.count = None, 0
+            self.terms -= 1
+        for node in nodes:
+            node.best = None
+        # Prune branches that no longer lead to a term
+        for depth in range(len(key), 0, -1):
+            node = nodes[depth]
+            if node.term is not None or node.children:
+                break
+            del nodes[depth - 1].children[key[depth - 1]]
+
+    def best(self, node: TrieNode) -> List[Tuple[int, str]]:
+        if node.best is None:
+            candidates = [(node.count, node.term)] if node.term is not None else []
+            for child in node.children.values():
+                candidates.extend(self.best(child))
+            node.best = heapq.nlargest(self.suggestions, candidates)
+        return node.best
+
+    def complete(self, prefix: str, limit: Optional[int] = None) -> List[Tuple[str, int]]:
+        nodes = self.path(prefix.strip().casefold()[:MAX_KEY_LENGTH])
+        if not nodes:
+            return []
+        return [(term, count) for count, term in self.best(nodes[-1])[:limit or self.suggestions]]
+
+
+class SearchIndex:
+    def __init__(self, suggestions: int = 10, max_descriptions: int = 5000):
+        self.suggestions = suggestions
+        self.max_descriptions = max_descriptions
+        self.categories = PrefixIndex(suggestions)
+        self.descriptions = PrefixIndex(suggestions)
+        self.reload_task: Optional[asyncio.Task] = None
+
+    async def load(self, collection):
+        categories = PrefixIndex(self.suggestions)
+        descriptions = PrefixIndex(self.suggestions)
+        async for row in collection.aggregate([{"$group": {"_id": "$category", "count": {"$sum": 1}}}]):
+            if row["_id"]:
+                categories.add(row["_id"], row["count"])
+        async for row in collection.aggregate(
+            [
+                {"$group": {"_id": "$description", "count": {"$sum": 1}}},
+                {"$sort": {"count": -1}},
+                {"$limit": self.max_descriptions},
+            ],
+            allowDiskUse=True,
+        ):
+            if row["_id"]:
+                descriptions.add(row["_id"], row["count"])
+        # Swap both tries in at once so lookups never see a half-built index
+        self.categories, self.descriptions = categories, descriptions
+        logger.info("Search suggestions loaded: %d categories, %d descriptions", len(categories), len(descriptions))
+
+    def schedule_reload(self, collection):
+        """Reload in the background, coalescing requests made while a reload is running"""
+        if self.reload_task is None or self.reload_task.done():
+            self.reload_task = asyncio.create_task(self.load(collection))
+
+    def record(self, transactions, direction: int = 1):
+        # Descriptions stay within the same cap as the initial load; new ones
+        # that don't fit wait for the next reload to compete on frequency
+        for tx in transactions:
+            for index, field, max_terms in (
+                (self.categories, "category", None),
+                (self.descriptions, "description", self.max_descriptions),
+            ):
+                if tx.get(field):
+                    if direction > 0:
+                        index.add(tx[field], max_terms=max_terms)
+                    else:
+                        index.remove(tx[field])
+
+    def suggest(self, prefix: str, limit: int) -> dict:
+        return {
+            "categories": [{"value": term, "count": count} for term, count in self.categories.complete(prefix, limit)],
+            "descriptions": [{"value": term, "count": count} for term, count in self.descriptions.complete(prefix, limit)],
+        }
@@ -1,26 +1,202 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from pymongo.read_preferences import SecondaryPreferred
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Annotated, Dict, List, Optional
 import uuid
-from datetime import datetime, timezone, date
+import json
+import base64
+import codecs
+import hashlib
+import csv
+import io
+import asyncio
+import orjson
+import re
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone, date, timedelta
+from decimal import Decimal
 from enum import Enum
 
+import analytics
+from compression import CompressionMiddleware, strip_encoding_suffix
+from cache import MemoryCacheBackend, RedisCacheBackend, ResponseCache
+from events import ChangeStreamRelay, EventBroker
+from search import SearchIndex
+from archive import TransactionArchive
+from writes import InsertCoalescer
+from metrics import MetricsMiddleware, MongoCommandMetrics, MongoPoolMetrics, render_metrics, span
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
+# MongoDB connection. The client is created by connect() when the app starts
+# (or by scripts that import this module), not at import time. The pool is
+# sized from the environment, and MONGO_MAX_CONNECTING caps how many
+# connections one worker opens at once, so worker restarts don't stampede the
+# server. Analytics reads go to analytics_db, which prefers secondaries;
+# those results can lag the primary by up to the replication delay.
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '10'))
+MONGO_MAX_CONNECTING = int(os.environ.get('MONGO_MAX_CONNECTING', '2'))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '10000'))
+ANALYTICS_MAX_STALENESS_SECONDS = int(os.environ.get('ANALYTICS_MAX_STALENESS_SECONDS', '-1'))
+
+pool_metrics = MongoPoolMetrics()
+client = None
+db = None
+analytics_db = None
+
+def connect():
+    global client, db, analytics_db
+    client = AsyncIOMotorClient(
+        mongo_url,
+        tz_aware=True,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxConnecting=MONGO_MAX_CONNECTING,
+        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        event_listeners=[MongoCommandMetrics(), pool_metrics]
+    )
+    db = client[os.environ['DB_NAME']]
+    analytics_db = client.get_database(
+        os.environ['DB_NAME'],
+        read_preference=SecondaryPreferred(max_staleness=ANALYTICS_MAX_STALENESS_SECONDS)
+    )
+    return client
+
+async def warm_up_pool():
+    # Open the minimum pool before taking traffic rather than on the first burst
+    await asyncio.gather(*(db.command("ping") for _ in range(max(MONGO_MIN_POOL_SIZE, 1))))
+
+# Ledgers (tenants) each get their own transactions and daily_rollups
+# collections, so indexes, rollups, locks and cache entries never mix between
+# business units, and a large ledger can be sharded or placed on its own.
+# The default ledger keeps the original collection names. Endpoints select a
+# ledger with ?ledger=; its collections and indexes are created on first write.
+DEFAULT_LEDGER = "default"
+LEDGER_PATTERN = r"^[a-z0-9][a-z0-9_-]{0,63}$"
+LEDGER_COLLECTION = re.compile(r"^transactions(?:\.(?P<ledger>[a-z0-9][a-z0-9_-]{0,63}))?$")
+
+def ledger_collection_name(base: str, ledger: str) -> str:
+    return base if ledger == DEFAULT_LEDGER else f"{base}.{ledger}"
+
+def transactions_collection(ledger: str, database=None):
+    database = db if database is None else database
+    return database[ledger_collection_name("transactions", ledger)]
+
+def rollups_collection(ledger: str, database=None):
+    database = db if database is None else database
+    return database[ledger_collection_name("daily_rollups", ledger)]
+
+def snapshots_collection(ledger: str, database=None):
+    database = db if database is None else database
+    return database[ledger_collection_name("period_snapshots", ledger)]
+
+def ledger_for_collection(name: str) -> Optional[str]:
+    match = LEDGER_COLLECTION.match(name)
+    if not match:
+        return None
+    return match.group("ledger") or DEFAULT_LEDGER
+
+async def list_ledgers():
+    names = await db.list_collection_names(filter={"name": {"$regex": "^transactions"}})
+    return sorted({ledger for ledger in map(ledger_for_collection, names) if ledger} | {DEFAULT_LEDGER})
+
+provisioned_ledgers = set()
+
+async def provision_ledger(ledger: str):
+    if ledger in provisioned_ledgers:
+        return
+    await ensure_indexes(ledger)
+    await enable_change_pre_images(ledger)
+    provisioned_ledgers.add(ledger)
+
+def ledger_param(ledger: str = Query(DEFAULT_LEDGER, pattern=LEDGER_PATTERN)) -> str:
+    return ledger
+
+Ledger = Annotated[str, Depends(ledger_param)]
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    connect()
+    await warm_up_pool()
+    ledgers = await list_ledgers()
+    for ledger in ledgers:
+        await provision_ledger(ledger)
+    logger.info("Transaction indexes are in place for %d ledger(s)", len(ledgers))
+    await ensure_idempotency_indexes()
+    search_index_for(DEFAULT_LEDGER)
+    if await start_live_updates():
+        logger.info("Live updates follow the transactions change stream")
+    try:
+        yield
+    finally:
+        if insert_coalescer:
+            await insert_coalescer.close()
+        await stop_live_updates()
+        client.close()
+
+# Response cache for summary and chart-data. The in-process LRU is per
+# worker; set RESPONSE_CACHE_URL to a redis:// URL to share entries (and
+# invalidations) between workers.
+def create_response_cache():
+    cache_url = os.environ.get('RESPONSE_CACHE_URL')
+    if cache_url:
+        backend = RedisCacheBackend(cache_url)
+    else:
+        backend = MemoryCacheBackend(int(os.environ.get('RESPONSE_CACHE_SIZE', '1024')))
+    return ResponseCache(backend, ttl=float(os.environ.get('RESPONSE_CACHE_TTL', '300')))
+
+response_cache = create_response_cache()
+
+# In-memory prefix suggestions for categories and the most frequent
+# descriptions, one index per ledger, loaded on first use; see search.py
+SEARCH_MAX_DESCRIPTIONS = int(os.environ.get('SEARCH_MAX_DESCRIPTIONS', '5000'))
+search_indexes: Dict[str, SearchIndex] = {}
+
+def search_index_for(ledger: str) -> SearchIndex:
+    if ledger not in search_indexes:
+        search_indexes[ledger] = SearchIndex(suggestions=10, max_descriptions=SEARCH_MAX_DESCRIPTIONS)
+        # Suggestions fill in the background; until then they come back empty
+        search_indexes[ledger].schedule_reload(transactions_collection(ledger))
+    return search_indexes[ledger]
+
+def record_search_terms(ledger: str, transactions, direction: int = 1):
+    # Ledgers nobody has searched yet load everything on first use instead
+    if ledger in search_indexes:
+        search_indexes[ledger].record(transactions, direction)
+
+def reload_search_terms(ledger: str):
+    if ledger in search_indexes:
+        search_indexes[ledger].schedule_reload(transactions_collection(ledger))
+
+# Closed years can be archived to Parquet partitions on local disk (see
+# archive.py). Archived rows are read-only and always older than everything
+# still in MongoDB, so reads take the hot results first and continue with the
+# archive. Daily rollups and period snapshots stay in MongoDB, so rollup
+# summaries, charts and analytics never need to open the archive.
+ARCHIVE_DIR = Path(os.environ.get('ARCHIVE_DIR', ROOT_DIR / 'archive'))
+transaction_archive = TransactionArchive(ARCHIVE_DIR)
+
+async def read_archive(method, ledger: str, *args):
+    # Parquet reads and archive directory listings block, so they run on a worker thread
+    return await asyncio.to_thread(method, ledger, *args)
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -30,11 +206,16 @@ class TransactionType(str, Enum):
     INCOME = "income"
     EXPENSE = "expense"
 
+# Amounts are exact decimals with at most two places (cents). They are
+# stored as integer minor units and serialised as strings.
+Money = Annotated[Decimal, Field(decimal_places=2)]
+
 # Define Models
 class Transaction(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    ledger: str = DEFAULT_LEDGER
     type: TransactionType
-    amount: float
+    amount: Money
     description: str
     category: Optional[str] = None
     date: date
@@ -42,181 +223,2137 @@ class Transaction(BaseModel):
 
 class TransactionCreate(BaseModel):
     type: TransactionType
-    amount: float
+    amount: Money
     description: str
     category: Optional[str] = None
     date: date
 
 class TransactionSummary(BaseModel):
-    total_income: float
-    total_expenses: float
-    net_profit: float
+    total_income: Decimal
+    total_expenses: Decimal
+    net_profit: Decimal
     transaction_count: int
 
+class TransactionPage(BaseModel):
+    items: List[Transaction]
+    next_cursor: Optional[str] = None
+
+class CategoryTotal(BaseModel):
+    category: str
+    total: Decimal
+    count: int
+    share: float
+
+class TypeBreakdown(BaseModel):
+    type: TransactionType
+    total: Decimal
+    count: int
+    categories: List[CategoryTotal]
+    other: Optional[CategoryTotal] = None
+
+class CategoryBreakdown(BaseModel):
+    breakdown: List[TypeBreakdown]
+
+class DashboardData(BaseModel):
+    transactions: TransactionPage
+    summary: TransactionSummary
+    chart: dict
+
+class BulkRowError(BaseModel):
+    row: int
+    error: str
+
+class BulkIngestResult(BaseModel):
+    inserted: int
+    failed: int
+    errors: List[BulkRowError]
+
+# Batch delete/update select rows either by id or by a filter; an empty
+# filter is rejected so a request can never match the whole collection by accident
+MAX_BATCH_IDS = 10000
+
+class TransactionFilter(BaseModel):
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    type: Optional[TransactionType] = None
+    category: Optional[str] = None
+
+class BatchDeleteRequest(BaseModel):
+    ids: Optional[List[str]] = Field(None, max_length=MAX_BATCH_IDS)
+    filter: Optional[TransactionFilter] = None
+
+class BatchDeleteResult(BaseModel):
+    deleted: int
+
+class BulkUpdateRequest(BaseModel):
+    ids: Optional[List[str]] = Field(None, max_length=MAX_BATCH_IDS)
+    filter: Optional[TransactionFilter] = None
+    category: Optional[str]
+
+class BulkUpdateResult(BaseModel):
+    matched: int
+    modified: int
+
+# Period close: months are frozen into snapshots, see close_periods
+class PeriodCategoryTotal(BaseModel):
+    type: TransactionType
+    category: str
+    total: Decimal
+    count: int
+
+class PeriodSnapshot(BaseModel):
+    period: str
+    start_date: date
+    end_date: date
+    total_income: Decimal
+    total_expenses: Decimal
+    net_profit: Decimal
+    transaction_count: int
+    opening_balance: Decimal
+    closing_balance: Decimal
+    categories: List[PeriodCategoryTotal]
+    closed_at: datetime
+
+class ClosedPeriods(BaseModel):
+    closed_through: Optional[date] = None
+    # Last month whose transactions live in the Parquet archive, as YYYY-MM
+    archived_through: Optional[str] = None
+    periods: List[PeriodSnapshot]
+
+PERIOD_PATTERN = r"^\d{4}-(0[1-9]|1[0-2])$"
+
+class ClosePeriodsRequest(BaseModel):
+    through: str = Field(pattern=PERIOD_PATTERN)
+
+class ReopenPeriodsRequest(BaseModel):
+    start: str = Field(pattern=PERIOD_PATTERN)
+
+class ReopenPeriodsResult(BaseModel):
+    reopened: int
+
+class ArchiveYearRequest(BaseModel):
+    year: int = Field(ge=1, le=9999)
+
+class ArchiveYearResult(BaseModel):
+    year: int
+    archived: int
+
+# Upload formats accepted by POST /transactions/bulk
+class BulkFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+# Formats served by GET /transactions/export
+class ExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+    PARQUET = "parquet"
+
+# How the summary totals are computed: "rollup" reads the pre-aggregated
+# daily_rollups collection, "aggregate" runs a $match/$group pipeline over
+# the raw transactions, "scan" pulls the matching documents and sums them in
+# Python (the last two are kept for parity checks and benchmarks)
+class SummaryMode(str, Enum):
+    ROLLUP = "rollup"
+    AGGREGATE = "aggregate"
+    SCAN = "scan"
+
+# Bucket size for GET /transactions/chart-data; "auto" picks the finest
+# bucket that keeps the series within max_points
+class ChartGranularity(str, Enum):
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
+    QUARTER = "quarter"
+    AUTO = "auto"
+
+# Encodings for chart data. "json" is parallel arrays of decimal strings
+# with a date label per point; "columnar" is a base date, day offsets from
+# it and integer minor units, sent as JSON, MessagePack (needs the optional
+# msgpack package) or an Arrow IPC stream
+class ChartFormat(str, Enum):
+    JSON = "json"
+    COLUMNAR = "columnar"
+    MSGPACK = "msgpack"
+    ARROW = "arrow"
+
+class ComparisonPeriod(str, Enum):
+    WEEK = "week"
+    MONTH = "month"
+    QUARTER = "quarter"
+    YEAR = "year"
+
+# Money is stored in `amount_minor` as integer cents so MongoDB sums it
+# exactly; rollups keep income_minor/expense_minor the same way
+def to_minor_units(amount: Decimal) -> int:
+    return int(amount.scaleb(2))
+
+def from_minor_units(minor: int) -> Decimal:
+    return Decimal(minor).scaleb(-2)
+
+# Dates are stored as native BSON dates: `date` as midnight UTC of the
+# calendar day, `created_at` as the UTC timestamp. The client is tz_aware so
+# both come back as aware datetimes and no string parsing is needed on reads.
+def to_mongo_date(value: date) -> datetime:
+    return datetime(value.year, value.month, value.day, tzinfo=timezone.utc)
+
 # Helper functions for MongoDB serialization
 def prepare_for_mongo(data):
-    if isinstance(data.get('date'), date):
-        data['date'] = data['date'].isoformat()
-    if isinstance(data.get('created_at'), datetime):
-        data['created_at'] = data['created_at'].isoformat()
+    if isinstance(data.get('amount'), Decimal):
+        data['amount_minor'] = to_minor_units(data.pop('amount'))
+    if isinstance(data.get('date'), date) and not isinstance(data['date'], datetime):
+        data['date'] = to_mongo_date(data['date'])
     return data
 
 def parse_from_mongo(item):
-    if isinstance(item.get('date'), str):
+    if 'amount_minor' in item:
+        item['amount'] = from_minor_units(item.pop('amount_minor'))
+    if isinstance(item.get('date'), datetime):
+        item['date'] = item['date'].date()
+    elif isinstance(item.get('date'), str):
         item['date'] = datetime.fromisoformat(item['date']).date()
     if isinstance(item.get('created_at'), str):
         item['created_at'] = datetime.fromisoformat(item['created_at'])
     return item
 
+# Lean read path: only the response fields are projected and each document
+# maps straight to a JSON-ready row for ORJSONResponse, skipping the
+# parse_from_mongo + Transaction validation + re-serialisation round trip
+TRANSACTION_PROJECTION = {
+    "_id": 0, "id": 1, "ledger": 1, "type": 1, "amount_minor": 1, "description": 1,
+    "category": 1, "date": 1, "created_at": 1,
+}
+
+def transaction_row(doc):
+    return {
+        "id": doc["id"],
+        # Documents written before ledgers existed belong to the default one
+        "ledger": doc.get("ledger", DEFAULT_LEDGER),
+        "type": doc["type"],
+        "amount": str(from_minor_units(doc["amount_minor"])),
+        "description": doc["description"],
+        "category": doc.get("category"),
+        "date": doc["date"].date(),
+        "created_at": doc["created_at"],
+    }
+
+def build_date_query(start_date: Optional[str] = None, end_date: Optional[str] = None, field: str = "date"):
+    query = {}
+    if start_date or end_date:
+        date_filter = {}
+        if start_date:
+            date_filter["$gte"] = to_mongo_date(date.fromisoformat(start_date))
+        if end_date:
+            date_filter["$lte"] = to_mongo_date(date.fromisoformat(end_date))
+        query[field] = date_filter
+    return query
+
+def build_batch_query(ids: Optional[List[str]], transaction_filter: Optional[TransactionFilter]):
+    if (ids is None) == (transaction_filter is None):
+        raise ValueError("Provide either ids or filter")
+    if ids is not None:
+        if not ids:
+            raise ValueError("ids must not be empty")
+        return {"id": {"$in": ids}}
+    
+    criteria = transaction_filter.dict(exclude_none=True)
+    if not criteria:
+        raise ValueError("filter needs at least one of start_date, end_date, type or category")
+    query = build_date_query(
+        transaction_filter.start_date and transaction_filter.start_date.isoformat(),
+        transaction_filter.end_date and transaction_filter.end_date.isoformat()
+    )
+    if transaction_filter.type:
+        query["type"] = transaction_filter.type
+    if transaction_filter.category is not None:
+        query["category"] = transaction_filter.category
+    return query
+
+# Keyset pagination: GET /transactions is ordered newest first on
+# (date, created_at, id) and the cursor is the opaque, url-safe encoding of
+# the last row's sort key. The next page seeks strictly past that key.
+TRANSACTION_SORT = [("date", DESCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]
+
+def encode_cursor(tx):
+    key = [tx['date'].isoformat(), tx['created_at'].isoformat(), tx['id']]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        tx_date, created_at, tx_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(tx_date), datetime.fromisoformat(created_at), tx_id
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def build_seek_query(cursor: str):
+    tx_date, created_at, tx_id = decode_cursor(cursor)
+    return {"$or": [
+        {"date": {"$lt": tx_date}},
+        {"date": tx_date, "created_at": {"$lt": created_at}},
+        {"date": tx_date, "created_at": created_at, "id": {"$lt": tx_id}},
+    ]}
+
+def summary_pipeline(query):
+    return [
+        {"$match": query},
+        {"$group": {
+            "_id": None,
+            "total_income": {"$sum": {"$cond": [{"$eq": ["$type", "income"]}, "$amount_minor", 0]}},
+            "total_expenses": {"$sum": {"$cond": [{"$eq": ["$type", "expense"]}, "$amount_minor", 0]}},
+            "transaction_count": {"$sum": 1},
+        }},
+    ]
+
+async def summarize_with_aggregation(ledger: str, query):
+    results = await transactions_collection(ledger).aggregate(summary_pipeline(query)).to_list(1)
+    if not results:
+        return 0, 0, 0
+    totals = results[0]
+    return totals["total_income"], totals["total_expenses"], totals["transaction_count"]
+
+async def summarize_with_scan(ledger: str, query):
+    transactions = await transactions_collection(ledger).find(query).to_list(None)
+    total_income = sum(tx['amount_minor'] for tx in transactions if tx['type'] == 'income')
+    total_expenses = sum(tx['amount_minor'] for tx in transactions if tx['type'] == 'expense')
+    return total_income, total_expenses, len(transactions)
+
+def rollup_summary_pipeline(start_date: Optional[str] = None, end_date: Optional[str] = None, skip=None):
+    query = build_date_query(start_date, end_date, field="_id")
+    if skip:
+        # Leave out the days already counted from closed-period snapshots
+        first_day, last_day = skip
+        query = {"$and": [query, {"$or": [{"_id": {"$lt": first_day}}, {"_id": {"$gt": last_day}}]}]}
+    return [
+        {"$match": query},
+        {"$group": {
+            "_id": None,
+            "total_income": {"$sum": "$income_minor"},
+            "total_expenses": {"$sum": "$expense_minor"},
+            "transaction_count": {"$sum": "$count"},
+        }},
+    ]
+
+async def summarize_with_rollups(
+    ledger: str, start_date: Optional[str] = None, end_date: Optional[str] = None, database=None
+):
+    # Closed months that fit inside the range are read from their snapshots:
+    # the running totals of the last one, less those before the first one,
+    # cover them all in two reads. Only the days around them are summed from
+    # the daily rollups, so long ranges cost about as much as the open period
+    snapshots = snapshots_collection(ledger, database)
+    query = snapshot_range_query(start_date, end_date)
+    first = await snapshots.find_one(query, SNAPSHOT_TOTALS_PROJECTION, sort=[("_id", ASCENDING)])
+    last = await snapshots.find_one(query, SNAPSHOT_TOTALS_PROJECTION, sort=[("_id", DESCENDING)]) if first else None
+    skip = (first["_id"], last["end"]) if first else None
+    closed = [
+        last[f"cumulative_{field}"] - first[f"cumulative_{field}"] + first[field] if first else 0
+        for field in SNAPSHOT_TOTAL_FIELDS
+    ]
+    
+    results = await rollups_collection(ledger, database).aggregate(
+        rollup_summary_pipeline(start_date, end_date, skip)
+    ).to_list(1)
+    totals = results[0] if results else {"total_income": 0, "total_expenses": 0, "transaction_count": 0}
+    return (
+        totals["total_income"] + closed[0],
+        totals["total_expenses"] + closed[1],
+        totals["transaction_count"] + closed[2],
+    )
+
+async def compute_transaction_summary(ledger: str, start_date: Optional[str], end_date: Optional[str], mode: SummaryMode):
+    # Build query filters
+    query = build_date_query(start_date, end_date)
+    
+    # Calculate summary in minor units
+    if mode == SummaryMode.SCAN:
+        total_income, total_expenses, transaction_count = await summarize_with_scan(ledger, query)
+    elif mode == SummaryMode.AGGREGATE:
+        total_income, total_expenses, transaction_count = await summarize_with_aggregation(ledger, query)
+    else:
+        total_income, total_expenses, transaction_count = await summarize_with_rollups(ledger, start_date, end_date)
+    
+    # Rollups already cover archived days; the transaction-level modes read them from the archive
+    if mode != SummaryMode.ROLLUP and await read_archive(transaction_archive.partitions, ledger, query):
+        archived_income, archived_expenses, archived_count = await read_archive(transaction_archive.totals, ledger, query)
+        total_income += archived_income
+        total_expenses += archived_expenses
+        transaction_count += archived_count
+    
+    return build_summary(total_income, total_expenses, transaction_count)
+
+def build_summary(total_income_minor: int, total_expenses_minor: int, transaction_count: int):
+    return TransactionSummary(
+        total_income=from_minor_units(total_income_minor),
+        total_expenses=from_minor_units(total_expenses_minor),
+        net_profit=from_minor_units(total_income_minor - total_expenses_minor),
+        transaction_count=transaction_count
+    )
+
+# Chart buckets are computed over daily_rollups with $dateTrunc. Gaps are
+# zero-filled with $densify and the running balance comes from
+# $setWindowFields, all in one pipeline (MongoDB 5.1+).
+CHART_MAX_POINTS = int(os.environ.get('CHART_MAX_POINTS', '366'))
+BUCKET_DAYS = {
+    ChartGranularity.DAY: 1,
+    ChartGranularity.WEEK: 7,
+    ChartGranularity.MONTH: 30.44,
+    ChartGranularity.QUARTER: 91.31,
+}
+# Days before start_date collapse into this bucket so the running balance
+# opens with everything that happened earlier; it is dropped from the output
+OPENING_BUCKET = datetime(1, 1, 1, tzinfo=timezone.utc)
+
+def truncate_date(value: date, granularity: ChartGranularity) -> date:
+    if granularity == ChartGranularity.WEEK:
+        return value - timedelta(days=value.weekday())
+    if granularity == ChartGranularity.MONTH:
+        return value.replace(day=1)
+    if granularity == ChartGranularity.QUARTER:
+        return value.replace(month=3 * ((value.month - 1) // 3) + 1, day=1)
+    return value
+
+def pick_granularity(first_day: date, last_day: date, max_points: int) -> ChartGranularity:
+    span_days = (last_day - first_day).days + 1
+    for granularity, days in BUCKET_DAYS.items():
+        if span_days / days <= max_points:
+            return granularity
+    return ChartGranularity.QUARTER
+
+async def rollup_date_bounds(ledger: str):
+    first = await rollups_collection(ledger).find_one({}, {"_id": 1}, sort=[("_id", ASCENDING)])
+    last = await rollups_collection(ledger).find_one({}, {"_id": 1}, sort=[("_id", DESCENDING)])
+    if not first:
+        return None, None
+    return first["_id"].date(), last["_id"].date()
+
+def chart_pipeline(
+    granularity: ChartGranularity,
+    start_day: Optional[date],
+    end_day: Optional[date],
+    fill_gaps: bool = False,
+    cumulative: bool = False
+):
+    bucket = {"$dateTrunc": {"date": "$_id", "unit": granularity.value}}
+    if granularity == ChartGranularity.WEEK:
+        bucket["$dateTrunc"]["startOfWeek"] = "monday"
+    date_filter = {}
+    if end_day:
+        date_filter["$lte"] = to_mongo_date(end_day)
+    if start_day and cumulative:
+        bucket = {"$cond": [{"$lt": ["$_id", to_mongo_date(start_day)]}, OPENING_BUCKET, bucket]}
+    elif start_day:
+        date_filter["$gte"] = to_mongo_date(start_day)
+    
+    pipeline = [{"$match": {"_id": date_filter} if date_filter else {}}]
+    pipeline.append({"$group": {
+        "_id": bucket,
+        "income_minor": {"$sum": "$income_minor"},
+        "expense_minor": {"$sum": "$expense_minor"},
+    }})
+    # $densify and $setWindowFields cannot work on _id, so carry it as `bucket`
+    pipeline.append({"$project": {"_id": 0, "bucket": "$_id", "income_minor": 1, "expense_minor": 1}})
+    
+    if fill_gaps:
+        if start_day and end_day:
+            bounds = [
+                to_mongo_date(truncate_date(start_day, granularity)),
+                to_mongo_date(end_day) + timedelta(days=1),
+            ]
+        else:
+            bounds = "full"
+        pipeline.append({"$densify": {
+            "field": "bucket",
+            "range": {"step": 1, "unit": granularity.value, "bounds": bounds},
+        }})
+        pipeline.append({"$set": {
+            "income_minor": {"$ifNull": ["$income_minor", 0]},
+            "expense_minor": {"$ifNull": ["$expense_minor", 0]},
+        }})
+    
+    if cumulative:
+        pipeline.append({"$setWindowFields": {
+            "sortBy": {"bucket": 1},
+            "output": {"balance_minor": {
+                "$sum": {"$subtract": ["$income_minor", "$expense_minor"]},
+                "window": {"documents": ["unbounded", "current"]},
+            }},
+        }})
+        pipeline.append({"$match": {"bucket": {"$ne": OPENING_BUCKET}}})
+    
+    pipeline.append({"$sort": {"bucket": 1}})
+    pipeline.append({"$project": {"_id": "$bucket", "income_minor": 1, "expense_minor": 1, "balance_minor": 1}})
+    return pipeline
+
+async def compute_chart_data(
+    ledger: str,
+    start_date: Optional[str],
+    end_date: Optional[str],
+    granularity: ChartGranularity = ChartGranularity.DAY,
+    fill_gaps: bool = False,
+    cumulative: bool = False,
+    max_points: int = CHART_MAX_POINTS,
+    columnar: bool = False
+):
+    start_day = date.fromisoformat(start_date) if start_date else None
+    end_day = date.fromisoformat(end_date) if end_date else None
+    
+    if granularity == ChartGranularity.AUTO or (fill_gaps and not (start_day and end_day)):
+        # Open-ended ranges take their bounds from the data
+        first_day, last_day = await rollup_date_bounds(ledger)
+        start_day, end_day = start_day or first_day, end_day or last_day
+    if granularity == ChartGranularity.AUTO:
+        granularity = pick_granularity(start_day, end_day, max_points) if start_day else ChartGranularity.DAY
+    
+    if granularity == ChartGranularity.DAY and not fill_gaps and not cumulative:
+        # Rollups are already daily, so read them directly
+        buckets = await rollups_collection(ledger).find(
+            build_date_query(start_date, end_date, field="_id")
+        ).sort("_id", 1).to_list(None)
+    else:
+        pipeline = chart_pipeline(granularity, start_day, end_day, fill_gaps, cumulative)
+        buckets = await rollups_collection(ledger).aggregate(pipeline).to_list(None)
+    
+    chart_data = format_columnar_chart(buckets, cumulative) if columnar else format_chart_data(buckets)
+    chart_data['granularity'] = granularity.value
+    if cumulative and not columnar:
+        chart_data['balance'] = [str(from_minor_units(row.get('balance_minor', 0))) for row in buckets]
+    return chart_data
+
+def format_chart_data(days):
+    # `days` are daily rollup shaped rows sorted by date:
+    # {_id, income_minor, expense_minor}; amounts go out as decimal strings
+    daily_data = {}
+    for day in days:
+        income = day.get('income_minor', 0)
+        expenses = day.get('expense_minor', 0)
+        daily_data[day['_id'].date().isoformat()] = {
+            'income': str(from_minor_units(income)),
+            'expenses': str(from_minor_units(expenses)),
+            'net': str(from_minor_units(income - expenses))
+        }
+    
+    # Format for chart
+    return {
+        'labels': list(daily_data.keys()),
+        'income': [daily_data[tx_date]['income'] for tx_date in daily_data.keys()],
+        'expenses': [daily_data[tx_date]['expenses'] for tx_date in daily_data.keys()],
+        'net_profit': [daily_data[tx_date]['net'] for tx_date in daily_data.keys()]
+    }
+
+def format_columnar_chart(buckets, cumulative: bool = False):
+    # Same rows as format_chart_data, as integer columns: a bucket's date is
+    # base_date plus its offset in days, amounts are minor units and net is
+    # left for the client to derive
+    base_day = buckets[0]['_id'].date() if buckets else None
+    columns = {
+        'base_date': base_day.isoformat() if base_day else None,
+        'offsets': [(row['_id'].date() - base_day).days for row in buckets],
+        'income_minor': [row.get('income_minor', 0) for row in buckets],
+        'expense_minor': [row.get('expense_minor', 0) for row in buckets],
+    }
+    if cumulative:
+        columns['balance_minor'] = [row.get('balance_minor', 0) for row in buckets]
+    return columns
+
+CHART_MINOR_COLUMNS = ("income_minor", "expense_minor", "balance_minor")
+
+def render_chart_msgpack(columns, headers):
+    try:
+        import msgpack
+    except ImportError:
+        raise ValueError("format=msgpack needs the optional msgpack package")
+    return Response(msgpack.packb(columns), media_type="application/x-msgpack", headers=headers)
+
+def render_chart_arrow(columns, headers):
+    import pyarrow as pa
+    
+    # date32 is days since the epoch, so the offsets only need shifting
+    base_day = date.fromisoformat(columns['base_date']) if columns['base_date'] else date(1970, 1, 1)
+    epoch_offset = (base_day - date(1970, 1, 1)).days
+    days = pa.array([epoch_offset + offset for offset in columns['offsets']], pa.int32()).cast(pa.date32())
+    table = pa.table(
+        {"date": days, **{name: pa.array(columns[name], pa.int64()) for name in CHART_MINOR_COLUMNS if name in columns}},
+        metadata={"granularity": columns['granularity']}
+    )
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return Response(sink.getvalue().to_pybytes(), media_type="application/vnd.apache.arrow.stream", headers=headers)
+
+CHART_RENDERERS = {
+    ChartFormat.MSGPACK: render_chart_msgpack,
+    ChartFormat.ARROW: render_chart_arrow,
+}
+
+# Category breakdown: one $group per (type, category) sorted by total, then
+# one per type that keeps the top_n categories; the remainder is reported
+# as a single "Other" bucket
+UNCATEGORIZED = "Uncategorized"
+OTHER_CATEGORY = "Other"
+
+# Missing, null and empty categories all group together
+CATEGORY_KEY = {"$ifNull": [{"$cond": [{"$eq": ["$category", ""]}, None, "$category"]}, UNCATEGORIZED]}
+
+def category_breakdown_pipeline(query, top_n: int):
+    return [
+        {"$match": query},
+        {"$group": {
+            "_id": {"type": "$type", "category": CATEGORY_KEY},
+            "total_minor": {"$sum": "$amount_minor"},
+            "count": {"$sum": 1},
+        }},
+        {"$sort": {"total_minor": -1, "_id.category": 1}},
+        {"$group": {
+            "_id": "$_id.type",
+            "total_minor": {"$sum": "$total_minor"},
+            "count": {"$sum": "$count"},
+            "categories": {"$push": {"category": "$_id.category", "total_minor": "$total_minor", "count": "$count"}},
+        }},
+        {"$project": {"total_minor": 1, "count": 1, "categories": {"$slice": ["$categories", top_n]}}},
+        {"$sort": {"_id": 1}},
+    ]
+
+def category_total(category: str, total_minor: int, count: int, type_total_minor: int):
+    share = total_minor / type_total_minor if type_total_minor else 0.0
+    return CategoryTotal(
+        category=category,
+        total=from_minor_units(total_minor),
+        count=count,
+        share=round(share, 4)
+    )
+
+def merge_archived_categories(rows, archived, top_n: int):
+    # Per-type rows in the pipeline's shape, over hot and archived categories together
+    totals = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+    for row in rows:
+        for item in row["categories"]:
+            totals[row["_id"]][item["category"]][0] += item["total_minor"]
+            totals[row["_id"]][item["category"]][1] += item["count"]
+    for item in archived:
+        totals[item["type"]][item["category"]][0] += item["total_minor"]
+        totals[item["type"]][item["category"]][1] += item["count"]
+    merged = []
+    for tx_type in sorted(totals):
+        categories = sorted(
+            ({"category": category, "total_minor": total, "count": count} for category, (total, count) in totals[tx_type].items()),
+            key=lambda item: (-item["total_minor"], item["category"])
+        )
+        merged.append({
+            "_id": tx_type,
+            "total_minor": sum(item["total_minor"] for item in categories),
+            "count": sum(item["count"] for item in categories),
+            "categories": categories[:top_n],
+        })
+    return merged
+
+async def compute_category_breakdown(ledger: str, query, top_n: int):
+    if await read_archive(transaction_archive.partitions, ledger, query):
+        # Top categories can only be picked once the archive's totals are added,
+        # so MongoDB returns every category here
+        rows = await transactions_collection(ledger).aggregate(category_breakdown_pipeline(query, 2 ** 31 - 1)).to_list(None)
+        archived = await read_archive(transaction_archive.category_totals, ledger, query, UNCATEGORIZED)
+        rows = merge_archived_categories(rows, archived, top_n)
+    else:
+        rows = await transactions_collection(ledger).aggregate(category_breakdown_pipeline(query, top_n)).to_list(None)
+    
+    breakdown = []
+    for row in rows:
+        categories = [
+            category_total(item["category"], item["total_minor"], item["count"], row["total_minor"])
+            for item in row["categories"]
+        ]
+        other_total = row["total_minor"] - sum(item["total_minor"] for item in row["categories"])
+        other_count = row["count"] - sum(item["count"] for item in row["categories"])
+        breakdown.append(TypeBreakdown(
+            type=row["_id"],
+            total=from_minor_units(row["total_minor"]),
+            count=row["count"],
+            categories=categories,
+            other=category_total(OTHER_CATEGORY, other_total, other_count, row["total_minor"]) if other_count else None
+        ))
+    return CategoryBreakdown(breakdown=breakdown)
+
+# Analytics: daily rollups are loaded into a dense pandas frame (one row per
+# day) and the calculations in analytics.py run column-wise over it. Open
+# date bounds default to the first and last day with data.
+async def analytics_date_bounds(ledger: str, start_date: Optional[str], end_date: Optional[str]):
+    start_day = date.fromisoformat(start_date) if start_date else None
+    end_day = date.fromisoformat(end_date) if end_date else None
+    if not (start_day and end_day):
+        first_day, last_day = await rollup_date_bounds(ledger)
+        start_day, end_day = start_day or first_day, end_day or last_day
+    return start_day, end_day
+
+async def load_analytics_frame(ledger: str, start_day: Optional[date], end_day: Optional[date]):
+    query = build_date_query(
+        start_day and start_day.isoformat(), end_day and end_day.isoformat(), field="_id"
+    )
+    return await analytics.load_daily_frame(rollups_collection(ledger, analytics_db), query, start_day, end_day)
+
+async def compute_period_comparison(
+    ledger: str, start_date: Optional[str], end_date: Optional[str], period: ComparisonPeriod
+):
+    start_day, end_day = await analytics_date_bounds(ledger, start_date, end_date)
+    frame = await load_analytics_frame(ledger, start_day, end_day)
+    with span("analytics"):
+        return analytics.period_comparison(frame, period.value)
+
+def rolling_load_start(start_date: Optional[str], window: int):
+    # Trailing windows need window - 1 days of history before the first visible day
+    if not start_date:
+        return None
+    return date.fromisoformat(start_date) - timedelta(days=window - 1)
+
+async def compute_rolling_statistics(ledger: str, start_date: Optional[str], end_date: Optional[str], window: int):
+    start_day, end_day = await analytics_date_bounds(ledger, start_date, end_date)
+    frame = await load_analytics_frame(ledger, rolling_load_start(start_date, window) or start_day, end_day)
+    with span("analytics"):
+        return analytics.rolling_statistics(frame, window, start_day)
+
+async def compute_cash_flow_projection(ledger: str, end_date: Optional[str], history_days: int, days: int):
+    _, end_day = await analytics_date_bounds(ledger, None, end_date)
+    end_day = end_day or date.today()
+    history_start = end_day - timedelta(days=history_days - 1)
+    income, expenses, _ = await summarize_with_rollups(
+        ledger, None, (history_start - timedelta(days=1)).isoformat(), database=analytics_db
+    )
+    frame = await load_analytics_frame(ledger, history_start, end_day)
+    with span("analytics"):
+        return analytics.cash_flow_projection(frame, income - expenses, days)
+
+def dashboard_pipeline(query, limit: int):
+    # One scan feeds all three dashboard views
+    return [
+        {"$match": query},
+        {"$facet": {
+            "transactions": [
+                {"$sort": dict(TRANSACTION_SORT)},
+                {"$limit": limit + 1},
+                {"$project": TRANSACTION_PROJECTION},
+            ],
+            "summary": summary_pipeline(query)[1:],
+            "chart": daily_rollup_pipeline() + [{"$sort": {"_id": 1}}],
+        }},
+    ]
+
+def etag_matches(request: Request, etag: str):
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    # Tags of compressed representations carry an encoding suffix
+    candidates = [strip_encoding_suffix(value.strip().removeprefix("W/")) for value in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+# Every write to a ledger bumps the counters of the months it touched in
+# `ledger_versions`. A cached range's version is the sum of the counters of
+# the months it covers, and it is folded into both the cache key and the
+# ETag, so a write invalidates exactly the ranges that include its date:
+# nothing is scanned or evicted on write, and stale entries age out of the
+# cache. The tags agree across workers and survive cache eviction, and a
+# revalidation is answered 304 after one _id lookup without reading the cache
+# or recomputing anything.
+async def range_version(ledger: str, start_date: Optional[str], end_date: Optional[str], database=None) -> int:
+    database = db if database is None else database
+    doc = await database.ledger_versions.find_one({"_id": ledger}, {"months": 1})
+    months = (doc or {}).get("months", {})
+    return sum(
+        count for month, count in months.items()
+        if (start_date is None or month >= start_date[:7]) and (end_date is None or month <= end_date[:7])
+    )
+
+async def invalidate_ledger_reads(ledger: str, dates):
+    months = {day.strftime("%Y-%m") for day in dates}
+    if months:
+        await db.ledger_versions.update_one(
+            {"_id": ledger}, {"$inc": {f"months.{month}": 1 for month in months}}, upsert=True
+        )
+
+def version_etag(key: str, version: int, variant: str = "") -> str:
+    return '"' + hashlib.sha1(f"{key}|{variant}|{version}".encode()).hexdigest() + '"'
+
+async def cached_response(request: Request, ledger: str, key: str, compute, render=None, variant: str = "", database=None):
+    # `render` turns the cached JSON-ready body into a non-JSON response;
+    # `variant` keeps the ETags of different renderings of one body apart
+    # The version is read once, before computing: a body is only ever stored
+    # and served under the version it was computed at. Entries left by writes
+    # that raced the computation sit under a key no later lookup uses
+    version = await range_version(ledger, *ResponseCache.date_range(key), database=database)
+    etag = version_etag(key, version, variant)
+    # no-cache lets browsers keep the body but revalidate it with If-None-Match
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    
+    versioned_key = ResponseCache.versioned_key(key, version)
+    entry = await response_cache.get(versioned_key)
+    if entry is None:
+        body = await compute()
+        with span("serialize"):
+            body = jsonable_encoder(body)
+        entry = await response_cache.set(versioned_key, body, etag)
+    if render:
+        return render(entry.body, headers)
+    return JSONResponse(entry.body, headers=headers)
+
+# Daily rollups: one document per calendar date in each ledger's `daily_rollups`, keyed by
+# the BSON date of the day and holding the income and expense totals (in minor
+# units) and the count for that day. Writes keep them current with $inc; rebuild_daily_rollups
+# recomputes them from scratch.
+def daily_rollup_deltas(transactions, direction: int = 1):
+    deltas = {}
+    for tx in transactions:
+        day = deltas.setdefault(tx['date'], {"income_minor": 0, "expense_minor": 0, "count": 0})
+        field = "income_minor" if tx['type'] == TransactionType.INCOME else "expense_minor"
+        day[field] += direction * tx['amount_minor']
+        day["count"] += direction
+    return deltas
+
+async def apply_daily_rollup_deltas(ledger: str, deltas):
+    if not deltas:
+        return
+    await rollups_collection(ledger).bulk_write(
+        [UpdateOne({"_id": tx_date}, {"$inc": inc}, upsert=True) for tx_date, inc in deltas.items()],
+        ordered=False
+    )
+    emptied = [tx_date for tx_date, inc in deltas.items() if inc["count"] < 0]
+    if emptied:
+        # Drop days whose last transaction was removed
+        await rollups_collection(ledger).delete_many({"_id": {"$in": emptied}, "count": {"$lte": 0}})
+
+async def apply_to_daily_rollups(ledger: str, transactions, direction: int = 1):
+    await apply_daily_rollup_deltas(ledger, daily_rollup_deltas(transactions, direction))
+
+def daily_rollup_pipeline():
+    return [
+        {"$group": {
+            "_id": "$date",
+            "income_minor": {"$sum": {"$cond": [{"$eq": ["$type", "income"]}, "$amount_minor", 0]}},
+            "expense_minor": {"$sum": {"$cond": [{"$eq": ["$type", "expense"]}, "$amount_minor", 0]}},
+            "count": {"$sum": 1},
+        }},
+    ]
+
+async def refresh_daily_rollups(ledger: str, days):
+    # Recompute specific days from transactions, for when deltas can't be trusted
+    days = list(days)
+    if not days:
+        return
+    transactions = transactions_collection(ledger)
+    live_days = await transactions.distinct("date", {"date": {"$in": days}})
+    await rollups_collection(ledger).delete_many({"_id": {"$in": [day for day in days if day not in live_days]}})
+    await transactions.aggregate(
+        [{"$match": {"date": {"$in": days}}}] + daily_rollup_pipeline() + [
+            {"$merge": {
+                "into": ledger_collection_name("daily_rollups", ledger),
+                "whenMatched": "replace",
+                "whenNotMatched": "insert",
+            }}
+        ]
+    ).to_list(None)
+
+async def rebuild_daily_rollups(ledger: str = DEFAULT_LEDGER):
+    # $out swaps the collection in atomically once the pipeline finishes
+    await transactions_collection(ledger).aggregate(
+        daily_rollup_pipeline() + [{"$out": ledger_collection_name("daily_rollups", ledger)}]
+    ).to_list(None)
+    # Archived days no longer have rows in MongoDB
+    archived_days = await read_archive(transaction_archive.daily_totals, ledger)
+    if archived_days:
+        await rollups_collection(ledger).insert_many(archived_days)
+    return await rollups_collection(ledger).count_documents({})
+
+async def migrate_amounts_to_minor_units(ledger: str = DEFAULT_LEDGER):
+    # Converts legacy float `amount` documents in place on the server, then
+    # rebuilds the rollups from the exact values
+    result = await transactions_collection(ledger).update_many(
+        {"amount": {"$exists": True}, "amount_minor": {"$exists": False}},
+        [
+            {"$set": {"amount_minor": {"$toLong": {"$round": [{"$multiply": ["$amount", 100]}, 0]}}}},
+            {"$unset": "amount"},
+        ]
+    )
+    await rebuild_daily_rollups(ledger)
+    return result.modified_count
+
+async def migrate_dates_to_bson(ledger: str = DEFAULT_LEDGER):
+    # Rewrites legacy ISO-string date/created_at fields as BSON dates in
+    # batches, then rebuilds the rollups so they are keyed by BSON dates too
+    transactions = transactions_collection(ledger)
+    migrated = 0
+    updates = []
+    cursor = transactions.find(
+        {"$or": [{"date": {"$type": "string"}}, {"created_at": {"$type": "string"}}]},
+        {"_id": 1, "date": 1, "created_at": 1}
+    )
+    async for doc in cursor:
+        fields = {}
+        if isinstance(doc.get("date"), str):
+            fields["date"] = to_mongo_date(date.fromisoformat(doc["date"][:10]))
+        if isinstance(doc.get("created_at"), str):
+            created_at = datetime.fromisoformat(doc["created_at"])
+            fields["created_at"] = created_at if created_at.tzinfo else created_at.replace(tzinfo=timezone.utc)
+        updates.append(UpdateOne({"_id": doc["_id"]}, {"$set": fields}))
+        if len(updates) == 1000:
+            migrated += (await transactions.bulk_write(updates, ordered=False)).modified_count
+            updates = []
+    if updates:
+        migrated += (await transactions.bulk_write(updates, ordered=False)).modified_count
+    await rebuild_daily_rollups(ledger)
+    return migrated
+
+async def check_daily_rollups(ledger: str = DEFAULT_LEDGER):
+    expected = {
+        row["_id"]: row
+        async for row in transactions_collection(ledger).aggregate(daily_rollup_pipeline())
+    }
+    expected.update((row["_id"], row) for row in await read_archive(transaction_archive.daily_totals, ledger))
+    actual = {row["_id"]: row async for row in rollups_collection(ledger).find({})}
+    
+    # Totals are integer minor units, so any difference is a real mismatch
+    fields = ("income_minor", "expense_minor", "count")
+    mismatches = []
+    for tx_date in sorted(set(expected) | set(actual)):
+        want = {k: expected.get(tx_date, {}).get(k, 0) for k in fields}
+        have = {k: actual.get(tx_date, {}).get(k, 0) for k in fields}
+        if want != have:
+            mismatches.append({"date": tx_date.date().isoformat(), "expected": want, "actual": have})
+    return mismatches
+
+# Period close: a closed month is frozen into one document in the ledger's
+# `period_snapshots` collection, keyed by the BSON date of its first day and
+# holding the month's totals, per-category totals, opening and closing
+# balance, and running totals over every closed month up to and including
+# it (`cumulative_*`). Months close in order, so the closed months always run unbroken
+# from the ledger's first month, and writes dated inside them are rejected
+# with 409 until the months are reopened. Close a month once its books are
+# final: a write that is already in flight when it closes is not detected.
+SNAPSHOT_TOTAL_FIELDS = ("income_minor", "expense_minor", "count")
+SNAPSHOT_TOTALS_PROJECTION = {
+    "_id": 1, "end": 1, **{field: 1 for field in SNAPSHOT_TOTAL_FIELDS},
+    **{f"cumulative_{field}": 1 for field in SNAPSHOT_TOTAL_FIELDS},
+}
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+def next_month(day: date) -> date:
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+def parse_period(period: str) -> date:
+    return date.fromisoformat(f"{period}-01")
+
+def snapshot_range_query(start_date: Optional[str] = None, end_date: Optional[str] = None):
+    # Snapshots of the months lying entirely within the range
+    query = {}
+    if start_date:
+        query["_id"] = {"$gte": to_mongo_date(date.fromisoformat(start_date))}
+    if end_date:
+        query["end"] = {"$lte": to_mongo_date(date.fromisoformat(end_date))}
+    return query
+
+def period_snapshot_pipeline(start_day: date, end_day: date):
+    return [
+        {"$match": {"date": {"$gte": to_mongo_date(start_day), "$lte": to_mongo_date(end_day)}}},
+        {"$group": {
+            "_id": {"type": "$type", "category": CATEGORY_KEY},
+            "total_minor": {"$sum": "$amount_minor"},
+            "count": {"$sum": 1},
+        }},
+        {"$sort": {"_id.type": 1, "total_minor": -1, "_id.category": 1}},
+    ]
+
+async def build_period_snapshot(ledger: str, month: date, previous: Optional[dict]):
+    # Totals come from the raw transactions rather than the rollups, so a
+    # snapshot is exact even if the rollups have drifted. `previous` is the
+    # snapshot of the month before, None for the first closed month
+    end_day = next_month(month) - timedelta(days=1)
+    categories = [
+        {"type": row["_id"]["type"], "category": row["_id"]["category"], "total_minor": row["total_minor"], "count": row["count"]}
+        async for row in transactions_collection(ledger).aggregate(period_snapshot_pipeline(month, end_day))
+    ]
+    income = sum(row["total_minor"] for row in categories if row["type"] == TransactionType.INCOME.value)
+    expenses = sum(row["total_minor"] for row in categories if row["type"] == TransactionType.EXPENSE.value)
+    count = sum(row["count"] for row in categories)
+    opening_balance_minor = previous["closing_balance_minor"] if previous else 0
+    return {
+        "_id": to_mongo_date(month),
+        "period": month.strftime("%Y-%m"),
+        "end": to_mongo_date(end_day),
+        "income_minor": income,
+        "expense_minor": expenses,
+        "count": count,
+        "cumulative_income_minor": (previous["cumulative_income_minor"] if previous else 0) + income,
+        "cumulative_expense_minor": (previous["cumulative_expense_minor"] if previous else 0) + expenses,
+        "cumulative_count": (previous["cumulative_count"] if previous else 0) + count,
+        "opening_balance_minor": opening_balance_minor,
+        "closing_balance_minor": opening_balance_minor + income - expenses,
+        "categories": categories,
+        "closed_at": datetime.now(timezone.utc),
+    }
+
+async def migrate_snapshot_totals(ledger: str = DEFAULT_LEDGER):
+    # Adds the running totals to snapshots closed before they were stored
+    snapshots = snapshots_collection(ledger)
+    cumulative = dict.fromkeys(SNAPSHOT_TOTAL_FIELDS, 0)
+    migrated = 0
+    async for doc in snapshots.find({}, SNAPSHOT_TOTALS_PROJECTION).sort("_id", ASCENDING):
+        for field in SNAPSHOT_TOTAL_FIELDS:
+            cumulative[field] += doc[field]
+        await snapshots.update_one(
+            {"_id": doc["_id"]}, {"$set": {f"cumulative_{field}": total for field, total in cumulative.items()}}
+        )
+        migrated += 1
+    return migrated
+
+async def last_snapshot(ledger: str):
+    return await snapshots_collection(ledger).find_one({}, {"categories": 0}, sort=[("_id", DESCENDING)])
+
+async def closed_through(ledger: str) -> Optional[datetime]:
+    # Last day of the last closed month, as a BSON date; None when nothing is closed
+    last = await last_snapshot(ledger)
+    return last["end"] if last else None
+
+async def close_periods(ledger: str, through: date):
+    # Close every open month up to and including the month of `through`
+    through = month_start(through)
+    if next_month(through) > date.today():
+        raise ValueError("Only months that have ended can be closed")
+    # Taken with the lock bulk imports hold per batch, so an import running in
+    # this worker sees the new close before writing its next batch
+    async with ledger_import_locks[ledger]:
+        previous = await last_snapshot(ledger)
+        if previous:
+            month = next_month(previous["_id"].date())
+        else:
+            first_day, _ = await rollup_date_bounds(ledger)
+            if first_day is None:
+                return []
+            month = month_start(first_day)
+        
+        snapshots = []
+        while month <= through:
+            snapshot = await build_period_snapshot(ledger, month, previous)
+            # The _id is the month, so a concurrent close of the same month fails here
+            await snapshots_collection(ledger).insert_one(snapshot)
+            snapshots.append(snapshot)
+            previous = snapshot
+            month = next_month(month)
+    return snapshots
+
+async def reopen_periods(ledger: str, start: date):
+    # Reopening a month also reopens every later one, since their opening
+    # balances depend on it
+    archived = await read_archive(transaction_archive.months, ledger)
+    if archived and month_start(start) <= archived[0]:
+        raise ValueError(f"Months through {archived[0].strftime('%Y-%m')} are archived and cannot be reopened")
+    result = await snapshots_collection(ledger).delete_many({"_id": {"$gte": to_mongo_date(month_start(start))}})
+    return result.deleted_count
+
+# Archival: a closed year moves out of MongoDB into the Parquet archive one
+# month at a time. Years go oldest first, so archived dates always precede
+# the hot ones. Each month's rows are flagged, written and checked before
+# they are deleted. A run interrupted between writing and deleting a month
+# shows that month twice until it is repeated, which is always safe. The flag
+# makes the change stream relay ask clients to resync instead of dropping the
+# rows from their dashboards.
+ARCHIVE_BATCH_SIZE = 5000
+ARCHIVE_PROJECTION = {"_id": 0, "id": 1, "type": 1, "amount_minor": 1, "description": 1, "category": 1, "date": 1, "created_at": 1}
+
+async def archive_year(ledger: str, year: int):
+    closed = await closed_through(ledger)
+    if not closed or closed.date() < date(year, 12, 31):
+        raise ValueError(f"{year} must be closed before it can be archived")
+    transactions = transactions_collection(ledger)
+    if await transactions.find_one({"date": {"$lt": to_mongo_date(date(year, 1, 1))}}, {"_id": 1}):
+        raise ValueError(f"Archive the years before {year} first")
+    
+    archived = 0
+    month = date(year, 1, 1)
+    while month.year == year:
+        month_query = {"date": {"$gte": to_mongo_date(month), "$lt": to_mongo_date(next_month(month))}}
+        await transactions.update_many(month_query, {"$set": {"archived": True}})
+        # The partition is written in the archive's sort order, a batch at a time
+        cursor = transactions.find(month_query, ARCHIVE_PROJECTION).sort(TRANSACTION_SORT)
+        documents = await cursor.to_list(ARCHIVE_BATCH_SIZE)
+        if documents:
+            writer = await asyncio.to_thread(transaction_archive.open_month, ledger, month)
+            try:
+                while documents:
+                    await asyncio.to_thread(writer.write, documents)
+                    archived += len(documents)
+                    documents = await cursor.to_list(ARCHIVE_BATCH_SIZE)
+                await asyncio.to_thread(writer.close)
+            except BaseException:
+                await asyncio.to_thread(writer.abort)
+                raise
+            # The month is closed, so nothing new can have been dated in it meanwhile
+            await transactions.delete_many(month_query)
+        month = next_month(month)
+    
+    if archived:
+        # Reads return the same results as before, so cached responses stay valid
+        reload_search_terms(ledger)
+        event_broker.publish_local(ledger, resync=True)
+    return archived
+
+def closed_period_message(closed: datetime) -> str:
+    return f"Periods through {closed.date().isoformat()} are closed; reopen them to change transactions dated in them"
+
+def period_closed_error(closed: datetime):
+    return HTTPException(status_code=409, detail=closed_period_message(closed))
+
+async def reject_closed_dates(ledger: str, dates):
+    closed = await closed_through(ledger)
+    if closed and any(tx_date <= closed for tx_date in dates):
+        raise period_closed_error(closed)
+
+async def reject_closed_matches(ledger: str, query):
+    closed = await closed_through(ledger)
+    if closed and await transactions_collection(ledger).find_one(
+        {"$and": [query, {"date": {"$lte": closed}}]}, {"_id": 1}
+    ):
+        raise period_closed_error(closed)
+
+def period_snapshot_row(doc):
+    return PeriodSnapshot(
+        period=doc["period"],
+        start_date=doc["_id"].date(),
+        end_date=doc["end"].date(),
+        total_income=from_minor_units(doc["income_minor"]),
+        total_expenses=from_minor_units(doc["expense_minor"]),
+        net_profit=from_minor_units(doc["income_minor"] - doc["expense_minor"]),
+        transaction_count=doc["count"],
+        opening_balance=from_minor_units(doc["opening_balance_minor"]),
+        closing_balance=from_minor_units(doc["closing_balance_minor"]),
+        categories=[
+            PeriodCategoryTotal(
+                type=row["type"], category=row["category"], total=from_minor_units(row["total_minor"]), count=row["count"]
+            )
+            for row in doc.get("categories", [])
+        ],
+        closed_at=doc["closed_at"]
+    )
+
+# Indexes provisioned for every ledger's transactions collection at startup
+# (or on a new ledger's first write). create_indexes is a no-op for indexes
+# that already exist with the same definition, so this is safe on every boot.
+TRANSACTION_INDEXES = [
+    # Point lookups and deletes by public id
+    IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+    # Keyset pagination order, with and without a type filter
+    IndexModel(TRANSACTION_SORT, name="date_created_at_id"),
+    IndexModel([("type", ASCENDING)] + TRANSACTION_SORT, name="type_date_created_at_id"),
+    # Date-range aggregations (summary, rollup rebuild, category breakdown)
+    # covered by the index
+    IndexModel(
+        [("date", ASCENDING), ("type", ASCENDING), ("amount_minor", ASCENDING), ("category", ASCENDING)],
+        name="date_type_amount_minor_category"
+    ),
+    # Full-text search for GET /transactions?q=
+    IndexModel(
+        [("description", TEXT), ("category", TEXT)],
+        name="description_category_text",
+        weights={"description": 2, "category": 1}
+    ),
+]
+
+async def ensure_indexes(ledger: str = DEFAULT_LEDGER):
+    await transactions_collection(ledger).create_indexes(TRANSACTION_INDEXES)
+
+def describe_plan(plan):
+    # Flatten a winning plan tree into its stage names and the indexes it uses
+    stages, indexes = [], []
+    pending = [plan]
+    while pending:
+        node = pending.pop()
+        stages.append(node.get("stage"))
+        if node.get("indexName"):
+            indexes.append(node["indexName"])
+        if "inputStage" in node:
+            pending.append(node["inputStage"])
+        pending.extend(node.get("inputStages", []))
+    return {
+        "stages": stages,
+        "indexes": indexes,
+        "collection_scan": "COLLSCAN" in stages,
+    }
+
+def winning_plan(explain):
+    # Aggregations wrap the find-layer plan in a $cursor stage unless the
+    # whole pipeline was pushed down into the query layer
+    if "queryPlanner" in explain:
+        planner = explain["queryPlanner"]
+    else:
+        planner = explain["stages"][0]["$cursor"]["queryPlanner"]
+    plan = planner["winningPlan"]
+    # Slot-based execution engine nests the classic plan one level down
+    return plan.get("queryPlan", plan)
+
+async def explain_find(collection: str, query, sort=None, limit=None):
+    explain = await db.command(
+        "explain",
+        {"find": collection, "filter": query, "sort": dict(sort or []), "limit": limit or 0},
+        verbosity="queryPlanner"
+    )
+    return describe_plan(winning_plan(explain))
+
+async def explain_command_stats(command):
+    # executionStats for a captured find/aggregate, used by ?profile=1 reports
+    explain = await db.command("explain", command, verbosity="executionStats")
+    if "executionStats" in explain:
+        return explain["executionStats"]
+    return explain["stages"][0]["$cursor"]["executionStats"]
+
+async def explain_aggregate(collection: str, pipeline):
+    explain = await db.command(
+        "explain",
+        {"aggregate": collection, "pipeline": pipeline, "cursor": {}},
+        verbosity="queryPlanner"
+    )
+    return describe_plan(winning_plan(explain))
+
+# Bulk ingest: the request body is consumed as a stream of lines, each row
+# is validated on its own and valid rows are flushed with unordered
+# insert_many once a batch fills up. Only one batch is buffered while the
+# previous one is being written, so memory does not grow with upload size.
+MAX_REPORTED_ROW_ERRORS = 1000
+
+async def iter_body_lines(request: Request):
+    buffer = b""
+    # Spreadsheet exports often start with a UTF-8 byte order mark
+    first_line = True
+    async for chunk in request.stream():
+        buffer += chunk
+        lines = buffer.split(b"\n")
+        buffer = lines.pop()
+        for line in lines:
+            if first_line:
+                line = line.removeprefix(codecs.BOM_UTF8)
+                first_line = False
+            yield line.rstrip(b"\r")
+    if buffer:
+        yield (buffer.removeprefix(codecs.BOM_UTF8) if first_line else buffer).rstrip(b"\r")
+
+async def iter_bulk_rows(request: Request, upload_format: BulkFormat):
+    # Yields (row number, parsed row or parse error) for every non-blank line
+    header = None
+    row_number = 0
+    async for line in iter_body_lines(request):
+        if not line.strip():
+            continue
+        if upload_format == BulkFormat.CSV and header is None:
+            header = [name.strip() for name in next(csv.reader([line.decode("utf-8")]))]
+            continue
+        row_number += 1
+        try:
+            # Decoded per line so one bad byte sequence only fails its own row
+            line = line.decode("utf-8")
+            if upload_format == BulkFormat.CSV:
+                values = next(csv.reader([line]))
+                # Empty cells mean "not provided" so optional fields stay None
+                yield row_number, {name: value for name, value in zip(header, values) if value != ""}
+            else:
+                yield row_number, json.loads(line)
+        except ValueError as e:
+            yield row_number, e
+
+def detect_bulk_format(request: Request, upload_format: Optional[BulkFormat]):
+    if upload_format:
+        return upload_format
+    content_type = request.headers.get("content-type", "")
+    if "csv" in content_type:
+        return BulkFormat.CSV
+    return BulkFormat.NDJSON
+
+async def insert_bulk_batch(ledger: str, batch, row_numbers):
+    # Returns (inserted documents, row errors) for one unordered insert_many
+    try:
+        await transactions_collection(ledger).insert_many(batch, ordered=False)
+        return batch, []
+    except BulkWriteError as e:
+        failed = {error["index"]: error["errmsg"] for error in e.details["writeErrors"]}
+        inserted = [doc for index, doc in enumerate(batch) if index not in failed]
+        errors = [BulkRowError(row=row_numbers[index], error=message) for index, message in failed.items()]
+        return inserted, errors
+
+# Streaming export: rows are pulled from the Motor cursor in batches of
+# EXPORT_BATCH_SIZE and encoded chunk by chunk, so only one chunk (or one
+# Parquet row group) is held in memory at a time.
+EXPORT_FIELDS = ["id", "type", "amount", "description", "category", "date", "created_at"]
+EXPORT_BATCH_SIZE = 5000
+EXPORT_ROW_GROUP_SIZE = 50000
+EXPORT_MEDIA_TYPES = {
+    ExportFormat.NDJSON: "application/x-ndjson",
+    ExportFormat.CSV: "text/csv",
+    ExportFormat.PARQUET: "application/vnd.apache.parquet",
+}
+
+def export_row(tx):
+    row = {field: tx.get(field) for field in EXPORT_FIELDS if field != "amount"}
+    row['amount'] = from_minor_units(tx['amount_minor'])
+    row['date'] = tx['date'].date()
+    return row
+
+async def iter_export_batches(ledger: str, query, rows_per_batch: int):
+    projection = {field: 1 for field in EXPORT_FIELDS if field != "amount"}
+    projection.update({"amount_minor": 1, "_id": 0})
+    cursor = transactions_collection(ledger).find(query, projection).sort(TRANSACTION_SORT).batch_size(EXPORT_BATCH_SIZE)
+    batch = []
+    async for tx in cursor:
+        batch.append(export_row(tx))
+        if len(batch) >= rows_per_batch:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+    
+    # Archived rows are older than any hot row, so they follow in sort order
+    if await read_archive(transaction_archive.partitions, ledger, query):
+        archived = transaction_archive.iter_documents(ledger, query, rows_per_batch)
+        while (documents := await asyncio.to_thread(next, archived, None)) is not None:
+            yield [export_row(tx) for tx in documents]
+
+async def export_ndjson(ledger: str, query):
+    async for batch in iter_export_batches(ledger, query, EXPORT_BATCH_SIZE):
+        # orjson writes dates and datetimes as ISO 8601; Decimal falls back to str
+        yield b"".join(orjson.dumps(tx, default=str) + b"\n" for tx in batch)
+
+async def export_csv(ledger: str, query):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    async for batch in iter_export_batches(ledger, query, EXPORT_BATCH_SIZE):
+        writer.writerows({**tx, "created_at": tx["created_at"].isoformat()} for tx in batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate(0)
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+class ExportSink:
+    # Write-only file object that hands finished bytes back to the generator
+    # while keeping the absolute offset the Parquet writer records in footers
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+async def export_parquet(ledger: str, query):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    schema = pa.schema([
+        ("id", pa.string()),
+        ("type", pa.string()),
+        ("amount", pa.decimal128(18, 2)),
+        ("description", pa.string()),
+        ("category", pa.string()),
+        ("date", pa.date32()),
+        ("created_at", pa.timestamp("ms", tz="UTC")),
+    ])
+    sink = ExportSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema, compression="zstd")
+    async for batch in iter_export_batches(ledger, query, EXPORT_ROW_GROUP_SIZE):
+        writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+EXPORT_WRITERS = {
+    ExportFormat.NDJSON: export_ndjson,
+    ExportFormat.CSV: export_csv,
+    ExportFormat.PARQUET: export_parquet,
+}
+
+# Live updates: GET /stream is a server-sent event stream of one ledger's
+# coalesced write batches. Each message carries the inserted rows, deleted
+# ids, per-day deltas and the ledger's all-time totals, so dashboards patch their state instead of
+# refetching. Batches larger than LIVE_UPDATE_MAX_ROWS only carry the deltas
+# plus a resync flag.
+LIVE_UPDATE_MAX_ROWS = int(os.environ.get('LIVE_UPDATE_MAX_ROWS', '100'))
+LIVE_KEEPALIVE_SECONDS = 15
+LIVE_RETRY_MS = 3000
+
+def format_day_delta(tx_date, delta):
+    return {
+        "date": tx_date.date().isoformat(),
+        "income": str(from_minor_units(delta["income_minor"])),
+        "expenses": str(from_minor_units(delta["expense_minor"])),
+        "count": delta["count"],
+    }
+
+async def render_live_update(ledger: str, inserted, deleted, resync):
+    days = daily_rollup_deltas(inserted)
+    for tx_date, delta in daily_rollup_deltas(deleted, direction=-1).items():
+        day = days.setdefault(tx_date, {"income_minor": 0, "expense_minor": 0, "count": 0})
+        for field, value in delta.items():
+            day[field] += value
+    
+    resync = resync or len(inserted) + len(deleted) > LIVE_UPDATE_MAX_ROWS
+    totals = await compute_transaction_summary(ledger, None, None, SummaryMode.ROLLUP)
+    return {
+        "resync": resync,
+        "inserted": [] if resync else [transaction_row(tx) for tx in inserted],
+        "deleted": [] if resync else [tx['id'] for tx in deleted],
+        "days": [format_day_delta(tx_date, delta) for tx_date, delta in sorted(days.items())],
+        "totals": jsonable_encoder(totals),
+    }
+
+event_broker = EventBroker(render_live_update)
+change_stream_relay = None
+
+async def enable_change_pre_images(ledger: str):
+    try:
+        # Pre-images let the change stream report what a delete removed (MongoDB 6.0+)
+        await db.command(
+            "collMod", ledger_collection_name("transactions", ledger),
+            changeStreamPreAndPostImages={"enabled": True}
+        )
+    except OperationFailure:
+        pass
+
+async def start_live_updates():
+    global change_stream_relay
+    # One database-wide stream covers every ledger's transactions collection
+    change_stream_relay = ChangeStreamRelay(db, event_broker, ledger_for_collection)
+    return await change_stream_relay.start()
+
+async def stop_live_updates():
+    if change_stream_relay:
+        await change_stream_relay.stop()
+
+async def record_inserted_transactions(ledger: str, transactions):
+    await apply_to_daily_rollups(ledger, transactions)
+    await invalidate_ledger_reads(ledger, [doc['date'] for doc in transactions])
+    event_broker.publish_local(ledger, inserted=transactions)
+    record_search_terms(ledger, transactions)
+
+async def write_transactions(ledger: str, transactions):
+    # One insert_many plus one rollup/cache/event update for a coalesced
+    # batch; returns an error message per document, None where it was written
+    try:
+        await transactions_collection(ledger).insert_many(transactions, ordered=False)
+        failed = {}
+    except BulkWriteError as e:
+        failed = {error["index"]: error["errmsg"] for error in e.details["writeErrors"]}
+    written = [tx for index, tx in enumerate(transactions) if index not in failed]
+    if written:
+        await record_inserted_transactions(ledger, written)
+    return [failed.get(index) for index in range(len(transactions))]
+
+# With WRITE_COALESCE_MS set, concurrent single creates are gathered for that
+# long and written together; see writes.py. Off by default, since a lone
+# create then waits out the whole window.
+WRITE_COALESCE_MS = float(os.environ.get('WRITE_COALESCE_MS', '0'))
+WRITE_COALESCE_MAX_BATCH = int(os.environ.get('WRITE_COALESCE_MAX_BATCH', '500'))
+insert_coalescer = (
+    InsertCoalescer(write_transactions, WRITE_COALESCE_MS / 1000, WRITE_COALESCE_MAX_BATCH)
+    if WRITE_COALESCE_MS > 0 else None
+)
+
+async def insert_transaction(ledger: str, transaction_dict):
+    if insert_coalescer:
+        await insert_coalescer.submit(ledger, transaction_dict)
+        return
+    await transactions_collection(ledger).insert_one(transaction_dict)
+    await record_inserted_transactions(ledger, [transaction_dict])
+
+# Idempotency-Key: the first request with a key claims it in
+# `idempotency_keys` (unique per ledger and key) along with a hash of its
+# body and the id it is about to insert. Retries with the same key and body
+# get the stored transaction back instead of a duplicate. Claims expire after
+# IDEMPOTENCY_TTL_SECONDS through a TTL index.
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', str(24 * 60 * 60)))
+
+async def ensure_idempotency_indexes():
+    await db.idempotency_keys.create_indexes([
+        IndexModel([("ledger", ASCENDING), ("key", ASCENDING)], name="ledger_key_unique", unique=True),
+        IndexModel([("created_at", ASCENDING)], name="created_at_ttl", expireAfterSeconds=IDEMPOTENCY_TTL_SECONDS),
+    ])
+
+def request_fingerprint(transaction: TransactionCreate) -> str:
+    return hashlib.sha256(orjson.dumps(jsonable_encoder(transaction), option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+async def claim_idempotency_key(ledger: str, key: str, fingerprint: str, transaction_id: str):
+    # Returns None when this request now owns the key, otherwise the
+    # response to replay for the request that got there first
+    try:
+        await db.idempotency_keys.insert_one({
+            "ledger": ledger,
+            "key": key,
+            "fingerprint": fingerprint,
+            "transaction_id": transaction_id,
+            "created_at": datetime.now(timezone.utc),
+        })
+        return None
+    except DuplicateKeyError:
+        claim = await db.idempotency_keys.find_one({"ledger": ledger, "key": key})
+    
+    if claim is None:
+        raise HTTPException(status_code=409, detail="Idempotency-Key expired while in use; retry the request")
+    if claim["fingerprint"] != fingerprint:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request body")
+    existing = await transactions_collection(ledger).find_one({"id": claim["transaction_id"]}, TRANSACTION_PROJECTION)
+    if existing is None:
+        raise HTTPException(
+            status_code=409, detail="The request with this Idempotency-Key is still in progress or its transaction was deleted"
+        )
+    return ORJSONResponse(transaction_row(existing), headers={"Idempotent-Replayed": "true"})
+
+async def release_idempotency_key(ledger: str, key: str, transaction_id: str):
+    # Lets the client retry a create that failed after claiming its key
+    await db.idempotency_keys.delete_one({"ledger": ledger, "key": key, "transaction_id": transaction_id})
+
 # Routes
 @api_router.get("/")
 async def root():
     return {"message": "Balance Sheet API"}
 
+@api_router.get("/ledgers")
+async def get_ledgers():
+    return {"ledgers": await list_ledgers()}
+
 @api_router.post("/transactions", response_model=Transaction)
-async def create_transaction(transaction: TransactionCreate):
+async def create_transaction(
+    transaction: TransactionCreate,
+    ledger: Ledger,
+    idempotency_key: Optional[str] = Header(None, min_length=1, max_length=255)
+):
     try:
-        # Create transaction object
-        transaction_obj = Transaction(**transaction.dict())
+        await provision_ledger(ledger)
+        
+        # Create transaction object and prepare it for MongoDB storage
+        with span("validate"):
+            transaction_obj = Transaction(**transaction.dict(), ledger=ledger)
+            transaction_dict = prepare_for_mongo(transaction_obj.dict())
+            # BSON dates hold milliseconds; truncate now so the response matches what is stored
+            created_at = transaction_dict['created_at']
+            transaction_dict['created_at'] = created_at.replace(microsecond=created_at.microsecond // 1000 * 1000)
         
-        # Prepare for MongoDB storage
-        transaction_dict = prepare_for_mongo(transaction_obj.dict())
+        await reject_closed_dates(ledger, [transaction_dict['date']])
+        
+        if idempotency_key:
+            replay = await claim_idempotency_key(
+                ledger, idempotency_key, request_fingerprint(transaction), transaction_obj.id
+            )
+            if replay:
+                return replay
         
         # Insert into database
-        result = await db.transactions.insert_one(transaction_dict)
+        try:
+            await insert_transaction(ledger, transaction_dict)
+        except Exception:
+            if idempotency_key:
+                await release_idempotency_key(ledger, idempotency_key, transaction_obj.id)
+            raise
+        # Serialized like the reads and idempotent replays, from the stored document
+        return ORJSONResponse(transaction_row(transaction_dict))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Bulk imports write through a ledger-wide lock and a shared pool of write
+# slots, so one ledger's large import is serialised with itself and leaves
+# most of the connection pool to everyone else's reads
+BULK_WRITE_SLOTS = int(os.environ.get('BULK_WRITE_SLOTS', str(max(1, MONGO_MAX_POOL_SIZE // 4))))
+bulk_write_slots = asyncio.Semaphore(BULK_WRITE_SLOTS)
+ledger_import_locks = defaultdict(asyncio.Lock)
+
+@api_router.post("/transactions/bulk", response_model=BulkIngestResult)
+async def bulk_create_transactions(
+    request: Request,
+    ledger: Ledger,
+    upload_format: Optional[BulkFormat] = Query(None, alias="format"),
+    batch_size: int = Query(1000, ge=1, le=50000)
+):
+    upload_format = detect_bulk_format(request, upload_format)
+    inserted = 0
+    failed = 0
+    errors = []
+    
+    def record_errors(row_errors):
+        nonlocal failed
+        failed += len(row_errors)
+        errors.extend(row_errors[:MAX_REPORTED_ROW_ERRORS - len(errors)])
+    
+    async def flush(batch, row_numbers):
+        nonlocal inserted
+        async with ledger_import_locks[ledger], bulk_write_slots:
+            # Checked per batch under the lock close_periods takes, so a close
+            # that runs during a long upload applies to the remaining rows
+            closed = await closed_through(ledger)
+            if closed:
+                rejected = [row for doc, row in zip(batch, row_numbers) if doc['date'] <= closed]
+                record_errors([BulkRowError(row=row, error=closed_period_message(closed)) for row in rejected])
+                kept = [(doc, row) for doc, row in zip(batch, row_numbers) if doc['date'] > closed]
+                batch, row_numbers = [doc for doc, _ in kept], [row for _, row in kept]
+            written, row_errors = await insert_bulk_batch(ledger, batch, row_numbers) if batch else ([], [])
+            await apply_to_daily_rollups(ledger, written)
+        await invalidate_ledger_reads(ledger, [doc['date'] for doc in written])
+        event_broker.publish_local(ledger, inserted=written)
+        record_search_terms(ledger, written)
+        inserted += len(written)
+        record_errors(row_errors)
+    
+    try:
+        await provision_ledger(ledger)
+        batch, row_numbers = [], []
+        pending = None
+        async for row_number, row in iter_bulk_rows(request, upload_format):
+            try:
+                with span("validate"):
+                    if isinstance(row, Exception):
+                        raise row
+                    transaction_obj = Transaction(**TransactionCreate(**row).dict(), ledger=ledger)
+                    transaction_dict = prepare_for_mongo(transaction_obj.dict())
+                    batch.append(transaction_dict)
+            except Exception as e:
+                record_errors([BulkRowError(row=row_number, error=str(e))])
+                continue
+            
+            row_numbers.append(row_number)
+            if len(batch) >= batch_size:
+                # Keep parsing the next batch while this one is written
+                if pending:
+                    await pending
+                pending = asyncio.create_task(flush(batch, row_numbers))
+                batch, row_numbers = [], []
+        
+        if pending:
+            await pending
+        if batch:
+            await flush(batch, row_numbers)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        # A batch already handed to MongoDB finishes (rollups included) before
+        # the response goes out, and its error is collected rather than lost
+        if pending:
+            await asyncio.gather(pending, return_exceptions=True)
+    
+    return BulkIngestResult(inserted=inserted, failed=failed, errors=errors)
+
+@api_router.post("/transactions/batch-delete", response_model=BatchDeleteResult)
+async def batch_delete_transactions(batch: BatchDeleteRequest, ledger: Ledger):
+    try:
+        query = build_batch_query(batch.ids, batch.filter)
+        await reject_closed_matches(ledger, query)
+        transactions = transactions_collection(ledger)
+        
+        # Per-day totals of the rows about to go, grouped on the server
+        days = {
+            row["_id"]: row
+            async for row in transactions.aggregate([{"$match": query}] + daily_rollup_pipeline())
+        }
+        result = await transactions.delete_many(query)
         
-        if result.inserted_id:
-            return transaction_obj
+        if result.deleted_count == sum(day["count"] for day in days.values()):
+            await apply_daily_rollup_deltas(ledger, {
+                tx_date: {"income_minor": -day["income_minor"], "expense_minor": -day["expense_minor"], "count": -day["count"]}
+                for tx_date, day in days.items()
+            })
         else:
-            raise HTTPException(status_code=500, detail="Failed to create transaction")
+            # A concurrent write touched the matched rows; recount the affected days
+            await refresh_daily_rollups(ledger, days)
+        await invalidate_ledger_reads(ledger, days)
+        if result.deleted_count:
+            event_broker.publish_local(ledger, resync=True)
+            reload_search_terms(ledger)
+        return BatchDeleteResult(deleted=result.deleted_count)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@api_router.get("/transactions", response_model=List[Transaction])
-async def get_transactions(
+@api_router.patch("/transactions/bulk", response_model=BulkUpdateResult)
+async def bulk_update_transactions(update: BulkUpdateRequest, ledger: Ledger):
+    try:
+        query = build_batch_query(update.ids, update.filter)
+        await reject_closed_matches(ledger, query)
+        transactions = transactions_collection(ledger)
+        
+        # Days of the matched rows, so only the months they fall in are invalidated
+        days = await transactions.distinct("date", query)
+        result = await transactions.update_many(query, {"$set": {"category": update.category}})
+        
+        await invalidate_ledger_reads(ledger, days)
+        if result.modified_count:
+            event_broker.publish_local(ledger, resync=True)
+            reload_search_terms(ledger)
+        return BulkUpdateResult(matched=result.matched_count, modified=result.modified_count)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@api_router.get("/dashboard", response_model=DashboardData)
+async def get_dashboard(
+    ledger: Ledger,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    transaction_type: Optional[TransactionType] = None
+    limit: int = Query(100, ge=1, le=1000),
+    chart_format: ChartFormat = ChartFormat.JSON
 ):
     try:
+        if chart_format not in (ChartFormat.JSON, ChartFormat.COLUMNAR):
+            raise ValueError("The dashboard chart is JSON; use chart_format=json or columnar")
+        
         # Build query filters
-        query = {}
+        query = build_date_query(start_date, end_date)
+        
+        results = await transactions_collection(ledger).aggregate(dashboard_pipeline(query, limit), allowDiskUse=True).to_list(1)
+        facets = results[0]
+        
+        transactions = facets["transactions"]
+        totals = facets["summary"][0] if facets["summary"] else {}
+        total_income = totals.get("total_income", 0)
+        total_expenses = totals.get("total_expenses", 0)
+        transaction_count = totals.get("transaction_count", 0)
+        chart_days = facets["chart"]
+        
+        if await read_archive(transaction_archive.partitions, ledger, query):
+            # Archived days all precede the hot ones: they extend the page and open the chart
+            if len(transactions) <= limit:
+                transactions += await read_archive(transaction_archive.find, ledger, query, limit + 1 - len(transactions))
+            archived_days = await read_archive(transaction_archive.daily_totals, ledger, query)
+            total_income += sum(day["income_minor"] for day in archived_days)
+            total_expenses += sum(day["expense_minor"] for day in archived_days)
+            transaction_count += sum(day["count"] for day in archived_days)
+            chart_days = archived_days + chart_days
         
-        if start_date or end_date:
-            date_filter = {}
-            if start_date:
-                date_filter["$gte"] = start_date
-            if end_date:
-                date_filter["$lte"] = end_date
-            query["date"] = date_filter
+        has_more = len(transactions) > limit
+        transactions = transactions[:limit]
+        next_cursor = encode_cursor(transactions[-1]) if has_more else None
+        
+        summary = build_summary(total_income, total_expenses, transaction_count)
+        with span("serialize"):
+            return ORJSONResponse({
+                "transactions": {
+                    "items": [transaction_row(tx) for tx in transactions],
+                    "next_cursor": next_cursor,
+                },
+                "summary": jsonable_encoder(summary),
+                "chart": (
+                    format_columnar_chart(chart_days) if chart_format == ChartFormat.COLUMNAR
+                    else format_chart_data(chart_days)
+                ),
+            })
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@api_router.get("/transactions/export")
+async def export_transactions(
+    ledger: Ledger,
+    export_format: ExportFormat = Query(ExportFormat.NDJSON, alias="format"),
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    transaction_type: Optional[TransactionType] = None
+):
+    # Build query filters; errors must surface before the stream starts
+    try:
+        query = build_date_query(start_date, end_date)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if transaction_type:
+        query["type"] = transaction_type
+    
+    return StreamingResponse(
+        EXPORT_WRITERS[export_format](ledger, query),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="transactions.{export_format.value}"'}
+    )
+
+@api_router.get("/transactions", response_model=TransactionPage)
+async def get_transactions(
+    ledger: Ledger,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    transaction_type: Optional[TransactionType] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    q: Optional[str] = Query(None, min_length=1, max_length=200)
+):
+    try:
+        # Build query filters
+        query = build_date_query(start_date, end_date)
         
         if transaction_type:
             query["type"] = transaction_type
         
-        # Fetch transactions
-        transactions = await db.transactions.find(query).sort("date", -1).to_list(1000)
+        if q:
+            # Matches whole (stemmed) words in description or category;
+            # prefix matching is what /transactions/suggest is for
+            query["$text"] = {"$search": q}
+        
+        if cursor:
+            query = {"$and": [query, build_seek_query(cursor)]}
         
-        # Parse from MongoDB and return
-        parsed_transactions = [parse_from_mongo(tx) for tx in transactions]
-        return [Transaction(**tx) for tx in parsed_transactions]
+        # Fetch one extra row to learn whether another page follows
+        transactions = await transactions_collection(ledger).find(query, TRANSACTION_PROJECTION).sort(TRANSACTION_SORT).to_list(limit + 1)
+        if len(transactions) <= limit and await read_archive(transaction_archive.partitions, ledger, query):
+            # Archived rows are older than any hot row, so the archive continues the page
+            transactions += await read_archive(transaction_archive.find, ledger, query, limit + 1 - len(transactions))
+        has_more = len(transactions) > limit
+        transactions = transactions[:limit]
+        next_cursor = encode_cursor(transactions[-1]) if has_more else None
+        
+        with span("serialize"):
+            return ORJSONResponse({
+                "items": [transaction_row(tx) for tx in transactions],
+                "next_cursor": next_cursor,
+            })
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@api_router.get("/transactions/suggest")
+async def suggest_transactions(
+    ledger: Ledger,
+    prefix: str = Query("", max_length=64),
+    limit: int = Query(10, ge=1, le=10)
+):
+    return search_index_for(ledger).suggest(prefix, limit)
+
 @api_router.get("/transactions/summary", response_model=TransactionSummary)
 async def get_transaction_summary(
+    request: Request,
+    ledger: Ledger,
     start_date: Optional[str] = None,
-    end_date: Optional[str] = None
+    end_date: Optional[str] = None,
+    mode: SummaryMode = SummaryMode.ROLLUP
 ):
     try:
-        # Build query filters
-        query = {}
-        
-        if start_date or end_date:
-            date_filter = {}
-            if start_date:
-                date_filter["$gte"] = start_date
-            if end_date:
-                date_filter["$lte"] = end_date
-            query["date"] = date_filter
-        
-        # Fetch all transactions
-        transactions = await db.transactions.find(query).to_list(None)
-        
-        # Calculate summary
-        total_income = sum(tx['amount'] for tx in transactions if tx['type'] == 'income')
-        total_expenses = sum(tx['amount'] for tx in transactions if tx['type'] == 'expense')
-        net_profit = total_income - total_expenses
-        transaction_count = len(transactions)
-        
-        return TransactionSummary(
-            total_income=total_income,
-            total_expenses=total_expenses,
-            net_profit=net_profit,
-            transaction_count=transaction_count
+        # Parity modes always hit the database
+        if mode != SummaryMode.ROLLUP:
+            return await compute_transaction_summary(ledger, start_date, end_date, mode)
+        
+        key = response_cache.key(ledger, "summary", start_date, end_date)
+        return await cached_response(
+            request, ledger, key, lambda: compute_transaction_summary(ledger, start_date, end_date, mode)
         )
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @api_router.delete("/transactions/{transaction_id}")
-async def delete_transaction(transaction_id: str):
+async def delete_transaction(transaction_id: str, ledger: Ledger):
     try:
-        result = await db.transactions.delete_one({"id": transaction_id})
-        if result.deleted_count:
+        await reject_closed_matches(ledger, {"id": transaction_id})
+        deleted = await transactions_collection(ledger).find_one_and_delete({"id": transaction_id})
+        if deleted:
+            await apply_to_daily_rollups(ledger, [deleted], direction=-1)
+            await invalidate_ledger_reads(ledger, [deleted['date']])
+            event_broker.publish_local(ledger, deleted=[deleted])
+            record_search_terms(ledger, [deleted], direction=-1)
             return {"message": "Transaction deleted successfully"}
         else:
             raise HTTPException(status_code=404, detail="Transaction not found")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@api_router.get("/transactions/by-category", response_model=CategoryBreakdown)
+async def get_category_breakdown(
+    request: Request,
+    ledger: Ledger,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    transaction_type: Optional[TransactionType] = None,
+    top_n: int = Query(10, ge=1, le=100)
+):
+    try:
+        # Build query filters
+        query = build_date_query(start_date, end_date)
+        
+        if transaction_type:
+            query["type"] = transaction_type
+        
+        key = response_cache.key(ledger, "by-category", start_date, end_date, transaction_type and transaction_type.value, top_n)
+        return await cached_response(
+            request, ledger, key, lambda: compute_category_breakdown(ledger, query, top_n)
+        )
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @api_router.get("/transactions/chart-data")
 async def get_chart_data(
+    request: Request,
+    ledger: Ledger,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    granularity: ChartGranularity = ChartGranularity.DAY,
+    fill_gaps: bool = False,
+    cumulative: bool = False,
+    max_points: int = Query(CHART_MAX_POINTS, ge=2, le=10000),
+    chart_format: ChartFormat = Query(ChartFormat.JSON, alias="format")
+):
+    try:
+        # The binary formats render the cached columnar body
+        columnar = chart_format != ChartFormat.JSON
+        # Cumulative balances carry every earlier write, so their range is
+        # open at the start and the requested start moves into the extras
+        key = response_cache.key(
+            ledger, "chart-data", None if cumulative else start_date, end_date,
+            start_date, granularity.value, fill_gaps, cumulative, max_points, columnar
+        )
+        return await cached_response(
+            request, ledger, key,
+            lambda: compute_chart_data(ledger, start_date, end_date, granularity, fill_gaps, cumulative, max_points, columnar),
+            render=CHART_RENDERERS.get(chart_format),
+            variant=chart_format.value
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@api_router.get("/analytics/period-comparison")
+async def get_period_comparison(
+    request: Request,
+    ledger: Ledger,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    period: ComparisonPeriod = ComparisonPeriod.MONTH
+):
+    try:
+        key = response_cache.key(ledger, "analytics-periods", start_date, end_date, period.value)
+        return await cached_response(
+            request, ledger, key, lambda: compute_period_comparison(ledger, start_date, end_date, period),
+            database=analytics_db
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@api_router.get("/analytics/rolling")
+async def get_rolling_statistics(
+    request: Request,
+    ledger: Ledger,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    window: int = Query(30, ge=2, le=366)
+):
+    try:
+        # Keyed on the first day read, so the range version covers the warm-up days too
+        key = response_cache.key(ledger, "analytics-rolling", rolling_load_start(start_date, window), end_date, window)
+        return await cached_response(
+            request, ledger, key, lambda: compute_rolling_statistics(ledger, start_date, end_date, window),
+            database=analytics_db
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@api_router.get("/analytics/projection")
+async def get_cash_flow_projection(
+    request: Request,
+    ledger: Ledger,
+    end_date: Optional[str] = None,
+    history_days: int = Query(180, ge=2, le=3660),
+    days: int = Query(90, ge=1, le=730)
+):
+    try:
+        # The opening balance depends on every earlier day, so the range is open-ended
+        key = response_cache.key(ledger, "analytics-projection", None, end_date, history_days, days)
+        return await cached_response(
+            request, ledger, key, lambda: compute_cash_flow_projection(ledger, end_date, history_days, days),
+            database=analytics_db
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@api_router.get("/periods", response_model=ClosedPeriods)
+async def get_closed_periods(ledger: Ledger):
+    try:
+        snapshots = await snapshots_collection(ledger).find({}, {"categories": 0}).sort("_id", ASCENDING).to_list(None)
+        archived = await read_archive(transaction_archive.months, ledger)
+        return ClosedPeriods(
+            closed_through=snapshots[-1]["end"].date() if snapshots else None,
+            archived_through=archived[0].strftime("%Y-%m") if archived else None,
+            periods=[period_snapshot_row(doc) for doc in snapshots]
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@api_router.get("/periods/{period}", response_model=PeriodSnapshot)
+async def get_period_snapshot(period: str, ledger: Ledger):
+    if not re.match(PERIOD_PATTERN, period):
+        raise HTTPException(status_code=422, detail="period must be YYYY-MM")
+    snapshot = await snapshots_collection(ledger).find_one({"_id": to_mongo_date(parse_period(period))})
+    if not snapshot:
+        raise HTTPException(status_code=404, detail="Period is not closed")
+    return period_snapshot_row(snapshot)
+
+@api_router.post("/periods/close", response_model=List[PeriodSnapshot])
+async def close_periods_through(request: ClosePeriodsRequest, ledger: Ledger):
+    try:
+        snapshots = await close_periods(ledger, parse_period(request.through))
+        return [period_snapshot_row(doc) for doc in snapshots]
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="These periods are already being closed")
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@api_router.post("/periods/reopen", response_model=ReopenPeriodsResult)
+async def reopen_periods_from(request: ReopenPeriodsRequest, ledger: Ledger):
+    try:
+        return ReopenPeriodsResult(reopened=await reopen_periods(ledger, parse_period(request.start)))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@api_router.post("/periods/archive", response_model=ArchiveYearResult)
+async def archive_closed_year(request: ArchiveYearRequest, ledger: Ledger):
+    try:
+        return ArchiveYearResult(year=request.year, archived=await archive_year(ledger, request.year))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@api_router.get("/admin/explain")
+async def explain_query_shapes(
+    ledger: Ledger,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None
 ):
     try:
-        # Build query filters
-        query = {}
-        
-        if start_date or end_date:
-            date_filter = {}
-            if start_date:
-                date_filter["$gte"] = start_date
-            if end_date:
-                date_filter["$lte"] = end_date
-            query["date"] = date_filter
-        
-        # Fetch transactions
-        transactions = await db.transactions.find(query).sort("date", 1).to_list(None)
-        
-        # Group by date for line chart
-        daily_data = {}
-        for tx in transactions:
-            tx_date = tx['date']
-            if tx_date not in daily_data:
-                daily_data[tx_date] = {'income': 0, 'expenses': 0, 'net': 0}
-            
-            if tx['type'] == 'income':
-                daily_data[tx_date]['income'] += tx['amount']
-            else:
-                daily_data[tx_date]['expenses'] += tx['amount']
-            
-            daily_data[tx_date]['net'] = daily_data[tx_date]['income'] - daily_data[tx_date]['expenses']
-        
-        # Format for chart
-        chart_data = {
-            'labels': list(daily_data.keys()),
-            'income': [daily_data[date]['income'] for date in daily_data.keys()],
-            'expenses': [daily_data[date]['expenses'] for date in daily_data.keys()],
-            'net_profit': [daily_data[date]['net'] for date in daily_data.keys()]
-        }
+        query = build_date_query(start_date, end_date)
+        typed_query = {**query, "type": TransactionType.INCOME.value}
+        rollup_query = build_date_query(start_date, end_date, field="_id")
+        transactions = ledger_collection_name("transactions", ledger)
+        rollups = ledger_collection_name("daily_rollups", ledger)
         
-        return chart_data
+        return {
+            "transactions": await explain_find(transactions, query, TRANSACTION_SORT, 101),
+            "transactions_by_type": await explain_find(transactions, typed_query, TRANSACTION_SORT, 101),
+            "transactions_search": await explain_find(
+                transactions, {**query, "$text": {"$search": "probe"}}, TRANSACTION_SORT, 101
+            ),
+            "summary_rollup": await explain_aggregate(rollups, rollup_summary_pipeline(start_date, end_date)),
+            "summary_aggregate": await explain_aggregate(transactions, summary_pipeline(query)),
+            "by_category": await explain_aggregate(transactions, category_breakdown_pipeline(query, 10)),
+            "chart_data": await explain_find(rollups, rollup_query, [("_id", ASCENDING)]),
+            "chart_data_bucketed": await explain_aggregate(
+                rollups,
+                chart_pipeline(
+                    ChartGranularity.MONTH,
+                    date.fromisoformat(start_date) if start_date else None,
+                    date.fromisoformat(end_date) if end_date else None
+                )
+            ),
+            "delete": await explain_find(transactions, {"id": "explain-probe"}, limit=1),
+        }
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+# Liveness only says the process is serving; readiness also needs a database
+# ping and a connection pool that is not saturated with requests queued on it
+READY_PING_TIMEOUT_SECONDS = float(os.environ.get('READY_PING_TIMEOUT_SECONDS', '2'))
+READY_MAX_POOL_SATURATION = float(os.environ.get('READY_MAX_POOL_SATURATION', '0.9'))
+
+@api_router.get("/health")
+async def health():
+    return {"status": "ok"}
+
+@api_router.get("/health/ready")
+async def readiness():
+    database = {"ok": True}
+    try:
+        started = asyncio.get_running_loop().time()
+        await asyncio.wait_for(db.command("ping"), timeout=READY_PING_TIMEOUT_SECONDS)
+        database["ping_ms"] = round((asyncio.get_running_loop().time() - started) * 1000, 2)
+    except Exception as e:
+        database = {"ok": False, "error": str(e) or type(e).__name__}
+    
+    pools = pool_metrics.snapshot(MONGO_MAX_POOL_SIZE)
+    saturated = [
+        address for address, pool in pools.items()
+        if pool["saturation"] >= READY_MAX_POOL_SATURATION and pool["waiting"] > 0
+    ]
+    ready = database["ok"] and not saturated
+    return ORJSONResponse(
+        {
+            "status": "ready" if ready else "unavailable",
+            "database": database,
+            "pool": {
+                "max_size": MONGO_MAX_POOL_SIZE,
+                "min_size": MONGO_MIN_POOL_SIZE,
+                "saturated": saturated,
+                "servers": pools,
+            },
+            "live_updates": {
+                "change_stream": event_broker.relay_active,
+                "subscribers": event_broker.subscriber_count(),
+            },
+        },
+        status_code=200 if ready else 503
+    )
+
+@api_router.get("/stream")
+async def stream_updates(request: Request, ledger: Ledger):
+    queue = event_broker.subscribe(ledger)
+    
+    async def events():
+        try:
+            yield f"retry: {LIVE_RETRY_MS}\n\n".encode()
+            while not await request.is_disconnected():
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=LIVE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # Comment lines keep idle connections open through proxies
+                    yield b": keepalive\n\n"
+                    continue
+                yield b"event: changes\ndata: " + orjson.dumps(message) + b"\n\n"
+        finally:
+            event_broker.unsubscribe(ledger, queue)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # Include the router in the main app
 app.include_router(api_router)
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
+
+# Compresses responses from COMPRESSION_MIN_BYTES up. Added before the
+# metrics middleware so that it sits inside it and response sizes are
+# measured as sent
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.environ.get('COMPRESSION_MIN_BYTES', '1024')),
+    gzip_level=int(os.environ.get('GZIP_LEVEL', '6')),
+    brotli_quality=int(os.environ.get('BROTLI_QUALITY', '4'))
+)
+
+# Request metrics for every /api handler; ?profile=1 reports are opt-in
+app.add_middleware(
+    MetricsMiddleware,
+    profiling_enabled=os.environ.get('PROFILING_ENABLED', '').lower() in ('1', 'true', 'yes'),
+    explain=explain_command_stats
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -231,7 +2368,3 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
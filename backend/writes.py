@@ -0,0 +1,87 @@
+"""
+Write coalescing for single transaction creates
+
+InsertCoalescer holds each ledger's incoming documents for a short window
+(or until max_batch arrive) and hands them to the `write` callable the app
+supplies as one list. The app writes that list with a single unordered
+insert_many and follows it with one rollup, cache and event update. The
+callable returns an error message per document (None where the document was
+written), so each waiting request learns its own outcome. Under bursts of
+concurrent creates this trades up to one window of latency for far fewer
+round trips.
+"""
+
+import asyncio
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from metrics import COALESCED_INSERT_BATCH
+
+
+class CoalescedWriteError(Exception):
+    """The batch was written, but this request's document was rejected"""
+
+
+class InsertCoalescer:
+    def __init__(
+        self,
+        # Writes one ledger's batch; returns an error message or None per document
+        write: Callable[[str, List[dict]], Awaitable[List[Optional[str]]]],
+        window_seconds: float = 0.005,
+        max_batch: int = 500,
+    ):
+        self.write = write
+        self.window_seconds = window_seconds
+        self.max_batch = max_batch
+        self.pending: Dict[str, List[Tuple[dict, asyncio.Future]]] = defaultdict(list)
+        self.timers: Dict[str, asyncio.Task] = {}
+
+    async def submit(self, ledger: str, document: dict):
+        """Queue a document and wait until the batch holding it has been written"""
+        future = asyncio.get_running_loop().create_future()
+        batch = self.pending[ledger]
+        batch.append((document, future))
+        if len(batch) >= self.max_batch:
+            timer = self.timers.pop(ledger, None)
+            if timer:
+                timer.cancel()
+            asyncio.create_task(self.write_batch(ledger, self.pending.pop(ledger)))
+        elif ledger not in self.timers:
+            self.timers[ledger] = asyncio.create_task(self.flush_later(ledger))
+        # Shielded so a client disconnect doesn't cancel the shared future
+        await asyncio.shield(future)
+
+    async def flush_later(self, ledger: str):
+        await asyncio.sleep(self.window_seconds)
+        await self.flush(ledger)
+
+    async def flush(self, ledger: str):
+        # Take the batch before the first await so later submits start a new one
+        self.timers.pop(ledger, None)
+        batch = self.pending.pop(ledger, [])
+        if batch:
+            await self.write_batch(ledger, batch)
+
+    async def write_batch(self, ledger: str, batch: List[Tuple[dict, asyncio.Future]]):
+        COALESCED_INSERT_BATCH.observe(len(batch))
+        try:
+            errors = await self.write(ledger, [document for document, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), error in zip(batch, errors):
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(CoalescedWriteError(error))
+
+    async def close(self):
+        """Write whatever is still waiting; called on shutdown"""
+        for timer in list(self.timers.values()):
+            timer.cancel()
+        for ledger in list(self.pending):
+            await self.flush(ledger)
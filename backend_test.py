@@ -6,9 +6,13 @@ Tests all transaction-related endpoints with realistic business data
 
 import requests
 import json
+from decimal import Decimal
 from datetime import datetime, date, timedelta
 import os
 import sys
+import threading
+import time
+import uuid
 from pathlib import Path
 
 # Load environment variables
@@ -51,6 +55,36 @@ class BackendTester:
             print(f"❌ Root endpoint error: {str(e)}")
             return False
     
+    def test_health(self):
+        """Test liveness and readiness endpoints"""
+        print("\n🩺 Testing health endpoints...")
+        
+        try:
+            response = self.session.get(f"{BASE_URL}/health")
+            if response.status_code != 200 or response.json().get("status") != "ok":
+                print(f"❌ Liveness check failed with status {response.status_code}")
+                return False
+            
+            response = self.session.get(f"{BASE_URL}/health/ready")
+            data = response.json()
+            if response.status_code == 200 and data["status"] == "ready" and data["database"]["ok"]:
+                servers = data["pool"]["servers"]
+                print(f"✅ Ready: ping {data['database'].get('ping_ms')} ms, pools {servers}")
+            else:
+                print(f"❌ Readiness check failed ({response.status_code}): {data}")
+                return False
+            
+            if all("saturation" in pool for pool in servers.values()):
+                print("✅ Readiness reports pool saturation per server")
+            else:
+                print("❌ Pool saturation missing from readiness report")
+                return False
+            
+            return True
+        except Exception as e:
+            print(f"❌ Health check error: {str(e)}")
+            return False
+    
     def test_create_transactions(self):
         """Test creating various types of transactions"""
         print("\n💰 Testing transaction creation...")
@@ -107,12 +141,13 @@ class BackendTester:
                     data = response.json()
                     # Verify response structure
                     required_fields = ['id', 'type', 'amount', 'description', 'date', 'created_at']
-                    if all(field in data for field in required_fields):
+                    # Amounts come back with two places, as every read returns them
+                    if all(field in data for field in required_fields) and data['amount'] == f"{transaction['amount']:.2f}":
                         print(f"✅ Transaction {i+1} created: {transaction['type']} ${transaction['amount']}")
                         self.created_transactions.append(data['id'])
                         success_count += 1
                     else:
-                        print(f"❌ Transaction {i+1} missing required fields: {data}")
+                        print(f"❌ Transaction {i+1} missing required fields or misformatted amount: {data}")
                 else:
                     print(f"❌ Transaction {i+1} failed with status {response.status_code}: {response.text}")
             except Exception as e:
@@ -121,6 +156,49 @@ class BackendTester:
         print(f"📊 Created {success_count}/{len(test_transactions)} transactions successfully")
         return success_count == len(test_transactions)
     
+    def test_bulk_ingest(self):
+        """Test bulk NDJSON and CSV ingest with per-row errors"""
+        print("\n📦 Testing bulk transaction ingest...")
+        
+        ndjson_rows = [
+            {"type": "income", "amount": 320.00, "description": "Bank import: card settlement", "category": "Sales", "date": "2024-01-20"},
+            {"type": "refund", "amount": 15.00, "description": "Unknown transaction type", "date": "2024-01-20"},
+            {"type": "expense", "amount": 42.10, "description": "Bank import: courier", "category": "Shipping", "date": "2024-01-21"},
+        ]
+        csv_body = (
+            "type,amount,description,category,date\n"
+            "expense,19.99,Bank import: domain renewal,Software,2024-01-22\n"
+            "income,not-a-number,Broken amount,,2024-01-22\n"
+        )
+        uploads = [
+            ("NDJSON", "\n".join(json.dumps(row) for row in ndjson_rows), "application/x-ndjson", 2, [2]),
+            ("CSV", csv_body, "text/csv", 1, [2]),
+        ]
+        
+        try:
+            for name, body, content_type, expected_inserted, expected_error_rows in uploads:
+                response = self.session.post(
+                    f"{BASE_URL}/transactions/bulk",
+                    data=body.encode(),
+                    headers={"Content-Type": content_type}
+                )
+                if response.status_code != 200:
+                    print(f"❌ {name} bulk ingest failed with status {response.status_code}: {response.text}")
+                    return False
+                
+                result = response.json()
+                error_rows = [error['row'] for error in result['errors']]
+                if result['inserted'] == expected_inserted and error_rows == expected_error_rows:
+                    print(f"✅ {name} bulk ingest inserted {result['inserted']} rows and reported rows {error_rows} as invalid")
+                else:
+                    print(f"❌ Unexpected {name} bulk ingest result: {result}")
+                    return False
+            
+            return True
+        except Exception as e:
+            print(f"❌ Bulk ingest error: {str(e)}")
+            return False
+    
     def test_get_transactions(self):
         """Test retrieving transactions with various filters"""
         print("\n📋 Testing transaction retrieval...")
@@ -129,7 +207,7 @@ class BackendTester:
         try:
             response = self.session.get(f"{BASE_URL}/transactions")
             if response.status_code == 200:
-                transactions = response.json()
+                transactions = response.json()['items']
                 print(f"✅ Retrieved {len(transactions)} transactions")
                 
                 # Verify transaction structure
@@ -153,7 +231,7 @@ class BackendTester:
                 )
                 
                 if response.status_code == 200:
-                    filtered_transactions = response.json()
+                    filtered_transactions = response.json()['items']
                     print(f"✅ Date filtering works: {len(filtered_transactions)} transactions in range")
                 else:
                     print(f"❌ Date filtering failed: {response.status_code}")
@@ -167,7 +245,7 @@ class BackendTester:
                 )
                 
                 if response.status_code == 200:
-                    income_transactions = response.json()
+                    income_transactions = response.json()['items']
                     print(f"✅ Type filtering works: {len(income_transactions)} income transactions")
                     
                     # Verify all returned transactions are income
@@ -188,6 +266,51 @@ class BackendTester:
             print(f"❌ Get transactions error: {str(e)}")
             return False
     
+    def test_transaction_pagination(self):
+        """Test cursor pagination walks every transaction exactly once"""
+        print("\n📄 Testing cursor pagination...")
+        
+        try:
+            response = self.session.get(f"{BASE_URL}/transactions", params={"limit": 1000})
+            if response.status_code != 200:
+                print(f"❌ Get transactions failed with status {response.status_code}")
+                return False
+            expected_ids = [tx['id'] for tx in response.json()['items']]
+            
+            seen_ids = []
+            params = {"limit": 2}
+            while True:
+                response = self.session.get(f"{BASE_URL}/transactions", params=params)
+                if response.status_code != 200:
+                    print(f"❌ Page request failed with status {response.status_code}")
+                    return False
+                page = response.json()
+                if len(page['items']) > 2:
+                    print(f"❌ Page exceeded limit: {len(page['items'])} items")
+                    return False
+                seen_ids.extend(tx['id'] for tx in page['items'])
+                if not page['next_cursor']:
+                    break
+                params = {"limit": 2, "cursor": page['next_cursor']}
+            
+            if seen_ids == expected_ids:
+                print(f"✅ Pagination returned {len(seen_ids)} transactions in order without gaps or repeats")
+            else:
+                print(f"❌ Paginated ids differ from single-page ids: {seen_ids} vs {expected_ids}")
+                return False
+            
+            response = self.session.get(f"{BASE_URL}/transactions", params={"cursor": "not-a-cursor"})
+            if response.status_code == 400:
+                print("✅ Invalid cursor correctly rejected")
+            else:
+                print(f"❌ Expected 400 for invalid cursor, got {response.status_code}")
+                return False
+            
+            return True
+        except Exception as e:
+            print(f"❌ Pagination error: {str(e)}")
+            return False
+    
     def test_transaction_summary(self):
         """Test transaction summary calculations"""
         print("\n📊 Testing transaction summary...")
@@ -205,9 +328,9 @@ class BackendTester:
                     print(f"   📈 Net Profit: ${summary['net_profit']}")
                     print(f"   🔢 Transaction Count: {summary['transaction_count']}")
                     
-                    # Verify calculation logic
-                    expected_net = summary['total_income'] - summary['total_expenses']
-                    if abs(summary['net_profit'] - expected_net) < 0.01:  # Allow for floating point precision
+                    # Verify calculation logic (amounts are exact decimal strings)
+                    expected_net = Decimal(summary['total_income']) - Decimal(summary['total_expenses'])
+                    if Decimal(summary['net_profit']) == expected_net:
                         print("✅ Net profit calculation is correct")
                     else:
                         print(f"❌ Net profit calculation error: expected {expected_net}, got {summary['net_profit']}")
@@ -238,6 +361,40 @@ class BackendTester:
             print(f"❌ Summary error: {str(e)}")
             return False
     
+    def test_summary_mode_parity(self):
+        """Test that the rollup and aggregation summaries match the Python scan summary"""
+        print("\n⚖️ Testing summary rollup/aggregation/scan parity...")
+        
+        try:
+            for params in ({}, {"start_date": "2024-01-01", "end_date": "2024-01-31"}):
+                responses = {}
+                for mode in ("rollup", "aggregate", "scan"):
+                    response = self.session.get(
+                        f"{BASE_URL}/transactions/summary",
+                        params={**params, "mode": mode}
+                    )
+                    if response.status_code != 200:
+                        print(f"❌ Summary ({mode}) failed with status {response.status_code}")
+                        return False
+                    responses[mode] = response.json()
+                
+                scan = responses["scan"]
+                for mode in ("rollup", "aggregate"):
+                    summary = responses[mode]
+                    if summary['transaction_count'] != scan['transaction_count']:
+                        print(f"❌ Transaction count mismatch: {mode} {summary} vs scan {scan}")
+                        return False
+                    for field in ('total_income', 'total_expenses', 'net_profit'):
+                        if Decimal(summary[field]) != Decimal(scan[field]):
+                            print(f"❌ {field} mismatch: {mode} {summary[field]}, scan {scan[field]}")
+                            return False
+                print(f"✅ Rollup, aggregate and scan summaries match for {params or 'all dates'}")
+            
+            return True
+        except Exception as e:
+            print(f"❌ Summary parity error: {str(e)}")
+            return False
+    
     def test_chart_data(self):
         """Test chart data endpoint"""
         print("\n📈 Testing chart data...")
@@ -294,6 +451,769 @@ class BackendTester:
             print(f"❌ Chart data error: {str(e)}")
             return False
     
+    def test_dashboard(self):
+        """Test the combined dashboard endpoint against the individual endpoints"""
+        print("\n🧭 Testing combined dashboard...")
+        
+        params = {"start_date": "2024-01-01", "end_date": "2024-01-31"}
+        try:
+            response = self.session.get(f"{BASE_URL}/dashboard", params={**params, "limit": 1000})
+            if response.status_code != 200:
+                print(f"❌ Dashboard failed with status {response.status_code}")
+                return False
+            dashboard = response.json()
+            
+            transactions = self.session.get(f"{BASE_URL}/transactions", params={**params, "limit": 1000}).json()
+            summary = self.session.get(f"{BASE_URL}/transactions/summary", params=params).json()
+            chart_data = self.session.get(f"{BASE_URL}/transactions/chart-data", params=params).json()
+            
+            if [tx['id'] for tx in dashboard['transactions']['items']] != [tx['id'] for tx in transactions['items']]:
+                print("❌ Dashboard transactions differ from /transactions")
+                return False
+            if dashboard['summary']['transaction_count'] != summary['transaction_count'] or any(
+                Decimal(dashboard['summary'][field]) != Decimal(summary[field])
+                for field in ('total_income', 'total_expenses', 'net_profit')
+            ):
+                print(f"❌ Dashboard summary differs: {dashboard['summary']} vs {summary}")
+                return False
+            if dashboard['chart']['labels'] != chart_data['labels']:
+                print("❌ Dashboard chart labels differ from /transactions/chart-data")
+                return False
+            
+            print(f"✅ Dashboard matches the individual endpoints ({summary['transaction_count']} transactions)")
+            return True
+        except Exception as e:
+            print(f"❌ Dashboard error: {str(e)}")
+            return False
+    
+    def test_cache_revalidation(self):
+        """Test ETag revalidation and write invalidation for cached endpoints"""
+        print("\n🗄️ Testing response cache revalidation...")
+        
+        params = {"start_date": "2024-01-01", "end_date": "2024-01-31"}
+        try:
+            for endpoint in ("transactions/summary", "transactions/chart-data"):
+                response = self.session.get(f"{BASE_URL}/{endpoint}", params=params)
+                etag = response.headers.get("ETag")
+                if response.status_code != 200 or not etag:
+                    print(f"❌ {endpoint} returned no ETag (status {response.status_code})")
+                    return False
+                
+                response = self.session.get(f"{BASE_URL}/{endpoint}", params=params, headers={"If-None-Match": etag})
+                if response.status_code == 304:
+                    print(f"✅ {endpoint} returns 304 for an unchanged ETag")
+                else:
+                    print(f"❌ Expected 304 from {endpoint}, got {response.status_code}")
+                    return False
+            
+            response = self.session.get(f"{BASE_URL}/transactions/summary", params=params)
+            etag = response.headers.get("ETag")
+            response = self.session.post(
+                f"{BASE_URL}/transactions",
+                json={"type": "income", "amount": 75.00, "description": "Cache invalidation probe", "date": "2024-01-25"}
+            )
+            if response.status_code != 200:
+                print(f"❌ Probe transaction failed with status {response.status_code}")
+                return False
+            probe_id = response.json()['id']
+            
+            response = self.session.get(f"{BASE_URL}/transactions/summary", params=params, headers={"If-None-Match": etag})
+            self.session.delete(f"{BASE_URL}/transactions/{probe_id}")
+            if response.status_code == 200 and response.headers.get("ETag") != etag:
+                print("✅ Writes inside the cached date range invalidate the summary")
+            else:
+                print(f"❌ Summary not invalidated after write (status {response.status_code})")
+                return False
+            
+            response = self.session.get(f"{BASE_URL}/transactions/summary", params=params)
+            etag = response.headers.get("ETag")
+            response = self.session.post(
+                f"{BASE_URL}/transactions",
+                json={"type": "income", "amount": 75.00, "description": "Cache scope probe", "date": "2024-06-15"}
+            )
+            if response.status_code != 200:
+                print(f"❌ Probe transaction failed with status {response.status_code}")
+                return False
+            probe_id = response.json()['id']
+            
+            response = self.session.get(f"{BASE_URL}/transactions/summary", params=params, headers={"If-None-Match": etag})
+            self.session.delete(f"{BASE_URL}/transactions/{probe_id}")
+            if response.status_code == 304:
+                print("✅ Writes outside the cached date range keep the summary's ETag")
+            else:
+                print(f"❌ Expected 304 after a write outside the range, got {response.status_code}")
+                return False
+            
+            return True
+        except Exception as e:
+            print(f"❌ Cache revalidation error: {str(e)}")
+            return False
+    
+    def test_compact_responses(self):
+        """Test response compression, strong ETags and the columnar chart formats"""
+        print("\n📦 Testing compressed and columnar responses...")
+        
+        params = {"start_date": "2024-01-01", "end_date": "2024-12-31"}
+        try:
+            response = self.session.get(f"{BASE_URL}/transactions", params={"limit": 1000}, headers={"Accept-Encoding": "gzip"})
+            sent = int(response.headers.get("Content-Length", len(response.content)))
+            if response.headers.get("Content-Encoding") == "gzip" and sent < len(response.content):
+                print(f"✅ Transactions page gzipped: {len(response.content)} -> {sent} bytes")
+            elif len(response.content) < 1024:
+                print("✅ Transactions page below the compression threshold is sent as is")
+            else:
+                print(f"❌ Large transactions page was not compressed: {response.headers}")
+                return False
+            
+            with self.session.get(f"{BASE_URL}/stream", headers={"Accept-Encoding": "gzip"}, stream=True, timeout=10) as response:
+                if "Content-Encoding" in response.headers:
+                    print("❌ Event stream must not be compressed")
+                    return False
+            print("✅ Event stream is left uncompressed")
+            
+            plain = self.session.get(f"{BASE_URL}/transactions/chart-data", params=params)
+            columnar = self.session.get(f"{BASE_URL}/transactions/chart-data", params={**params, "format": "columnar"})
+            again = self.session.get(f"{BASE_URL}/transactions/chart-data", params={**params, "format": "columnar"})
+            plain_data, columnar_data = plain.json(), columnar.json()
+            if len(columnar_data["offsets"]) != len(plain_data["labels"]):
+                print(f"❌ Columnar chart has {len(columnar_data['offsets'])} points, JSON has {len(plain_data['labels'])}")
+                return False
+            if sum(columnar_data["income_minor"]) != round(sum(Decimal(value) for value in plain_data["income"]) * 100):
+                print("❌ Columnar income does not match the JSON chart")
+                return False
+            etag = columnar.headers.get("ETag", "")
+            if etag.startswith("W/") or etag != again.headers.get("ETag") or etag == plain.headers.get("ETag"):
+                print(f"❌ Expected a stable, strong, per-format ETag, got {etag}")
+                return False
+            print(f"✅ Columnar chart matches the JSON chart ({len(columnar.content)} vs {len(plain.content)} bytes)")
+            
+            response = self.session.get(f"{BASE_URL}/transactions/chart-data", params={**params, "format": "arrow"})
+            if response.status_code == 200 and response.headers["Content-Type"] == "application/vnd.apache.arrow.stream":
+                print("✅ Chart data available as an Arrow IPC stream")
+                return True
+            print(f"❌ Arrow chart failed ({response.status_code}): {response.text[:200]}")
+            return False
+        except Exception as e:
+            print(f"❌ Compact responses error: {str(e)}")
+            return False
+    
+    def test_live_updates(self):
+        """Test that writes are pushed to /stream subscribers"""
+        print("\n📡 Testing live update stream...")
+        
+        created = {}
+        
+        def create_probe():
+            time.sleep(1)
+            response = requests.post(
+                f"{BASE_URL}/transactions",
+                json={"type": "expense", "amount": "12.34", "description": "Live update probe", "date": "2024-01-26"}
+            )
+            created.update(response.json())
+        
+        try:
+            with requests.get(f"{BASE_URL}/stream", stream=True, timeout=10) as response:
+                if response.status_code != 200 or not response.headers.get("content-type", "").startswith("text/event-stream"):
+                    print(f"❌ Stream returned status {response.status_code}")
+                    return False
+                threading.Thread(target=create_probe).start()
+                
+                message = None
+                for line in response.iter_lines(decode_unicode=True):
+                    if line and line.startswith("data:"):
+                        message = json.loads(line[len("data:"):])
+                        break
+            
+            self.session.delete(f"{BASE_URL}/transactions/{created.get('id')}")
+            if message is None:
+                print("❌ No live update received")
+                return False
+            
+            day = next((day for day in message["days"] if day["date"] == "2024-01-26"), None)
+            inserted_ids = [tx["id"] for tx in message["inserted"]]
+            if (message["resync"] or created.get("id") in inserted_ids) and day and Decimal(day["expenses"]) >= Decimal("12.34"):
+                print(f"✅ Live update carried the new row and the day delta ({day['expenses']} expenses)")
+            else:
+                print(f"❌ Unexpected live update: {message}")
+                return False
+            
+            if "totals" in message:
+                print(f"✅ Live update carried totals ({message['totals']['transaction_count']} transactions)")
+            return True
+        except Exception as e:
+            print(f"❌ Live update error: {str(e)}")
+            return False
+    
+    def test_export(self):
+        """Test streaming NDJSON and CSV exports"""
+        print("\n📤 Testing transaction export...")
+        
+        try:
+            response = self.session.get(f"{BASE_URL}/transactions/summary")
+            if response.status_code != 200:
+                print(f"❌ Summary failed with status {response.status_code}")
+                return False
+            expected_rows = response.json()['transaction_count']
+            
+            response = self.session.get(f"{BASE_URL}/transactions/export", params={"format": "ndjson"}, stream=True)
+            rows = [json.loads(line) for line in response.iter_lines() if line]
+            if response.status_code == 200 and len(rows) == expected_rows:
+                print(f"✅ NDJSON export streamed {len(rows)} transactions")
+            else:
+                print(f"❌ NDJSON export returned {len(rows)} rows (status {response.status_code}), expected {expected_rows}")
+                return False
+            
+            response = self.session.get(f"{BASE_URL}/transactions/export", params={"format": "csv"}, stream=True)
+            lines = [line for line in response.iter_lines() if line]
+            if response.status_code == 200 and lines and lines[0].decode().startswith("id,type,amount") and len(lines) - 1 == expected_rows:
+                print(f"✅ CSV export streamed {len(lines) - 1} transactions with a header row")
+            else:
+                print(f"❌ CSV export returned {max(len(lines) - 1, 0)} rows (status {response.status_code}), expected {expected_rows}")
+                return False
+            
+            return True
+        except Exception as e:
+            print(f"❌ Export error: {str(e)}")
+            return False
+    
+    def test_metrics(self):
+        """Test that /metrics exports request latency and MongoDB command latency"""
+        print("\n📈 Testing Prometheus metrics...")
+        
+        try:
+            # Scan mode always queries MongoDB, so both series have samples
+            self.session.get(f"{BASE_URL}/transactions/summary", params={"mode": "scan"})
+            response = self.session.get(f"{BACKEND_URL}/metrics")
+            if response.status_code != 200:
+                print(f"❌ /metrics failed with status {response.status_code}")
+                return False
+            
+            for series in ("balance_sheet_request_seconds_count{", "balance_sheet_db_command_seconds_count{"):
+                if series not in response.text:
+                    print(f"❌ /metrics has no {series.rstrip('{')} samples")
+                    return False
+            print("✅ /metrics exports request latency and MongoDB command series")
+            return True
+        except Exception as e:
+            print(f"❌ Metrics error: {str(e)}")
+            return False
+    
+    def test_profiling(self):
+        """Test that ?profile=1 returns a profile report and the default response is unchanged"""
+        print("\n🔬 Testing request profiling...")
+        
+        params = {"mode": "scan"}
+        try:
+            default = self.session.get(f"{BASE_URL}/transactions/summary", params=params)
+            if default.status_code != 200 or not default.headers.get("Content-Type", "").startswith("application/json"):
+                print(f"❌ Default summary response changed ({default.status_code}, {default.headers.get('Content-Type')})")
+                return False
+            if not all(field in default.json() for field in ("total_income", "total_expenses", "transaction_count")):
+                print(f"❌ Default summary response is missing fields: {default.json()}")
+                return False
+            print("✅ Default response is plain JSON without a profile")
+            
+            profiled = self.session.get(f"{BASE_URL}/transactions/summary", params={**params, "profile": "1"})
+            if profiled.headers.get("Content-Type", "").startswith("application/json"):
+                # Profiling is opt-in on the server; without it the parameter is ignored
+                if profiled.json() == default.json():
+                    print("✅ Profiling disabled on the server; ?profile=1 leaves the response unchanged")
+                    return True
+                print(f"❌ ?profile=1 changed the JSON response: {profiled.json()}")
+                return False
+            
+            report = profiled.text
+            if profiled.status_code == 200 and all(line in report for line in ("status: 200", "total: ", "db: ")):
+                print("✅ ?profile=1 returns the profile report")
+                return True
+            print(f"❌ Unexpected profile response ({profiled.status_code}): {report[:200]}")
+            return False
+        except Exception as e:
+            print(f"❌ Profiling error: {str(e)}")
+            return False
+    
+    def test_query_plans(self):
+        """Test that transaction queries are served by indexes"""
+        print("\n🔎 Testing query plans...")
+        
+        try:
+            response = self.session.get(
+                f"{BASE_URL}/admin/explain",
+                params={"start_date": "2024-01-01", "end_date": "2024-01-31"}
+            )
+            if response.status_code != 200:
+                print(f"❌ Explain failed with status {response.status_code}")
+                return False
+            
+            plans = response.json()
+            scanned = [
+                shape for shape in ("transactions", "transactions_by_type", "transactions_search", "summary_aggregate", "delete")
+                if plans[shape]["collection_scan"]
+            ]
+            if scanned:
+                print(f"❌ Collection scans in query shapes: {scanned}")
+                return False
+            
+            for shape, plan in plans.items():
+                print(f"   {shape}: {', '.join(plan['indexes']) or 'no index'}")
+            print("✅ All transaction query shapes use an index")
+            return True
+        except Exception as e:
+            print(f"❌ Query plan error: {str(e)}")
+            return False
+    
+    def test_category_breakdown(self):
+        """Test category totals, shares and the top-N cut"""
+        print("\n🏷️ Testing category breakdown...")
+        
+        try:
+            summary = self.session.get(f"{BASE_URL}/transactions/summary").json()
+            response = self.session.get(f"{BASE_URL}/transactions/by-category", params={"top_n": 1})
+            if response.status_code != 200:
+                print(f"❌ Category breakdown failed with status {response.status_code}: {response.text}")
+                return False
+            
+            expected_totals = {"income": summary['total_income'], "expense": summary['total_expenses']}
+            for entry in response.json()['breakdown']:
+                buckets = entry['categories'] + ([entry['other']] if entry['other'] else [])
+                if len(entry['categories']) > 1:
+                    print(f"❌ top_n=1 returned {len(entry['categories'])} categories for {entry['type']}")
+                    return False
+                if Decimal(entry['total']) != Decimal(expected_totals[entry['type']]):
+                    print(f"❌ {entry['type']} total {entry['total']} differs from summary {expected_totals[entry['type']]}")
+                    return False
+                if sum(Decimal(bucket['total']) for bucket in buckets) != Decimal(entry['total']):
+                    print(f"❌ {entry['type']} categories plus other do not add up to the total")
+                    return False
+                print(f"✅ {entry['type']}: top category {entry['categories'][0]['category']} "
+                      f"({entry['categories'][0]['share']:.0%}), other {entry['other']['total'] if entry['other'] else '0.00'}")
+            
+            return True
+        except Exception as e:
+            print(f"❌ Category breakdown error: {str(e)}")
+            return False
+    
+    def test_chart_granularity(self):
+        """Test bucketed, zero-filled and cumulative chart data"""
+        print("\n🗓️ Testing chart granularity...")
+        
+        params = {"start_date": "2024-01-01", "end_date": "2024-03-31"}
+        try:
+            response = self.session.get(
+                f"{BASE_URL}/transactions/chart-data",
+                params={**params, "granularity": "month", "fill_gaps": "true", "cumulative": "true"}
+            )
+            if response.status_code != 200:
+                print(f"❌ Monthly chart data failed with status {response.status_code}: {response.text}")
+                return False
+            
+            chart_data = response.json()
+            if chart_data['labels'] != ["2024-01-01", "2024-02-01", "2024-03-01"]:
+                print(f"❌ Expected three zero-filled monthly buckets, got {chart_data['labels']}")
+                return False
+            
+            # Each bucket's balance is the previous balance plus its net profit
+            balances = [Decimal(balance) for balance in chart_data['balance']]
+            for i in range(1, len(balances)):
+                if balances[i] - balances[i - 1] != Decimal(chart_data['net_profit'][i]):
+                    print(f"❌ Running balance does not accumulate net profit: {chart_data}")
+                    return False
+            print(f"✅ Monthly buckets {chart_data['labels']} with running balance {chart_data['balance']}")
+            
+            response = self.session.get(
+                f"{BASE_URL}/transactions/chart-data",
+                params={"granularity": "auto", "max_points": 10}
+            )
+            chart_data = response.json()
+            if response.status_code == 200 and len(chart_data['labels']) <= 10:
+                print(f"✅ Auto granularity picked '{chart_data['granularity']}' for {len(chart_data['labels'])} points")
+            else:
+                print(f"❌ Auto granularity exceeded max_points: {response.status_code} {chart_data}")
+                return False
+            
+            return True
+        except Exception as e:
+            print(f"❌ Chart granularity error: {str(e)}")
+            return False
+    
+    def test_analytics(self):
+        """Test period comparison, rolling statistics and cash-flow projection"""
+        print("\n📐 Testing analytics endpoints...")
+        
+        params = {"start_date": "2024-01-01", "end_date": "2024-03-31"}
+        try:
+            response = self.session.get(f"{BASE_URL}/analytics/period-comparison", params={**params, "period": "month"})
+            summary = self.session.get(f"{BASE_URL}/transactions/summary", params=params).json()
+            if response.status_code != 200:
+                print(f"❌ Period comparison failed with status {response.status_code}")
+                return False
+            periods = response.json()
+            income = sum(Decimal(value) for value in periods["income"])
+            if periods["labels"] == ["2024-01-01", "2024-02-01", "2024-03-01"] and income == Decimal(summary["total_income"]):
+                print(f"✅ Monthly comparison matches the summary (income changes: {periods['income_change_pct']})")
+            else:
+                print(f"❌ Period comparison mismatch: {periods['labels']} income {income} vs {summary['total_income']}")
+                return False
+            
+            response = self.session.get(f"{BASE_URL}/analytics/rolling", params={**params, "window": 7})
+            rolling = response.json()
+            if response.status_code == 200 and len(rolling["labels"]) == 91 and rolling["labels"][0] == "2024-01-01":
+                print(f"✅ Rolling statistics cover every day in range ({len(rolling['labels'])} days)")
+            else:
+                print(f"❌ Unexpected rolling statistics (status {response.status_code})")
+                return False
+            
+            response = self.session.get(f"{BASE_URL}/analytics/projection", params={"end_date": "2024-03-31", "days": 30})
+            projection = response.json()
+            if response.status_code == 200 and len(projection["balance"]) == 30 and projection["labels"][0] == "2024-04-01":
+                print(f"✅ Projection runs 30 days from {projection['opening_balance']} to {projection['balance'][-1]}")
+            else:
+                print(f"❌ Unexpected projection (status {response.status_code})")
+                return False
+            
+            # A ledger without rollups and without a range yields an empty frame
+            empty_ledger = {"ledger": f"test-empty-{uuid.uuid4().hex[:12]}"}
+            response = self.session.get(f"{BASE_URL}/analytics/period-comparison", params={**empty_ledger, "period": "month"})
+            if response.status_code == 200 and response.json()["labels"] == []:
+                print("✅ Period comparison of an empty ledger is empty")
+            else:
+                print(f"❌ Empty ledger period comparison failed (status {response.status_code})")
+                return False
+            
+            return True
+        except Exception as e:
+            print(f"❌ Analytics error: {str(e)}")
+            return False
+    
+    def test_search(self):
+        """Test full-text search and prefix suggestions"""
+        print("\n🔍 Testing search and suggestions...")
+        
+        try:
+            response = self.session.post(f"{BASE_URL}/transactions", json={
+                "type": "expense", "amount": "42.00", "description": "Zephyrine courier invoice",
+                "category": "Zephyr Logistics", "date": "2024-02-12"
+            })
+            probe_id = response.json()["id"]
+            
+            response = self.session.get(f"{BASE_URL}/transactions", params={"q": "zephyrine"})
+            ids = [tx["id"] for tx in response.json().get("items", [])]
+            if response.status_code == 200 and probe_id in ids:
+                print(f"✅ Text search found the probe ({len(ids)} match(es))")
+            else:
+                print(f"❌ Text search missed the probe (status {response.status_code})")
+                self.session.delete(f"{BASE_URL}/transactions/{probe_id}")
+                return False
+            
+            response = self.session.get(f"{BASE_URL}/transactions/suggest", params={"prefix": "zeph"})
+            suggestions = response.json()
+            categories = [item["value"] for item in suggestions.get("categories", [])]
+            descriptions = [item["value"] for item in suggestions.get("descriptions", [])]
+            self.session.delete(f"{BASE_URL}/transactions/{probe_id}")
+            if "Zephyr Logistics" in categories and "Zephyrine courier invoice" in descriptions:
+                print("✅ Suggestions include the new category and description")
+            else:
+                print(f"❌ Unexpected suggestions: {suggestions}")
+                return False
+            
+            response = self.session.get(f"{BASE_URL}/transactions/suggest", params={"prefix": "zeph"})
+            if not any(item["value"] == "Zephyr Logistics" for item in response.json()["categories"]):
+                print("✅ Deleting the last use removes the suggestion")
+            else:
+                print("❌ Suggestion still present after delete")
+                return False
+            
+            return True
+        except Exception as e:
+            print(f"❌ Search error: {str(e)}")
+            return False
+    
+    def test_batch_operations(self):
+        """Test bulk recategorisation and batch delete by id list and filter"""
+        print("\n🧹 Testing batch update and delete...")
+        
+        params = {"start_date": "2024-02-10", "end_date": "2024-02-10"}
+        try:
+            before = self.session.get(f"{BASE_URL}/transactions/summary", params=params).json()
+            rows = [
+                {"type": "expense", "amount": "10.00", "description": f"Batch probe {i}", "category": "Batch Probe", "date": "2024-02-10"}
+                for i in range(3)
+            ]
+            ids = [self.session.post(f"{BASE_URL}/transactions", json=row).json()["id"] for row in rows]
+            
+            response = self.session.post(f"{BASE_URL}/transactions/batch-delete", json={"filter": {}})
+            if response.status_code != 400:
+                print(f"❌ Empty filter should be rejected, got {response.status_code}")
+                return False
+            print("✅ Batch delete rejects an empty filter")
+            
+            response = self.session.patch(
+                f"{BASE_URL}/transactions/bulk",
+                json={"filter": {"category": "Batch Probe", "start_date": "2024-02-10"}, "category": "Batch Probe Renamed"}
+            )
+            if response.status_code == 200 and response.json()["modified"] == 3:
+                print("✅ Bulk update recategorised 3 transactions")
+            else:
+                print(f"❌ Bulk update failed ({response.status_code}): {response.text}")
+                return False
+            
+            response = self.session.post(f"{BASE_URL}/transactions/batch-delete", json={"ids": ids[:1]})
+            if response.status_code != 200 or response.json()["deleted"] != 1:
+                print(f"❌ Batch delete by id failed ({response.status_code}): {response.text}")
+                return False
+            response = self.session.post(
+                f"{BASE_URL}/transactions/batch-delete",
+                json={"filter": {"category": "Batch Probe Renamed", "type": "expense"}}
+            )
+            if response.status_code == 200 and response.json()["deleted"] == 2:
+                print("✅ Batch delete removed rows by id and by filter")
+            else:
+                print(f"❌ Batch delete by filter failed ({response.status_code}): {response.text}")
+                return False
+            
+            after = self.session.get(f"{BASE_URL}/transactions/summary", params=params).json()
+            if after == before:
+                print("✅ Summary for the affected day is back to its original totals")
+            else:
+                print(f"❌ Summary changed after batch delete: {before} -> {after}")
+                return False
+            
+            return True
+        except Exception as e:
+            print(f"❌ Batch operations error: {str(e)}")
+            return False
+    
+    def test_ledger_isolation(self):
+        """Test that transactions and summaries in one ledger don't leak into another"""
+        print("\n📒 Testing ledger isolation...")
+        
+        ledger = {"ledger": "test-ledger-b"}
+        try:
+            before = self.session.get(f"{BASE_URL}/transactions/summary").json()
+            response = self.session.post(
+                f"{BASE_URL}/transactions",
+                params=ledger,
+                json={"type": "income", "amount": "123.45", "description": "Ledger probe", "category": "Ledger Probe", "date": "2024-03-01"}
+            )
+            if response.status_code != 200 or response.json().get("ledger") != "test-ledger-b":
+                print(f"❌ Create in ledger failed ({response.status_code}): {response.text}")
+                return False
+            transaction_id = response.json()["id"]
+            
+            after = self.session.get(f"{BASE_URL}/transactions/summary").json()
+            if after == before:
+                print("✅ Default ledger summary unaffected by a write to another ledger")
+            else:
+                print(f"❌ Default ledger summary changed: {before} -> {after}")
+                return False
+            
+            summary = self.session.get(f"{BASE_URL}/transactions/summary", params=ledger).json()
+            if summary["transaction_count"] >= 1 and "test-ledger-b" in self.session.get(f"{BASE_URL}/ledgers").json()["ledgers"]:
+                print("✅ Ledger summary and ledger list include the new transaction")
+            else:
+                print(f"❌ Unexpected ledger summary: {summary}")
+                return False
+            
+            response = self.session.delete(f"{BASE_URL}/transactions/{transaction_id}")
+            if response.status_code != 404:
+                print(f"❌ Delete through the wrong ledger should be 404, got {response.status_code}")
+                return False
+            response = self.session.delete(f"{BASE_URL}/transactions/{transaction_id}", params=ledger)
+            if response.status_code == 200:
+                print("✅ Transactions can only be deleted through their own ledger")
+            else:
+                print(f"❌ Delete in ledger failed ({response.status_code}): {response.text}")
+                return False
+            
+            response = self.session.get(f"{BASE_URL}/transactions/summary", params={"ledger": "Not A Ledger!"})
+            if response.status_code == 422:
+                print("✅ Invalid ledger names are rejected")
+                return True
+            print(f"❌ Invalid ledger name accepted ({response.status_code})")
+            return False
+        except Exception as e:
+            print(f"❌ Ledger isolation error: {str(e)}")
+            return False
+    
+    def test_idempotency(self):
+        """Test that retried creates with an Idempotency-Key don't duplicate rows"""
+        print("\n🔁 Testing idempotent creation...")
+        
+        params = {"start_date": "2024-02-20", "end_date": "2024-02-20"}
+        row = {"type": "expense", "amount": "42.00", "description": "Idempotency probe", "category": "Idempotency Probe", "date": "2024-02-20"}
+        headers = {"Idempotency-Key": f"probe-{uuid.uuid4()}"}
+        try:
+            before = self.session.get(f"{BASE_URL}/transactions/summary", params=params).json()
+            first = self.session.post(f"{BASE_URL}/transactions", json=row, headers=headers)
+            retry = self.session.post(f"{BASE_URL}/transactions", json=row, headers=headers)
+            if first.status_code != 200 or retry.status_code != 200:
+                print(f"❌ Create with key failed ({first.status_code}, {retry.status_code}): {retry.text}")
+                return False
+            if retry.json()["id"] == first.json()["id"] and retry.headers.get("Idempotent-Replayed") == "true":
+                print("✅ Retry returned the original transaction")
+            else:
+                print(f"❌ Retry created a new transaction: {first.json()} vs {retry.json()}")
+                return False
+            
+            after = self.session.get(f"{BASE_URL}/transactions/summary", params=params).json()
+            if after["transaction_count"] != before["transaction_count"] + 1:
+                print(f"❌ Expected one new transaction, summary went {before} -> {after}")
+                return False
+            
+            response = self.session.post(f"{BASE_URL}/transactions", json={**row, "amount": "43.00"}, headers=headers)
+            if response.status_code == 422:
+                print("✅ Reusing a key with a different body is rejected")
+            else:
+                print(f"❌ Expected 422 for a reused key, got {response.status_code}")
+                return False
+            
+            # A burst of concurrent creates (coalesced when WRITE_COALESCE_MS is set)
+            results = []
+            def create():
+                results.append(requests.post(f"{BASE_URL}/transactions", json=row, timeout=30))
+            threads = [threading.Thread(target=create) for _ in range(20)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            ids = {response.json()["id"] for response in results if response.status_code == 200}
+            if len(ids) == 20:
+                print("✅ 20 concurrent creates all written")
+            else:
+                print(f"❌ Only {len(ids)} of 20 concurrent creates succeeded")
+                return False
+            
+            self.session.post(f"{BASE_URL}/transactions/batch-delete", json={"filter": {"category": "Idempotency Probe"}})
+            return True
+        except Exception as e:
+            print(f"❌ Idempotency error: {str(e)}")
+            return False
+    
+    def test_period_close(self):
+        """Test closing months into snapshots and rejecting writes into them"""
+        print("\n🔒 Testing period close...")
+        
+        ledger = {"ledger": "test-periods"}
+        rows = [
+            {"type": "income", "amount": "100.00", "description": "Period probe", "category": "Period Probe", "date": "2020-01-15"},
+            {"type": "expense", "amount": "30.00", "description": "Period probe", "category": "Period Probe", "date": "2020-02-10"},
+        ]
+        try:
+            self.session.post(f"{BASE_URL}/periods/reopen", params=ledger, json={"start": "2000-01"})
+            ids = [self.session.post(f"{BASE_URL}/transactions", params=ledger, json=row).json()["id"] for row in rows]
+            
+            response = self.session.post(f"{BASE_URL}/periods/close", params=ledger, json={"through": "2020-01"})
+            closed = response.json() if response.status_code == 200 else []
+            if len(closed) == 1 and closed[0]["closing_balance"] == "100.00" and closed[0]["categories"]:
+                print("✅ January closed with its totals and closing balance")
+            else:
+                print(f"❌ Close failed ({response.status_code}): {response.text}")
+                return False
+            
+            summary = self.session.get(
+                f"{BASE_URL}/transactions/summary", params={**ledger, "start_date": "2020-01-01", "end_date": "2020-12-31"}
+            ).json()
+            aggregate = self.session.get(
+                f"{BASE_URL}/transactions/summary",
+                params={**ledger, "start_date": "2020-01-01", "end_date": "2020-12-31", "mode": "aggregate"}
+            ).json()
+            if summary == aggregate and summary["transaction_count"] == 2 and summary["net_profit"] == "70.00":
+                print("✅ Summary combining the snapshot with live rollups matches the raw aggregate")
+            else:
+                print(f"❌ Snapshot summary {summary} != aggregate {aggregate}")
+                return False
+            
+            create = self.session.post(f"{BASE_URL}/transactions", params=ledger, json={**rows[0], "date": "2020-01-20"})
+            delete = self.session.delete(f"{BASE_URL}/transactions/{ids[0]}", params=ledger)
+            if create.status_code == 409 and delete.status_code == 409:
+                print("✅ Writes into a closed period are rejected")
+            else:
+                print(f"❌ Expected 409s for closed-period writes, got {create.status_code} and {delete.status_code}")
+                return False
+            
+            response = self.session.post(f"{BASE_URL}/periods/reopen", params=ledger, json={"start": "2020-01"})
+            if response.status_code == 200 and response.json()["reopened"] == 1:
+                print("✅ Reopened January")
+            else:
+                print(f"❌ Reopen failed ({response.status_code}): {response.text}")
+                return False
+            
+            self.session.post(f"{BASE_URL}/transactions/batch-delete", params=ledger, json={"ids": ids})
+            return True
+        except Exception as e:
+            print(f"❌ Period close error: {str(e)}")
+            return False
+    
+    def test_archival(self):
+        """Test archiving a closed year to Parquet and reading it back transparently"""
+        print("\n🧊 Testing archival...")
+        
+        # Archived years cannot be reopened, so every run uses a fresh ledger
+        ledger = {"ledger": f"test-archive-{uuid.uuid4().hex[:12]}"}
+        rows = [
+            {"type": "income", "amount": "200.00", "description": "Archive probe", "category": "Archive Probe", "date": "2019-03-05"},
+            {"type": "expense", "amount": "50.00", "description": "Archive probe", "category": "Archive Probe", "date": "2019-11-20"},
+            {"type": "expense", "amount": "20.00", "description": "Archive probe", "category": "Archive Probe", "date": "2020-02-01"},
+        ]
+        params = {**ledger, "start_date": "2019-01-01", "end_date": "2020-12-31"}
+        try:
+            for row in rows:
+                self.session.post(f"{BASE_URL}/transactions", params=ledger, json=row)
+            self.session.post(f"{BASE_URL}/periods/close", params=ledger, json={"through": "2019-12"})
+            before = {
+                path: self.session.get(f"{BASE_URL}/{path}", params=params).json()
+                for path in ("transactions/summary", "transactions/by-category", "transactions/chart-data")
+            }
+            
+            response = self.session.post(f"{BASE_URL}/periods/archive", params=ledger, json={"year": 2019})
+            if response.status_code == 200 and response.json()["archived"] == 2:
+                print("✅ Archived the two 2019 transactions")
+            else:
+                print(f"❌ Archive failed ({response.status_code}): {response.text}")
+                return False
+            
+            after = {path: self.session.get(f"{BASE_URL}/{path}", params=params).json() for path in before}
+            aggregate = self.session.get(f"{BASE_URL}/transactions/summary", params={**params, "mode": "aggregate"}).json()
+            if after == before and aggregate == before["transactions/summary"]:
+                print("✅ Summary, categories and chart are unchanged after archiving")
+            else:
+                print(f"❌ Results changed after archiving: {before} -> {after} (aggregate {aggregate})")
+                return False
+            
+            # One row per page walks from MongoDB into the archive through the cursor
+            seen, cursor = [], None
+            while True:
+                page = self.session.get(
+                    f"{BASE_URL}/transactions", params={**params, "limit": 1, **({"cursor": cursor} if cursor else {})}
+                ).json()
+                seen.extend(tx["date"] for tx in page["items"])
+                cursor = page["next_cursor"]
+                if not cursor:
+                    break
+            dashboard = self.session.get(f"{BASE_URL}/dashboard", params=params).json()
+            export = self.session.get(f"{BASE_URL}/transactions/export", params={**params, "format": "ndjson"}).text.splitlines()
+            if (
+                seen == ["2020-02-01", "2019-11-20", "2019-03-05"]
+                and len(dashboard["transactions"]["items"]) == 3
+                and dashboard["summary"] == before["transactions/summary"]
+                and len(export) == 3
+            ):
+                print("✅ Listing, dashboard and export include archived rows")
+            else:
+                print(f"❌ Archived rows missing: pages {seen}, export {len(export)} rows")
+                return False
+            
+            response = self.session.post(f"{BASE_URL}/periods/reopen", params=ledger, json={"start": "2019-06"})
+            if response.status_code == 400:
+                print("✅ Archived months cannot be reopened")
+            else:
+                print(f"❌ Expected 400 reopening an archived month, got {response.status_code}")
+                return False
+            return True
+        except Exception as e:
+            print(f"❌ Archival error: {str(e)}")
+            return False
+    
     def test_delete_transactions(self):
         """Test deleting transactions"""
         print("\n🗑️ Testing transaction deletion...")
@@ -314,7 +1234,7 @@ class BackendTester:
                     # Verify transaction is actually deleted
                     response = self.session.get(f"{BASE_URL}/transactions")
                     if response.status_code == 200:
-                        remaining_transactions = response.json()
+                        remaining_transactions = response.json()['items']
                         if not any(tx['id'] == transaction_id for tx in remaining_transactions):
                             print("✅ Transaction confirmed deleted from database")
                         else:
@@ -349,10 +1269,31 @@ class BackendTester:
         
         test_results = {
             "Root Endpoint": self.test_root_endpoint(),
+            "Health": self.test_health(),
             "Create Transactions": self.test_create_transactions(),
+            "Bulk Ingest": self.test_bulk_ingest(),
             "Get Transactions": self.test_get_transactions(),
+            "Transaction Pagination": self.test_transaction_pagination(),
             "Transaction Summary": self.test_transaction_summary(),
+            "Summary Mode Parity": self.test_summary_mode_parity(),
             "Chart Data": self.test_chart_data(),
+            "Dashboard": self.test_dashboard(),
+            "Cache Revalidation": self.test_cache_revalidation(),
+            "Compact Responses": self.test_compact_responses(),
+            "Live Updates": self.test_live_updates(),
+            "Export": self.test_export(),
+            "Category Breakdown": self.test_category_breakdown(),
+            "Chart Granularity": self.test_chart_granularity(),
+            "Metrics": self.test_metrics(),
+            "Profiling": self.test_profiling(),
+            "Query Plans": self.test_query_plans(),
+            "Analytics": self.test_analytics(),
+            "Search": self.test_search(),
+            "Batch Operations": self.test_batch_operations(),
+            "Ledger Isolation": self.test_ledger_isolation(),
+            "Idempotency": self.test_idempotency(),
+            "Period Close": self.test_period_close(),
+            "Archival": self.test_archival(),
             "Delete Transactions": self.test_delete_transactions()
         }
         
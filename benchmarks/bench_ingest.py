@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Bulk Ingest Benchmark for Balance Sheet App
+Streams synthetic NDJSON and CSV uploads of growing size through
+POST /api/transactions/bulk (in-process, via httpx's ASGI transport) and
+reports rows/s against the 50k rows/s target, plus the worker's RSS before and
+after, which should stay flat whatever the upload size.
+
+Examples:
+    python benchmarks/bench_ingest.py
+    python benchmarks/bench_ingest.py 100000 1000000
+"""
+
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+import httpx
+
+# Point the server module at a scratch database before importing it
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.append(str(BACKEND_DIR))
+os.environ["DB_NAME"] = os.environ.get("BENCH_DB_NAME", "balance_sheet_bench")
+
+import server  # noqa: E402
+
+SIZES = [int(size) for size in (sys.argv[1:] or ["10000", "100000", "1000000"])]
+BATCH_SIZES = [1000, 5000]
+CHUNK_ROWS = 1000
+TARGET_ROWS_PER_SECOND = 50000
+START_DATE = date(2020, 1, 1)
+CATEGORIES = ["Services", "Rent", "Software", "Utilities", "Consulting"]
+
+
+def current_rss_mb():
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def synthetic_rows(count):
+    for _ in range(count):
+        tx_type = random.choice(["income", "expense"])
+        yield (
+            tx_type,
+            f"{random.randrange(500, 500000) / 100:.2f}",
+            f"Synthetic {tx_type}",
+            random.choice(CATEGORIES),
+            (START_DATE + timedelta(days=random.randrange(5 * 365))).isoformat(),
+        )
+
+
+async def upload_body(upload_format, count):
+    """Yield the upload in chunks of CHUNK_ROWS lines, so the client never holds it whole"""
+    if upload_format == "csv":
+        yield b"type,amount,description,category,date\n"
+    lines = []
+    for tx_type, amount, description, category, tx_date in synthetic_rows(count):
+        if upload_format == "csv":
+            lines.append(f"{tx_type},{amount},{description},{category},{tx_date}\n")
+        else:
+            lines.append(
+                f'{{"type":"{tx_type}","amount":"{amount}","description":"{description}",'
+                f'"category":"{category}","date":"{tx_date}"}}\n'
+            )
+        if len(lines) == CHUNK_ROWS:
+            yield "".join(lines).encode()
+            lines = []
+    if lines:
+        yield "".join(lines).encode()
+
+
+async def reset():
+    await server.db.transactions.delete_many({})
+    await server.db.daily_rollups.delete_many({})
+
+
+async def measure(client, upload_format, count, batch_size):
+    """Return (rows/s, rows inserted, RSS growth in MiB) for one upload"""
+    await reset()
+    rss_before = current_rss_mb()
+    started = time.perf_counter()
+    response = await client.post(
+        "/api/transactions/bulk",
+        params={"format": upload_format, "batch_size": batch_size},
+        content=upload_body(upload_format, count),
+    )
+    elapsed = time.perf_counter() - started
+    response.raise_for_status()
+    inserted = response.json()["inserted"]
+    return inserted / elapsed, inserted, current_rss_mb() - rss_before
+
+
+async def main():
+    # httpx's ASGI transport does not run the lifespan, so connect here
+    server.connect()
+    print(f"🔗 Benchmarking bulk ingest against database: {os.environ['DB_NAME']}")
+    print(f"{'rows':>10} {'format':>7} {'batch':>6} {'rows/s':>10} {'RSS +MiB':>9} {'target':>7}")
+    transport = httpx.ASGITransport(app=server.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for size in SIZES:
+                for upload_format in ("ndjson", "csv"):
+                    for batch_size in BATCH_SIZES:
+                        rate, inserted, growth = await measure(client, upload_format, size, batch_size)
+                        verdict = "✅" if rate >= TARGET_ROWS_PER_SECOND and inserted == size else "❌"
+                        print(f"{size:>10} {upload_format:>7} {batch_size:>6} {rate:>10.0f} {growth:>9.1f} {verdict:>7}")
+    finally:
+        await reset()
+        server.client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Money Benchmark for Balance Sheet App
+Compares summing legacy float amounts with summing integer minor units,
+both inside MongoDB ($group/$sum) and in Python (per-row Decimal versus a
+vectorized NumPy int64 sum), reporting throughput in rows per second
+"""
+
+import asyncio
+import os
+import random
+import sys
+import time
+from decimal import Decimal
+from pathlib import Path
+
+import numpy as np
+
+# Point the server module at a scratch database before importing it
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.append(str(BACKEND_DIR))
+os.environ["DB_NAME"] = os.environ.get("BENCH_DB_NAME", "balance_sheet_bench")
+
+import server  # noqa: E402
+
+SIZES = [int(size) for size in (sys.argv[1:] or ["10000", "100000", "1000000"])]
+REPEATS = 3
+BATCH_SIZE = 10000
+
+
+async def seed(count):
+    """Fill the scratch collection with rows carrying both amount encodings"""
+    await server.db.money_bench.delete_many({})
+    for start in range(0, count, BATCH_SIZE):
+        batch = []
+        for _ in range(min(BATCH_SIZE, count - start)):
+            minor = random.randrange(500, 500000)
+            batch.append({"amount": minor / 100, "amount_minor": minor})
+        await server.db.money_bench.insert_many(batch, ordered=False)
+
+
+async def timed(coro_factory):
+    """Return the best wall time in seconds over REPEATS runs"""
+    best = float("inf")
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        await coro_factory()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+async def mongo_sum(field):
+    pipeline = [{"$group": {"_id": None, "total": {"$sum": f"${field}"}}}]
+    return await server.db.money_bench.aggregate(pipeline).to_list(1)
+
+
+async def python_decimal_sum():
+    total = Decimal(0)
+    async for row in server.db.money_bench.find({}, {"amount": 1, "_id": 0}).batch_size(BATCH_SIZE):
+        total += Decimal(str(row["amount"]))
+    return total
+
+
+async def numpy_minor_sum():
+    rows = await server.db.money_bench.find({}, {"amount_minor": 1, "_id": 0}).batch_size(BATCH_SIZE).to_list(None)
+    return int(np.fromiter((row["amount_minor"] for row in rows), dtype=np.int64, count=len(rows)).sum())
+
+
+async def main():
+    server.connect()
+    print(f"🔗 Benchmarking money sums against database: {os.environ['DB_NAME']}")
+    print(f"{'rows':>10} {'path':>24} {'rows/s':>14}")
+    paths = [
+        ("mongo $sum float", lambda: mongo_sum("amount")),
+        ("mongo $sum int64", lambda: mongo_sum("amount_minor")),
+        ("python Decimal per row", python_decimal_sum),
+        ("numpy int64 vector", numpy_minor_sum),
+    ]
+    try:
+        for size in SIZES:
+            await seed(size)
+            for name, factory in paths:
+                seconds = await timed(factory)
+                print(f"{size:>10} {name:>24} {size / seconds:>14,.0f}")
+    finally:
+        await server.db.money_bench.drop()
+        server.client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Serialisation Benchmark for Balance Sheet App
+Compares the legacy read path (ISO-string dates, parse_from_mongo, Transaction
+validation and FastAPI's jsonable_encoder + json.dumps) with the lean path
+(BSON dates, transaction_row and orjson) for a page of documents, in rows/s.
+No database is needed: documents are built in memory as Motor returns them.
+"""
+
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.append(str(BACKEND_DIR))
+# server reads MONGO_URL at import but never connects here, so any URL will do
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "balance_sheet_bench")
+
+import server  # noqa: E402
+
+PAGE_SIZE = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+PAGES = 50
+
+
+def bson_documents(count):
+    """Documents as the lean path reads them: native dates, projected fields"""
+    created_at = datetime.now(timezone.utc).replace(microsecond=0)
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "type": "income" if i % 2 else "expense",
+            "amount_minor": 1000 + i,
+            "description": f"Synthetic transaction {i}",
+            "category": "Services",
+            "date": server.to_mongo_date(date(2024, 1, 1) + timedelta(days=i % 365)),
+            "created_at": created_at,
+        }
+        for i in range(count)
+    ]
+
+
+def legacy_documents(documents):
+    """The same documents as the legacy path stored them: ISO strings and an _id"""
+    return [
+        {
+            **doc,
+            "_id": uuid.uuid4().hex,
+            "date": doc["date"].date().isoformat(),
+            "created_at": doc["created_at"].isoformat(),
+        }
+        for doc in documents
+    ]
+
+
+def legacy_page(documents):
+    parsed = [server.parse_from_mongo(dict(doc)) for doc in documents]
+    page = server.TransactionPage(items=[server.Transaction(**doc) for doc in parsed], next_cursor=None)
+    return json.dumps(jsonable_encoder(page)).encode()
+
+
+def lean_page(documents):
+    return orjson.dumps({"items": [server.transaction_row(doc) for doc in documents], "next_cursor": None})
+
+
+def rows_per_second(render, documents):
+    started = time.perf_counter()
+    for _ in range(PAGES):
+        render(documents)
+    return PAGES * len(documents) / (time.perf_counter() - started)
+
+
+def main():
+    documents = bson_documents(PAGE_SIZE)
+    legacy = legacy_documents(documents)
+
+    legacy_rate = rows_per_second(legacy_page, legacy)
+    lean_rate = rows_per_second(lean_page, documents)
+
+    print(f"📄 Page size: {PAGE_SIZE} rows, {PAGES} pages per path")
+    print(f"{'legacy path':>14} {legacy_rate:>14,.0f} rows/s")
+    print(f"{'lean path':>14} {lean_rate:>14,.0f} rows/s")
+    print(f"{'speed-up':>14} {lean_rate / legacy_rate:>14.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Summary Benchmark for Balance Sheet App
+Compares the daily-rollup, $match/$group aggregation and Python scan summaries
+across growing collection sizes, reporting latency and peak Python memory
+"""
+
+import asyncio
+import os
+import random
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+# Point the server module at a scratch database before importing it
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.append(str(BACKEND_DIR))
+os.environ["DB_NAME"] = os.environ.get("BENCH_DB_NAME", "balance_sheet_bench")
+
+import server  # noqa: E402
+
+SIZES = [int(size) for size in (sys.argv[1:] or ["1000", "10000", "100000"])]
+REPEATS = 5
+BATCH_SIZE = 10000
+START_DATE = date(2020, 1, 1)
+
+
+def synthetic_transactions(count):
+    """Yield realistic-looking transactions spread over five years"""
+    for _ in range(count):
+        tx_type = random.choice(["income", "expense"])
+        yield {
+            "id": str(uuid.uuid4()),
+            "type": tx_type,
+            "amount_minor": random.randrange(500, 500000),
+            "description": f"Synthetic {tx_type}",
+            "category": random.choice(["Services", "Rent", "Software", "Utilities", "Consulting"]),
+            "date": server.to_mongo_date(START_DATE + timedelta(days=random.randrange(5 * 365))),
+            "created_at": datetime.now(timezone.utc),
+        }
+
+
+async def seed(count):
+    """Reset the scratch collection and fill it with `count` transactions"""
+    await server.db.transactions.delete_many({})
+    batch = []
+    for tx in synthetic_transactions(count):
+        batch.append(tx)
+        if len(batch) == BATCH_SIZE:
+            await server.db.transactions.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await server.db.transactions.insert_many(batch, ordered=False)
+    await server.rebuild_daily_rollups()
+
+
+async def measure(mode):
+    """Return (median latency in ms, peak traced memory in MiB) for a summary mode"""
+    latencies = []
+    peak = 0
+    for _ in range(REPEATS):
+        tracemalloc.start()
+        started = time.perf_counter()
+        await server.compute_transaction_summary(server.DEFAULT_LEDGER, None, None, mode)
+        latencies.append((time.perf_counter() - started) * 1000)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    latencies.sort()
+    return latencies[len(latencies) // 2], peak / (1024 * 1024)
+
+
+async def main():
+    server.connect()
+    print(f"🔗 Benchmarking summary against database: {os.environ['DB_NAME']}")
+    print(f"{'rows':>10} {'mode':>10} {'p50 ms':>10} {'peak MiB':>10}")
+    try:
+        for size in SIZES:
+            await seed(size)
+            for mode in server.SummaryMode:
+                latency, memory = await measure(mode)
+                print(f"{size:>10} {mode.value:>10} {latency:>10.1f} {memory:>10.2f}")
+    finally:
+        await server.db.transactions.delete_many({})
+        await server.db.daily_rollups.delete_many({})
+        server.client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
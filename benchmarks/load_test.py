@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Load Test Suite for Balance Sheet App
+Seeds a scratch database with synthetic transactions at several sizes, drives
+the endpoints exercised by backend_test.py with concurrent clients and
+reports p50/p95/p99 latency, throughput and worker RSS per dataset size.
+Results are written as JSON so runs can be compared between commits.
+
+GET /stream is the one endpoint left out: httpx's ASGI transport only returns
+once the app has finished the response, which an event stream never does.
+Closing and reopening periods is also left out, since closed months would
+turn the write scenarios into 409s.
+
+The app runs in-process behind httpx's ASGI transport, so the RSS reported
+is the worker's own. Use --store mongomock to run without a mongod (needs
+the optional mongomock-motor package; aggregation coverage is partial).
+
+Examples:
+    python benchmarks/load_test.py --sizes 10000
+    python benchmarks/load_test.py --sizes 10000,1000000,10000000 --concurrency 32
+    python benchmarks/load_test.py --sizes 10000 --write-coalesce-ms 5
+    python benchmarks/load_test.py --compare benchmarks/results/<previous>.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+sys.path.append(str(BACKEND_DIR))
+
+START_DATE = date(2015, 1, 1)
+DAYS = 10 * 365
+SEED_BATCH_SIZE = 10000
+CATEGORIES = ["Services", "Rent", "Software", "Utilities", "Consulting", "Sales", "Shipping"]
+BULK_ROWS = 1000
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Balance Sheet load test")
+    parser.add_argument("--sizes", default="10000,1000000,10000000", help="comma separated dataset sizes")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients per scenario")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--store", choices=["mongod", "mongomock"], default="mongod")
+    parser.add_argument("--db-name", default=os.environ.get("BENCH_DB_NAME", "balance_sheet_load"))
+    parser.add_argument("--no-cache", action="store_true", help="disable the response cache")
+    parser.add_argument("--write-coalesce-ms", type=float, default=0, help="coalesce concurrent creates over this window")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="previous results file to diff against")
+    return parser.parse_args()
+
+
+def load_server(args):
+    """Import the app against the scratch database chosen on the command line"""
+    os.environ["DB_NAME"] = args.db_name
+    if args.no_cache:
+        os.environ["RESPONSE_CACHE_TTL"] = "0"
+    os.environ["WRITE_COALESCE_MS"] = str(args.write_coalesce_ms)
+    if args.store == "mongomock":
+        os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+
+    import server
+
+    if args.store == "mongomock":
+        from mongomock_motor import AsyncMongoMockClient
+
+        server.client = AsyncMongoMockClient(tz_aware=True)
+        server.db = server.analytics_db = server.client[args.db_name]
+    else:
+        # httpx's ASGI transport does not run the lifespan, so connect here
+        server.connect()
+    return server
+
+
+def current_rss_mb():
+    """Resident set size of this process, falling back to the peak on non-Linux hosts"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def random_day():
+    return START_DATE + timedelta(days=random.randrange(DAYS))
+
+
+def random_range(days):
+    start = random_day()
+    return {"start_date": start.isoformat(), "end_date": (start + timedelta(days=days)).isoformat()}
+
+
+async def seed(server, count):
+    """Reset the scratch collections and fill them with `count` transactions"""
+    await server.db.transactions.delete_many({})
+    await server.db.daily_rollups.delete_many({})
+    await server.db.idempotency_keys.delete_many({})
+    created_at = datetime.now(timezone.utc)
+    for start in range(0, count, SEED_BATCH_SIZE):
+        batch = []
+        for _ in range(min(SEED_BATCH_SIZE, count - start)):
+            tx_type = random.choice(["income", "expense"])
+            batch.append({
+                "id": str(uuid.uuid4()),
+                "type": tx_type,
+                "amount_minor": random.randrange(500, 500000),
+                "description": f"Synthetic {tx_type}",
+                "category": random.choice(CATEGORIES),
+                "date": server.to_mongo_date(random_day()),
+                "created_at": created_at,
+            })
+        await server.db.transactions.insert_many(batch, ordered=False)
+    await server.ensure_indexes()
+    await server.ensure_idempotency_indexes()
+    await server.rebuild_daily_rollups()
+
+
+def scenarios():
+    """(name, coroutine factory) pairs covering the endpoints in backend_test.py"""
+    async def get(client, path, params=None):
+        return await client.get(path, params=params)
+
+    async def create(client, headers=None, day=None):
+        return await client.post("/api/transactions", headers=headers, json={
+            "type": "expense",
+            "amount": "9.99",
+            "description": "Load test burst",
+            "category": "Load Test",
+            "date": (day or random_day()).isoformat(),
+        })
+
+    async def create_and_delete(client):
+        response = await client.post("/api/transactions", json={
+            "type": random.choice(["income", "expense"]),
+            "amount": "123.45",
+            "description": "Load test write",
+            "category": random.choice(CATEGORIES),
+            "date": random_day().isoformat(),
+        })
+        response.raise_for_status()
+        return await client.delete(f"/api/transactions/{response.json()['id']}")
+
+    async def create_and_batch_delete(client):
+        ids = []
+        for _ in range(2):
+            response = await create(client)
+            response.raise_for_status()
+            ids.append(response.json()["id"])
+        return await client.post("/api/transactions/batch-delete", json={"ids": ids})
+
+    async def batch_update_day(client):
+        # Recategorising one day's rows leaves the dataset's shape unchanged
+        day = random_day().isoformat()
+        return await client.patch("/api/transactions/bulk", json={
+            "filter": {"start_date": day, "end_date": day},
+            "category": random.choice(CATEGORIES),
+        })
+
+    async def bulk_ingest(client):
+        # One NDJSON upload of BULK_ROWS rows; rows/s is throughput_rps * BULK_ROWS
+        body = "".join(
+            json.dumps({
+                "type": random.choice(["income", "expense"]),
+                "amount": f"{random.randrange(500, 500000) / 100:.2f}",
+                "description": "Load test import",
+                "category": random.choice(CATEGORIES),
+                "date": random_day().isoformat(),
+            }) + "\n"
+            for _ in range(BULK_ROWS)
+        )
+        return await client.post("/api/transactions/bulk", params={"format": "ndjson"}, content=body)
+
+    return [
+        ("root", lambda c: get(c, "/api/")),
+        ("transactions_first_page", lambda c: get(c, "/api/transactions", {"limit": 100})),
+        ("transactions_month", lambda c: get(c, "/api/transactions", {**random_range(30), "limit": 100})),
+        ("transactions_by_type", lambda c: get(c, "/api/transactions", {"transaction_type": "income", "limit": 100})),
+        ("summary_all", lambda c: get(c, "/api/transactions/summary")),
+        ("summary_year", lambda c: get(c, "/api/transactions/summary", random_range(365))),
+        ("summary_aggregate_month", lambda c: get(c, "/api/transactions/summary", {**random_range(30), "mode": "aggregate"})),
+        ("chart_data_year", lambda c: get(c, "/api/transactions/chart-data", random_range(365))),
+        ("chart_data_year_columnar", lambda c: get(c, "/api/transactions/chart-data", {**random_range(365), "format": "columnar"})),
+        ("chart_data_year_arrow", lambda c: get(c, "/api/transactions/chart-data", {**random_range(365), "format": "arrow"})),
+        ("analytics_periods_year", lambda c: get(c, "/api/analytics/period-comparison", random_range(365))),
+        ("analytics_rolling_year", lambda c: get(c, "/api/analytics/rolling", {**random_range(365), "window": 30})),
+        ("analytics_projection", lambda c: get(c, "/api/analytics/projection", {"history_days": 365, "days": 90})),
+        ("dashboard_month", lambda c: get(c, "/api/dashboard", {**random_range(30), "limit": 100})),
+        ("by_category_year", lambda c: get(c, "/api/transactions/by-category", random_range(365))),
+        ("search_text", lambda c: get(c, "/api/transactions", {"q": "synthetic", "limit": 100})),
+        ("suggest", lambda c: get(c, "/api/transactions/suggest", {"prefix": random.choice(["s", "sy", "synth"])})),
+        ("periods", lambda c: get(c, "/api/periods")),
+        ("export_day", lambda c: get(c, "/api/transactions/export", {**random_range(0), "format": "ndjson"})),
+        ("create_and_delete", create_and_delete),
+        ("create_and_batch_delete", create_and_batch_delete),
+        ("batch_update_day", batch_update_day),
+        ("create_burst", create),
+        # Every request replays one key, as a client retrying a timed-out create would
+        ("create_idempotent_retry", lambda c: create(c, {"Idempotency-Key": "load-test-retry"}, START_DATE)),
+        # Last, since every request grows the dataset by BULK_ROWS
+        ("bulk_ingest_1k", bulk_ingest),
+    ]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run_scenario(client, factory, total_requests, concurrency):
+    latencies = []
+    errors = 0
+    peak_rss = current_rss_mb()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        nonlocal errors, peak_rss
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await factory(client)
+                if response.status_code >= 400:
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+            peak_rss = max(peak_rss, current_rss_mb())
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total_requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": total_requests,
+        "errors": errors,
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "throughput_rps": total_requests / elapsed,
+        "peak_rss_mb": peak_rss,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_comparison(current, previous):
+    print(f"\n📊 Comparison with {previous['commit']} (p95 ms, negative is faster)")
+    for size, scenario_results in current["results"].items():
+        for name, result in scenario_results.items():
+            before = previous["results"].get(size, {}).get(name)
+            if not before or before["p95_ms"] is None or result["p95_ms"] is None:
+                continue
+            change = (result["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100
+            print(f"{size:>10} {name:<26} {before['p95_ms']:>9.1f} → {result['p95_ms']:>9.1f} ({change:+.0f}%)")
+
+
+async def main():
+    args = parse_args()
+    server = load_server(args)
+    sizes = [int(size) for size in args.sizes.split(",")]
+    commit = git_commit()
+
+    print(f"🚀 Load testing commit {commit} against {args.store} database {args.db_name}")
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "sizes": sizes,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "store": args.store,
+            "response_cache": not args.no_cache,
+        },
+        "results": {},
+    }
+
+    transport = httpx.ASGITransport(app=server.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://load-test") as client:
+            for size in sizes:
+                print(f"\n🌱 Seeding {size:,} transactions...")
+                await seed(server, size)
+                print(f"{'scenario':<26} {'p50':>8} {'p95':>8} {'p99':>8} {'req/s':>10} {'RSS MB':>8} {'errors':>7}")
+                size_results = report["results"][str(size)] = {}
+                for name, factory in scenarios():
+                    result = await run_scenario(client, factory, args.requests, args.concurrency)
+                    size_results[name] = result
+                    print(
+                        f"{name:<26} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f} "
+                        f"{result['throughput_rps']:>10.1f} {result['peak_rss_mb']:>8.1f} {result['errors']:>7}"
+                    )
+    finally:
+        await server.db.transactions.delete_many({})
+        await server.db.daily_rollups.delete_many({})
+        await server.db.idempotency_keys.delete_many({})
+        server.client.close()
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\n💾 Results saved to {output}")
+
+    if args.compare:
+        print_comparison(report, json.loads(Path(args.compare).read_text()))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from "react";
+import React, { useState, useEffect, useRef } from "react";
 import "./App.css";
 import axios from "axios";
 import { format } from "date-fns";
@@ -9,6 +9,91 @@ import { LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, Legend, Responsi
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
+// The API sends money as exact decimal strings; the UI works with numbers
+const normalizeTransaction = (tx) => ({ ...tx, amount: Number(tx.amount) });
+
+const normalizeSummary = (summary) => ({
+  ...summary,
+  total_income: Number(summary.total_income),
+  total_expenses: Number(summary.total_expenses),
+  net_profit: Number(summary.net_profit)
+});
+
+// Columnar charts carry a base date, day offsets and integer minor units
+const DAY_MS = 24 * 60 * 60 * 1000;
+
+const expandColumnarChart = (chartData) => {
+  const base = chartData.base_date ? Date.parse(chartData.base_date) : 0;
+  return {
+    labels: chartData.offsets.map((offset) => new Date(base + offset * DAY_MS).toISOString().slice(0, 10)),
+    income: chartData.income_minor.map((value) => value / 100),
+    expenses: chartData.expense_minor.map((value) => value / 100),
+    net_profit: chartData.income_minor.map((value, index) => (value - chartData.expense_minor[index]) / 100)
+  };
+};
+
+const normalizeChartData = (chartData) => chartData.offsets ? expandColumnarChart(chartData) : ({
+  ...chartData,
+  income: chartData.income.map(Number),
+  expenses: chartData.expenses.map(Number),
+  net_profit: chartData.net_profit.map(Number)
+});
+
+// Live updates from /api/stream patch the dashboard in place. Each message
+// carries inserted rows, deleted ids and per-day deltas; `resync` means the
+// batch was too large (or we fell behind) and the range must be refetched.
+const roundCents = (value) => Math.round(value * 100) / 100;
+
+const inDateRange = (day, startDate, endDate) =>
+  (!startDate || day >= startDate) && (!endDate || day <= endDate);
+
+const patchTransactions = (transactions, message, startDate, endDate) => {
+  const removed = new Set(message.deleted);
+  const known = new Set(transactions.map((tx) => tx.id));
+  const added = message.inserted
+    .filter((tx) => !known.has(tx.id) && inDateRange(tx.date, startDate, endDate))
+    .map(normalizeTransaction);
+  return [...added, ...transactions.filter((tx) => !removed.has(tx.id))].sort((a, b) =>
+    b.date.localeCompare(a.date) || String(b.created_at).localeCompare(String(a.created_at))
+  );
+};
+
+const patchSummary = (summary, days) => {
+  const income = days.reduce((sum, day) => sum + Number(day.income), 0);
+  const expenses = days.reduce((sum, day) => sum + Number(day.expenses), 0);
+  const count = days.reduce((sum, day) => sum + day.count, 0);
+  const totalIncome = roundCents((summary.total_income || 0) + income);
+  const totalExpenses = roundCents((summary.total_expenses || 0) + expenses);
+  return {
+    ...summary,
+    total_income: totalIncome,
+    total_expenses: totalExpenses,
+    net_profit: roundCents(totalIncome - totalExpenses),
+    transaction_count: (summary.transaction_count || 0) + count
+  };
+};
+
+const patchChartData = (chartData, days) => {
+  const rows = new Map((chartData.labels || []).map((label, index) => [
+    label, { income: chartData.income[index], expenses: chartData.expenses[index] }
+  ]));
+  days.forEach((day) => {
+    const row = rows.get(day.date) || { income: 0, expenses: 0 };
+    rows.set(day.date, {
+      income: roundCents(row.income + Number(day.income)),
+      expenses: roundCents(row.expenses + Number(day.expenses))
+    });
+  });
+  const labels = [...rows.keys()].filter((label) => rows.get(label).income || rows.get(label).expenses).sort();
+  return {
+    ...chartData,
+    labels,
+    income: labels.map((label) => rows.get(label).income),
+    expenses: labels.map((label) => rows.get(label).expenses),
+    net_profit: labels.map((label) => roundCents(rows.get(label).income - rows.get(label).expenses))
+  };
+};
+
 // Pagination Component
 const Pagination = ({ currentPage, totalPages, onPageChange }) => {
   const getPageNumbers = () => {
@@ -470,6 +555,19 @@ const InteractiveCharts = ({ chartData, summary }) => {
   );
 };
 
+// crypto.randomUUID only exists in secure contexts (HTTPS or localhost);
+// getRandomValues is available everywhere, so build a v4 UUID from it
+const newIdempotencyKey = () => {
+  if (window.crypto.randomUUID) return window.crypto.randomUUID();
+  const bytes = window.crypto.getRandomValues(new Uint8Array(16));
+  bytes[6] = (bytes[6] & 0x0f) | 0x40;
+  bytes[8] = (bytes[8] & 0x3f) | 0x80;
+  const hex = Array.from(bytes, (byte) => byte.toString(16).padStart(2, '0')).join('');
+  return `${hex.slice(0, 8)}-${hex.slice(8, 12)}-${hex.slice(12, 16)}-${hex.slice(16, 20)}-${hex.slice(20)}`;
+};
+
+const SUGGEST_DEBOUNCE_MS = 150;
+
 const TransactionForm = ({ onTransactionAdded }) => {
   const [formData, setFormData] = useState({
     type: 'income',
@@ -479,18 +577,45 @@ const TransactionForm = ({ onTransactionAdded }) => {
     date: format(new Date(), 'yyyy-MM-dd')
   });
   const [isSubmitting, setIsSubmitting] = useState(false);
+  const [suggestions, setSuggestions] = useState({ categories: [], descriptions: [] });
+  // Kept across retries of a submission that got no response, so the
+  // server can recognise the retry instead of creating a duplicate
+  const [idempotencyKey, setIdempotencyKey] = useState(null);
+
+  // Autocomplete from the server's prefix index once typing pauses; replies
+  // for a prefix that is no longer the latest one are dropped
+  const suggestTimer = useRef(null);
+  const latestPrefix = useRef('');
+
+  useEffect(() => () => clearTimeout(suggestTimer.current), []);
+
+  const updateField = (field, value) => {
+    setFormData((current) => ({ ...current, [field]: value }));
+    latestPrefix.current = value;
+    clearTimeout(suggestTimer.current);
+    if (!value.trim()) return;
+    suggestTimer.current = setTimeout(async () => {
+      try {
+        const response = await axios.get(`${API}/transactions/suggest`, { params: { prefix: value } });
+        if (latestPrefix.current === value) setSuggestions(response.data);
+      } catch (error) {
+        console.error('Error fetching suggestions:', error);
+      }
+    }, SUGGEST_DEBOUNCE_MS);
+  };
 
   const handleSubmit = async (e) => {
     e.preventDefault();
     setIsSubmitting(true);
     
     try {
-      const submitData = {
-        ...formData,
-        amount: parseFloat(formData.amount)
-      };
+      // Send the amount as typed so the backend receives the exact decimal
+      const submitData = { ...formData };
+      const key = idempotencyKey || newIdempotencyKey();
+      setIdempotencyKey(key);
       
-      await axios.post(`${API}/transactions`, submitData);
+      await axios.post(`${API}/transactions`, submitData, { headers: { 'Idempotency-Key': key } });
+      setIdempotencyKey(null);
       
       // Reset form
       setFormData({
@@ -504,6 +629,7 @@ const TransactionForm = ({ onTransactionAdded }) => {
       onTransactionAdded();
     } catch (error) {
       console.error('Error adding transaction:', error);
+      if (error.response) setIdempotencyKey(null);
       alert('Error adding transaction. Please try again.');
     }
     
@@ -582,11 +708,15 @@ const TransactionForm = ({ onTransactionAdded }) => {
           <input
             type="text"
             value={formData.description}
-            onChange={(e) => setFormData({ ...formData, description: e.target.value })}
+            onChange={(e) => updateField('description', e.target.value)}
+            list="description-suggestions"
             className="w-full p-3 border border-gray-300 rounded-lg focus:ring-2 focus:ring-blue-500 focus:border-transparent"
             placeholder="Enter description"
             required
           />
+          <datalist id="description-suggestions">
+            {suggestions.descriptions.map((item) => <option key={item.value} value={item.value} />)}
+          </datalist>
         </div>
 
         <div>
@@ -596,10 +726,14 @@ const TransactionForm = ({ onTransactionAdded }) => {
           <input
             type="text"
             value={formData.category}
-            onChange={(e) => setFormData({ ...formData, category: e.target.value })}
+            onChange={(e) => updateField('category', e.target.value)}
+            list="category-suggestions"
             className="w-full p-3 border border-gray-300 rounded-lg focus:ring-2 focus:ring-blue-500 focus:border-transparent"
             placeholder="Enter category"
           />
+          <datalist id="category-suggestions">
+            {suggestions.categories.map((item) => <option key={item.value} value={item.value} />)}
+          </datalist>
         </div>
 
         <button
@@ -658,7 +792,7 @@ const SummaryCards = ({ summary }) => {
 };
 
 // Transaction List Component with Pagination
-const TransactionList = ({ transactions, onDelete, currentPage, onPageChange }) => {
+const TransactionList = ({ transactions, onDelete, currentPage, onPageChange, hasMore, loadingMore, onLoadMore }) => {
   const TRANSACTIONS_PER_PAGE = 20;
   const totalPages = Math.ceil(transactions.length / TRANSACTIONS_PER_PAGE);
   
@@ -672,7 +806,7 @@ const TransactionList = ({ transactions, onDelete, currentPage, onPageChange })
       <div className="flex items-center justify-between mb-4">
         <h2 className="text-2xl font-bold text-gray-800">Transaction History</h2>
         <div className="text-sm text-gray-600">
-          Showing {startIndex + 1}-{Math.min(endIndex, transactions.length)} of {transactions.length} transactions
+          Showing {startIndex + 1}-{Math.min(endIndex, transactions.length)} of {transactions.length}{hasMore ? '+' : ''} transactions
         </div>
       </div>
       
@@ -749,6 +883,19 @@ const TransactionList = ({ transactions, onDelete, currentPage, onPageChange })
             totalPages={totalPages}
             onPageChange={onPageChange}
           />
+
+          {/* Older pages are fetched from the server only when asked for */}
+          {hasMore && (
+            <div className="flex justify-center mt-4">
+              <button
+                onClick={onLoadMore}
+                disabled={loadingMore}
+                className="px-4 py-2 rounded-lg border border-gray-300 text-gray-700 hover:bg-gray-50 disabled:opacity-50 disabled:cursor-not-allowed"
+              >
+                {loadingMore ? 'Loading...' : 'Load more transactions'}
+              </button>
+            </div>
+          )}
         </>
       )}
     </div>
@@ -757,6 +904,9 @@ const TransactionList = ({ transactions, onDelete, currentPage, onPageChange })
 
 // Transaction Form Component
 
+// Rows per dashboard or "load more" request
+const TRANSACTIONS_PAGE_SIZE = 100;
+
 // Main App Component
 function App() {
   const [transactions, setTransactions] = useState([]);
@@ -766,47 +916,55 @@ function App() {
   const [startDate, setStartDate] = useState('');
   const [endDate, setEndDate] = useState('');
   const [loading, setLoading] = useState(true);
+  const [liveUpdates, setLiveUpdates] = useState(false);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
-  const fetchTransactions = async () => {
+  const fetchDashboard = async () => {
     try {
       const params = new URLSearchParams();
       if (startDate) params.append('start_date', startDate);
       if (endDate) params.append('end_date', endDate);
+      params.append('limit', String(TRANSACTIONS_PAGE_SIZE));
+      params.append('chart_format', 'columnar');
       
-      const response = await axios.get(`${API}/transactions?${params}`);
-      setTransactions(response.data);
+      // First page, summary and chart come back from a single request
+      const response = await axios.get(`${API}/dashboard?${params}`);
+      setSummary(normalizeSummary(response.data.summary));
+      setChartData(normalizeChartData(response.data.chart));
+      
+      // Only the first page; later pages load on demand from the cursor
+      setTransactions(response.data.transactions.items.map(normalizeTransaction));
+      setNextCursor(response.data.transactions.next_cursor);
       
       // Reset to first page when data changes
       setCurrentPage(1);
     } catch (error) {
-      console.error('Error fetching transactions:', error);
-    }
-  };
-
-  const fetchSummary = async () => {
-    try {
-      const params = new URLSearchParams();
-      if (startDate) params.append('start_date', startDate);
-      if (endDate) params.append('end_date', endDate);
-      
-      const response = await axios.get(`${API}/transactions/summary?${params}`);
-      setSummary(response.data);
-    } catch (error) {
-      console.error('Error fetching summary:', error);
+      console.error('Error fetching dashboard:', error);
     }
   };
 
-  const fetchChartData = async () => {
+  const loadMoreTransactions = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
     try {
       const params = new URLSearchParams();
       if (startDate) params.append('start_date', startDate);
       if (endDate) params.append('end_date', endDate);
+      params.append('limit', String(TRANSACTIONS_PAGE_SIZE));
+      params.append('cursor', nextCursor);
       
-      const response = await axios.get(`${API}/transactions/chart-data?${params}`);
-      setChartData(response.data);
+      const response = await axios.get(`${API}/transactions?${params}`);
+      // Live inserts can shift rows across the page boundary, so skip ids already shown
+      setTransactions((current) => {
+        const known = new Set(current.map((tx) => tx.id));
+        return [...current, ...response.data.items.map(normalizeTransaction).filter((tx) => !known.has(tx.id))];
+      });
+      setNextCursor(response.data.next_cursor);
     } catch (error) {
-      console.error('Error fetching chart data:', error);
+      console.error('Error loading more transactions:', error);
     }
+    setLoadingMore(false);
   };
 
   const handleDateChange = (type, value) => {
@@ -824,7 +982,8 @@ function App() {
     if (window.confirm('⚠️ Are you sure you want to permanently delete this transaction? This action cannot be undone.')) {
       try {
         await axios.delete(`${API}/transactions/${transactionId}`);
-        fetchData();
+        // With live updates on, the stream removes the row
+        if (!liveUpdates) fetchData();
       } catch (error) {
         console.error('Error deleting transaction:', error);
         alert('Error deleting transaction. Please try again.');
@@ -843,7 +1002,7 @@ function App() {
 
   const fetchData = async () => {
     setLoading(true);
-    await Promise.all([fetchTransactions(), fetchSummary(), fetchChartData()]);
+    await fetchDashboard();
     setLoading(false);
   };
 
@@ -851,6 +1010,37 @@ function App() {
     fetchData();
   }, [startDate, endDate]);
 
+  useEffect(() => {
+    const source = new EventSource(`${API}/stream`);
+    let interrupted = false;
+    
+    source.onopen = () => {
+      setLiveUpdates(true);
+      // Events sent while we were disconnected are lost, so reload once
+      if (interrupted) fetchDashboard();
+      interrupted = false;
+    };
+    source.onerror = () => {
+      setLiveUpdates(false);
+      interrupted = true;
+    };
+    source.addEventListener('changes', (event) => {
+      const message = JSON.parse(event.data);
+      if (message.resync) {
+        fetchDashboard();
+        return;
+      }
+      const days = message.days.filter((day) => inDateRange(day.date, startDate, endDate));
+      setTransactions((current) => patchTransactions(current, message, startDate, endDate));
+      setChartData((current) => patchChartData(current, days));
+      setSummary((current) =>
+        !startDate && !endDate && message.totals ? normalizeSummary(message.totals) : patchSummary(current, days)
+      );
+    });
+    
+    return () => source.close();
+  }, [startDate, endDate]);
+
   if (loading) {
     return (
       <div className="min-h-screen bg-gray-100 flex items-center justify-center">
@@ -944,7 +1134,7 @@ function App() {
         </div>
 
         {/* Transaction Form */}
-        <TransactionForm onTransactionAdded={fetchData} />
+        <TransactionForm onTransactionAdded={liveUpdates ? () => {} : fetchData} />
 
         {/* Transaction List with Pagination */}
         <div className="transaction-list-container">
@@ -953,6 +1143,9 @@ function App() {
             onDelete={handleDeleteTransaction}
             currentPage={currentPage}
             onPageChange={handlePageChange}
+            hasMore={Boolean(nextCursor)}
+            loadingMore={loadingMore}
+            onLoadMore={loadMoreTransactions}
           />
         </div>
       </div>